@@ -0,0 +1,114 @@
+# this file runs the server, the monitor and the websites of all teams in a single process
+# the answers travel through a queue in memory instead of RabbitMQ, so no broker has to run
+#
+# run with `python -m src.allinone <number of teams>`, everything is served on one port:
+# - /team/<number>  the answer websites of the teams, the index page links to all of them
+# - /admin          the admin website of the server
+# - /monitor        the monitor
+# with several rooms, the websites of every room are served under /room/<room>, e.g. /room/blue/admin
+#
+# options:
+# -b                rebuild the database
+# -r                reset the game state
+# -w                continue the game where the journal ends, see src.db.journal
+# -x <transport>    'local' (default) or 'rabbitmq' to send the answers through RabbitMQ anyway
+# --port <port>     the port, defaults to 8000
+# --rooms <rooms>   comma separated rooms, each with its own game and the given number of teams
+#
+# set DATABASE_URL=sqlite:///game.db to use an embedded database instead of postgres
+
+import sys
+import uvicorn
+import gradio as gr
+from threading import Thread
+from fastapi import FastAPI
+
+from src.db.build import build
+from src.db.journal import open_journal
+from src.server import server
+from src.monitor import monitor
+from src.monitor.clips import start_prefetching
+from src.client.hub import build_hub, add_room_index
+from src.rooms.rooms import DEFAULT_ROOM, parse_rooms, room_queue, room_path
+from src.transport.transport import get_transport
+from src.metrics.metrics import start_metrics_server
+
+ALLINONE_PORT = 8000
+
+def build_allinone(n_teams, transport, resume=False, rooms=(DEFAULT_ROOM,)) -> FastAPI:
+    """
+    Build one web app with the team websites, the admin website and the monitor of every room,
+    and start a consumer of the server per room on the given transport.
+    - n_teams: the number of teams per room
+    - transport: the transport the answers are sent with, see src.transport.transport
+    - resume: if True, the admin websites continue with the current video of their game
+    - rooms: the rooms, the websites of a room are served under `room_path(room, rooms)`
+    """
+    app = FastAPI()
+
+    if len(rooms) > 1:
+        add_room_index(app, rooms)
+
+    for room in rooms:
+        path = room_path(room, rooms)
+
+        publisher = transport.publisher(queue=room_queue(room))
+        publisher.connect()
+
+        # the teams are created by the hub, so it is built first
+        app = build_hub(n_teams, publisher, room, app, path)
+
+        admin = server.build_admin_app(n_teams, resume=resume, room=room)
+        app = gr.mount_gradio_app(app, admin, path=f'{path}/admin', auth=server.AUTH_CREDENTIALS if server.USE_AUTH else None)
+
+        app = monitor.add_monitor_routes(app, monitor.build_monitor_app(room=room), path=f'{path}/monitor')
+
+        Thread(target=server.consume_messages, kwargs={'connect': transport.connect, 'room': room}, daemon=True).start()
+
+    return app
+
+if __name__ == '__main__':
+
+    # get launch arguments
+    arguments = sys.argv[1:]
+
+    if len(arguments) < 1:
+        print('Usage: python -m src.allinone <number of teams> [-b] [-r] [-w] [-x local|rabbitmq] [--port <port>] [--rooms <room,room,...>]')
+        sys.exit(1)
+
+    n_teams = int(arguments[0])
+    transport = get_transport(arguments[arguments.index('-x') + 1] if '-x' in arguments else 'local')
+    port = int(arguments[arguments.index('--port') + 1]) if '--port' in arguments else ALLINONE_PORT
+    rooms = parse_rooms(arguments[arguments.index('--rooms') + 1]) if '--rooms' in arguments else [DEFAULT_ROOM]
+
+    if '-b' in arguments:
+        build(verbose=True)
+
+    for room in rooms:
+        # every game event is appended to the journal of its room
+        open_journal(room=room)
+
+        if '-r' in arguments:
+            server.reset_game(room)
+
+        if '-w' in arguments:
+            server.warm_restart(room)
+
+        server.journal_known_teams(room)
+
+    app = build_allinone(n_teams, transport, resume='-w' in arguments, rooms=rooms)
+
+    # keep the current and the next clip in the page cache
+    start_prefetching(rooms)
+
+    start_metrics_server('server')
+
+    print("==============")
+    print(f'Teams: {n_teams}')
+    print(f'Transport: {transport.name}')
+    print(f'Rooms: {", ".join(rooms)}')
+    prefix = '/room/<room>' if len(rooms) > 1 else ''
+    print(f'Port: {port} ({prefix}/team/1 - {prefix}/team/{n_teams}, {prefix}/admin, {prefix}/monitor)')
+    print("==============")
+
+    uvicorn.run(app, host='0.0.0.0', port=port)
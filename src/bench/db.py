@@ -0,0 +1,75 @@
+# this file measures how many state queries per second the database helpers can serve,
+# once with a new engine per call (the old connect_db behaviour) and once with the pooled engine
+#
+# run with `python -m src.bench.db [seconds per mode]` against the docker-compose database
+
+import sys
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.db.model import State
+from src.db.build import database_url, session_scope
+
+DEFAULT_DURATION = 5    # seconds each mode is measured
+
+def query_unpooled():
+    """
+    Read the phase like the helpers did before: new engine, one query, dispose.
+    """
+    engine = create_engine(database_url())
+    session = sessionmaker(bind=engine)()
+
+    phase = session.query(State).first().phase
+
+    session.close()
+    engine.dispose()
+
+    return phase
+
+def query_pooled():
+    """
+    Read the phase with a session on the shared engine.
+    """
+    with session_scope() as session:
+        phase = session.query(State).first().phase
+
+    return phase
+
+def measure(fn, duration):
+    """
+    Call `fn` repeatedly for `duration` seconds.
+
+    returns ```(queries, queries_per_second)```
+    """
+    # warm up once so that the pooled engine is created outside the measurement
+    fn()
+
+    queries = 0
+    start = time.perf_counter()
+    end = start + duration
+
+    while time.perf_counter() < end:
+        fn()
+        queries += 1
+
+    elapsed = time.perf_counter() - start
+
+    return queries, queries / elapsed
+
+if __name__ == '__main__':
+
+    # get launch arguments
+    arguments = sys.argv[1:]
+    duration = float(arguments[0]) if arguments else DEFAULT_DURATION
+
+    print(f"Measuring each mode for {duration}s...")
+
+    results = {}
+    for name, fn in [('create_engine/dispose', query_unpooled), ('pooled engine', query_pooled)]:
+        queries, qps = measure(fn, duration)
+        results[name] = qps
+        print(f"{name:>24}: {queries:>7} queries, {qps:>9.1f} queries/s")
+
+    speedup = results['pooled engine'] / results['create_engine/dispose']
+    print(f"{'speedup':>24}: {speedup:.1f}x")
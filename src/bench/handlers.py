@@ -0,0 +1,207 @@
+# this file measures the handlers that run on every tick of a show against a seeded embedded database
+# the monitor handlers are measured with a warm render cache and, marked (cold), with an empty one
+# and stores the results as json, so that the results of two commits can be compared
+# it needs no services, run with `python -m src.bench.handlers`
+#
+# options:
+# -o <path>     where to write the results, defaults to bench_results/handlers-<commit>.json
+# -c <path>     compare with the results of an earlier run
+# -t <n,n,..>   team counts, defaults to 8,32,100,200
+# -y <n,n,..>   revealed year counts, defaults to 0,20,50
+# -s <s>        seconds to measure each handler, defaults to 0.5
+
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import platform
+import contextlib
+import subprocess
+from statistics import median, quantiles
+from types import SimpleNamespace
+
+from src.server import server
+from src.monitor import monitor
+from src.db.build import get_phase, get_video, get_selected_years, get_cache
+from src.bench.load import setup_game, VIDEO_YEAR
+from src.bench.payload import payload_size
+
+TEAM_COUNTS = [8, 32, 100, 200]
+YEAR_COUNTS = [0, 20, 50]
+MEASURE_TIME = 0.5          # seconds each handler is called for
+MIN_CALLS = 5
+RESULTS_DIR = 'bench_results'
+
+def measure(fn, measure_time=MEASURE_TIME) -> dict:
+    """
+    Call a function repeatedly for `measure_time` seconds.
+
+    returns ```{'calls': n, 'mean_ms': ..., 'median_ms': ..., 'p95_ms': ...}```
+    """
+    times = []
+    start = time.perf_counter()
+
+    while len(times) < MIN_CALLS or time.perf_counter() - start < measure_time:
+        call_start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - call_start) * 1000)
+
+    return {
+        'calls': len(times),
+        'mean_ms': sum(times) / len(times),
+        'median_ms': median(times),
+        'p95_ms': quantiles(times, n=20, method='inclusive')[18],
+    }
+
+def make_callback(n_teams, rng):
+    """
+    Get a function that sends one answer of a random team through the server callback.
+    """
+    method = SimpleNamespace(delivery_tag=1, redelivered=False)
+
+    def send_answer():
+        team = rng.randint(1, n_teams)
+        body = f"Team {team}§{rng.randint(1960, 2019)}§Antwort {team}".encode()
+        server.callback(None, method, None, body)
+
+    return send_answer
+
+def cold(fn):
+    """
+    Get a function that calls a monitor handler with an empty render cache, like on the first tick after a change.
+    """
+    def call():
+        monitor.get_render_cache().invalidate()
+        return fn()
+
+    return call
+
+def run_suite(team_counts, year_counts, measure_time) -> list:
+    """
+    Seed the database for every combination of team and year count and measure all handlers.
+
+    returns a list of dicts with the handler, the counts and the timings
+    """
+    rng = random.Random(0)
+    results = []
+
+    for n_teams in team_counts:
+        for n_years in year_counts:
+            years = rng.sample([year for year in range(1960, 2020) if year != VIDEO_YEAR], n_years)
+            setup_game(n_teams, years)
+
+            send_answer = make_callback(n_teams, rng)
+
+            # every team has answered, so the labels show answers
+            for team in range(n_teams):
+                send_answer()
+
+            # the state of a browser whose labels are up to date
+            rendered = server.refresh_labels(n_teams, None)[-1]
+
+            handlers = {
+                'callback': send_answer,
+                'get_phase': get_phase,
+                'get_video': get_video,
+                'get_selected_years': get_selected_years,
+                'server.refresh_labels': lambda: server.refresh_labels(n_teams, None),
+                'server.refresh_labels (unchanged)': lambda: server.refresh_labels(n_teams, rendered),
+                'monitor.refresh_labels': monitor.refresh_labels,
+                'monitor.refresh_labels_vid': monitor.refresh_labels_vid,
+                'monitor.refresh_years': monitor.refresh_years,
+                'monitor.refresh_labels (cold)': cold(monitor.refresh_labels),
+                'monitor.refresh_labels_vid (cold)': cold(monitor.refresh_labels_vid),
+                'monitor.refresh_years (cold)': cold(monitor.refresh_years),
+            }
+
+            for name, fn in handlers.items():
+                if name == 'server.refresh_labels (unchanged)':
+                    # the callback above has changed the teams since the state was rendered
+                    rendered = dict(rendered, revision=get_cache().revision)
+
+                # the size of the update a browser receives, for the handlers that render components
+                output = fn()
+                size = payload_size(output) if isinstance(output, list) else None
+
+                results.append({'handler': name, 'teams': n_teams, 'years': n_years, **measure(fn, measure_time), 'bytes': size})
+
+    return results
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def print_results(results, previous=None):
+    """
+    Print the results, with the change to the previous results if given.
+    """
+    baseline = {}
+    if previous is not None:
+        baseline = {(r['handler'], r['teams'], r['years']): r for r in previous['results']}
+
+    header = f"{'handler':<34} {'teams':>6} {'years':>6} {'median [ms]':>12} {'p95 [ms]':>9} {'bytes':>7}"
+    print(header + (f" {'before [ms]':>12} {'change':>7}" if previous is not None else ''))
+
+    for result in results:
+        size = result.get('bytes')
+        line = f"{result['handler']:<34} {result['teams']:>6} {result['years']:>6} {result['median_ms']:>12.3f} {result['p95_ms']:>9.3f} {size if size is not None else '-':>7}"
+
+        before = baseline.get((result['handler'], result['teams'], result['years']))
+        if before is not None:
+            change = result['median_ms'] / before['median_ms'] - 1 if before['median_ms'] > 0 else 0
+            line += f" {before['median_ms']:>12.3f} {change:>+7.0%}"
+
+        print(line)
+
+if __name__ == '__main__':
+
+    # get launch arguments
+    arguments = sys.argv[1:]
+
+    def option(flag, default, cast=str):
+        return cast(arguments[arguments.index(flag) + 1]) if flag in arguments else default
+
+    def counts(text):
+        return [int(count) for count in text.split(',')]
+
+    commit = git_commit()
+    output = option('-o', f"{RESULTS_DIR}/handlers-{commit}.json")
+    team_counts = option('-t', TEAM_COUNTS, counts)
+    year_counts = option('-y', YEAR_COUNTS, counts)
+    measure_time = option('-s', MEASURE_TIME, float)
+
+    previous = None
+    if '-c' in arguments:
+        with open(option('-c', None), 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+
+    # use an embedded database, the engine is created on the first connection
+    directory = tempfile.mkdtemp(prefix='quiz-bench-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{directory}/handlers.db"
+
+    # the handlers log every answer
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        results = run_suite(team_counts, year_counts, measure_time)
+
+    print_results(results, previous)
+
+    report = {
+        'commit': commit,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'database': 'sqlite',
+        'results': results,
+    }
+
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+
+    print(f"Results written to {output}")
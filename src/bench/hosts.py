@@ -0,0 +1,96 @@
+# this file measures startup time and memory of the team hosts,
+# once with one process per team (controller -m) and once with the single hub process
+#
+# run with `python -m src.bench.hosts [team counts...]` against the docker-compose services (linux only)
+# the default team counts are 8, 32 and 100
+
+import os
+import sys
+import time
+import subprocess
+import urllib.request
+
+DEFAULT_TEAM_COUNTS = [8, 32, 100]
+STARTUP_TIMEOUT = 600   # seconds to wait for all hosts to answer
+
+def rss_mb(pids) -> float:
+    """
+    Sum the resident memory of the given processes and all their children, in MB.
+    """
+    total_kb = 0
+    seen = set()
+    pending = list(pids)
+
+    while pending:
+        pid = pending.pop()
+        if pid in seen:
+            continue
+        seen.add(pid)
+
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total_kb += int(line.split()[1])
+
+            with open(f'/proc/{pid}/task/{pid}/children') as f:
+                pending += [int(child) for child in f.read().split()]
+        except FileNotFoundError:
+            continue
+
+    return total_kb / 1024
+
+def wait_for(urls, deadline):
+    """
+    Wait until every url answers.
+    """
+    for url in urls:
+        while True:
+            try:
+                urllib.request.urlopen(url, timeout=1)
+                break
+            except OSError:
+                if time.perf_counter() > deadline:
+                    raise TimeoutError(f"{url} did not start in time")
+                time.sleep(0.2)
+
+def measure(commands, urls):
+    """
+    Start the commands, wait for the urls and return `(seconds, rss_mb)`.
+    """
+    start = time.perf_counter()
+    processes = [subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) for command in commands]
+
+    try:
+        wait_for(urls, start + STARTUP_TIMEOUT)
+        elapsed = time.perf_counter() - start
+        memory = rss_mb([process.pid for process in processes])
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    return elapsed, memory
+
+if __name__ == '__main__':
+
+    # get launch arguments
+    arguments = sys.argv[1:]
+    team_counts = [int(argument) for argument in arguments] or DEFAULT_TEAM_COUNTS
+
+    python = sys.executable
+
+    for n_teams in team_counts:
+
+        # one process per team, team N on port 8000 + N
+        commands = [[python, '-m', 'src.client.host', '-e', str(i)] for i in range(1, n_teams + 1)]
+        urls = [f'http://localhost:{8000 + i}/' for i in range(1, n_teams + 1)]
+        seconds, memory = measure(commands, urls)
+        print(f"{n_teams:>4} teams, process per team: {seconds:7.1f} s startup, {memory:8.0f} MB RSS")
+
+        # a single hub, team N under /team/N
+        commands = [[python, '-m', 'src.client.hub', str(n_teams)]]
+        urls = [f'http://localhost:8001/team/{n_teams}/']
+        seconds, memory = measure(commands, urls)
+        print(f"{n_teams:>4} teams, single hub:       {seconds:7.1f} s startup, {memory:8.0f} MB RSS")
@@ -0,0 +1,215 @@
+# this file simulates many teams sending their answers and measures the time until the answers are scored
+# the answers go through the real publisher, consumer and scoring of src/server/server.py. by default the broker
+# is the in-process queue of src/transport/local.py and the database is an embedded sqlite file, so it needs no services
+#
+# run with `python -m src.bench.load`
+#
+# options:
+# -t <n>        number of teams, defaults to 50
+# -r <n>        number of rounds per pattern, defaults to 5
+# -l <s>        length of a round in seconds, defaults to 2
+# -p <pattern>  only run one pattern: burst, spread or deadline
+# -b <n>        maximum number of answers graded in one transaction
+# -q <n>        prefetch count of the consumer
+# -x <name>     the transport: local (default) or rabbitmq, which needs a running RabbitMQ
+# -v            print the log of the server
+
+import os
+import sys
+import time
+import random
+import tempfile
+import contextlib
+from statistics import quantiles
+from threading import Condition, Thread
+
+from src.server import server
+from src.db.build import build, session_scope, set_video_id, set_phase, add_selected_year
+from src.db.model import Team, Video
+from src.rooms.rooms import DEFAULT_ROOM
+from src.transport.transport import get_transport
+
+PATTERNS = ['burst', 'spread', 'deadline']
+VIDEO_YEAR = 1984
+REVEALED_YEARS = [1962, 1971, 1979, 1990, 1997, 2005, 2013]
+ACK_TIMEOUT = 60            # seconds to wait for the answers of a round to be scored
+
+def send_times(pattern, n_teams, round_length, rng) -> list:
+    """
+    Get the moment every team sends its answer, in seconds after the start of the round.
+    - burst: all teams send at the same moment
+    - spread: the teams send at random moments during the round
+    - deadline: most teams send shortly before the end of the round
+    """
+    if pattern == 'burst':
+        return [0.0 for i in range(n_teams)]
+    elif pattern == 'spread':
+        return sorted(rng.uniform(0, round_length) for i in range(n_teams))
+    elif pattern == 'deadline':
+        return sorted(round_length * rng.betavariate(5, 1) for i in range(n_teams))
+    else:
+        raise ValueError(f"Unknown pattern {pattern}")
+
+def setup_game(n_teams, years=REVEALED_YEARS, rooms=(DEFAULT_ROOM,)):
+    """
+    Create the teams, a video and the revealed years in the database.
+    Existing tables are dropped first.
+    - years: the years revealed before the round
+    - rooms: the rooms, each gets `n_teams` teams and plays the same video
+    """
+    build()
+
+    with session_scope() as session:
+        session.add_all([Team(room=room, name=f"Team {i + 1}", points=0) for room in rooms for i in range(n_teams)])
+
+        video = Video(title='Load Test', author='-', link='-', filename='load_test', video_start='0', video_end='0',
+                      question_1='In welchem Jahr?', answer_1=str(VIDEO_YEAR), question_2='-', answer_2='-')
+        session.add(video)
+        session.flush()
+        video_id = video.id
+
+    for room in rooms:
+        set_video_id(video_id, room)
+        set_phase('hide', room)
+
+        for year in years:
+            add_selected_year(year, room)
+
+    return video_id
+
+class CommitRecorder:
+    """
+    Remembers when the answer of every message was committed by the server.
+    - committed (dict): message body -> `time.perf_counter()` after the commit
+    """
+
+    def __init__(self):
+        self.committed = {}
+        self._changed = Condition()
+
+    def wrap(self, score_messages):
+        """
+        Wrap `score_messages`, which commits the answers of a batch before it returns.
+        """
+        def recorded(messages, *args):
+            graded = score_messages(messages, *args)
+            now = time.perf_counter()
+
+            with self._changed:
+                for body, redelivered in messages:
+                    self.committed[body] = now
+                self._changed.notify_all()
+
+            return graded
+
+        return recorded
+
+    def wait_for(self, bodies, timeout=None) -> bool:
+        """
+        Block until all given messages are committed.
+
+        returns False if the timeout passed first
+        """
+        with self._changed:
+            return self._changed.wait_for(lambda: all(body in self.committed for body in bodies), timeout=timeout)
+
+def run_pattern(publisher, recorder, pattern, n_teams, n_rounds, round_length, video_id) -> dict:
+    """
+    Play `n_rounds` rounds, in each of which every team sends one answer with the given pattern.
+
+    returns ```{'messages': n, 'busy': seconds, 'latencies': [seconds]}```
+    """
+    rng = random.Random(0)
+
+    sent = {}
+    busy = 0.0
+
+    for round_number in range(n_rounds):
+        # a new round, so every team can answer again
+        set_video_id(video_id)
+
+        times = send_times(pattern, n_teams, round_length, rng)
+        teams = list(range(1, n_teams + 1))
+        rng.shuffle(teams)
+
+        round_start = time.perf_counter()
+        round_bodies = []
+
+        for team, send_time in zip(teams, times):
+            delay = round_start + send_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            # the message format of send_text in src/client/host.py, the answer is unique to find the message again
+            body = f"Team {team}§{rng.randint(1960, 2019)}§Antwort {len(sent)}"
+
+            sent[body.encode()] = time.perf_counter()
+            if not publisher.publish(body):
+                raise RuntimeError("an answer could not be published")
+
+            round_bodies.append(body.encode())
+
+        if not recorder.wait_for(round_bodies, timeout=ACK_TIMEOUT):
+            raise TimeoutError(f"the answers were not scored after {ACK_TIMEOUT}s")
+
+        busy += max(recorder.committed[body] for body in round_bodies) - min(sent[body] for body in round_bodies)
+
+    latencies = [recorder.committed[body] - sent_time for body, sent_time in sent.items()]
+
+    return {'messages': len(sent), 'busy': busy, 'latencies': latencies}
+
+if __name__ == '__main__':
+
+    # get launch arguments
+    arguments = sys.argv[1:]
+
+    def option(flag, default, cast=int):
+        return cast(arguments[arguments.index(flag) + 1]) if flag in arguments else default
+
+    n_teams = option('-t', 50)
+    n_rounds = option('-r', 5)
+    round_length = option('-l', 2.0, float)
+    patterns = [option('-p', None, str)] if '-p' in arguments else PATTERNS
+    verbose = '-v' in arguments
+
+    # use an embedded database, the engine is created on the first connection
+    directory = tempfile.mkdtemp(prefix='quiz-load-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{directory}/load.db"
+
+    batch_size = option('-b', server.CONSUMER_BATCH_SIZE)
+    prefetch = option('-q', server.CONSUMER_PREFETCH)
+    transport = get_transport(option('-x', 'local', str))
+
+    print(f"Load test with {n_teams} teams, {n_rounds} rounds of {round_length}s, batch size {batch_size}, prefetch {prefetch}")
+    print(f"Database: {os.environ['DATABASE_URL']}, transport: {transport.name}")
+
+    # the consumer looks up score_messages in the server module, so it uses the wrapped one
+    recorder = CommitRecorder()
+    server.score_messages = recorder.wrap(server.score_messages)
+
+    publisher = transport.publisher(queue='game')
+    log = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+
+    results = {}
+
+    with log:
+        video_id = setup_game(n_teams)
+
+        Thread(target=server.consume_messages, args=(prefetch, batch_size, server.CONSUMER_BATCH_WAIT, transport.connect), daemon=True).start()
+        publisher.connect()
+
+        for pattern in patterns:
+            results[pattern] = run_pattern(publisher, recorder, pattern, n_teams, n_rounds, round_length, video_id)
+
+        publisher.close()
+
+    print(f"{'pattern':>9} {'answers':>8} {'p50 [ms]':>9} {'p95 [ms]':>9} {'p99 [ms]':>9} {'max [ms]':>9} {'answers/s':>10}")
+
+    for pattern, result in results.items():
+        latencies = [latency * 1000 for latency in result['latencies']]
+        percentiles = quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+        throughput = result['messages'] / result['busy'] if result['busy'] > 0 else float('inf')
+
+        print(f"{pattern:>9} {result['messages']:>8} {percentiles[49]:>9.1f} {percentiles[94]:>9.1f} {percentiles[98]:>9.1f} {max(latencies):>9.1f} {throughput:>10.0f}")
+
+    print("answers/s is the rate from the first sent to the last scored answer of a round, for 'burst' it is the capacity of the consumer")
@@ -0,0 +1,168 @@
+# this file compares the threaded consumer of src/server/server.py with the asyncio scoring core of
+# src/server/async_core.py under mixed load: the teams send bursts of answers while the admin gives points
+# for question 2, switches the phase and starts new rounds
+# it runs on an embedded sqlite database and needs no services, run with `python -m src.bench.mixed`
+#
+# options:
+# -t <n>        number of teams, defaults to 50
+# -n <n>        number of answers, defaults to 2000
+# -i <ms>       milliseconds between two admin actions, defaults to 10
+# -m <mode>     only run one mode: threads or async
+
+import os
+import sys
+import time
+import random
+import tempfile
+import contextlib
+from statistics import quantiles
+from threading import Thread, Event
+from concurrent.futures import ThreadPoolExecutor
+
+from src.server import server
+from src.server.async_core import ScoringCore
+from src.db.build import set_phase, set_video_id
+from src.transport.transport import LocalTransport
+from src.bench.load import setup_game, CommitRecorder
+
+MODES = ['threads', 'async']
+ADMIN_WORKERS = 4           # admin actions that may run at the same time, like several open admin pages
+BURST_INTERVAL = 0.05       # seconds between two bursts of answers
+ANSWER_TIMEOUT = 120        # seconds to wait for all answers to be scored
+
+def admin_actions(n_teams, video_id, rng):
+    """
+    Yield the admin actions of a round, as `(name, args)`, forever.
+    """
+    while True:
+        for team in rng.sample(range(1, n_teams + 1), min(n_teams, 10)):
+            yield 'grade_answer_2', (f"Team {team}", rng.random() < 0.5)
+        yield 'set_phase', ('show',)
+        yield 'set_phase', ('hide',)
+        yield 'set_video_id', (video_id,)
+
+def run_mode(mode, n_teams, n_answers, admin_interval) -> dict:
+    """
+    Send `n_answers` answers in bursts of one answer per team while running admin actions every `admin_interval` seconds.
+
+    returns ```{'answers': n, 'seconds': ..., 'admin_latencies': [seconds]}```
+    """
+    rng = random.Random(0)
+    video_id = setup_game(n_teams)
+
+    committed = {}
+
+    if mode == 'threads':
+        transport = LocalTransport()
+        publisher = transport.publisher()
+
+        recorder = CommitRecorder()
+        server.score_messages = recorder.wrap(server.score_messages)
+        committed = recorder.committed
+
+        Thread(target=server.consume_messages, kwargs={'connect': transport.connect}, daemon=True).start()
+
+        def send(body):
+            publisher.publish(body)
+
+        actions = {
+            'grade_answer_2': server.grade_answer_2,
+            'set_phase': set_phase,
+            'set_video_id': set_video_id,
+        }
+
+        def run_action(name, args):
+            actions[name](*args)
+    else:
+        core = ScoringCore()
+        core.start()
+
+        def send(body):
+            async def settle(ok, body=body.encode()):
+                committed[body] = time.perf_counter()
+
+            core.run(core.submit(body.encode(), settle=settle))
+
+        def run_action(name, args):
+            core.run(getattr(core, name)(*args))
+
+    admin_latencies = []
+    stop = Event()
+
+    def timed(name, args):
+        start = time.perf_counter()
+        run_action(name, args)
+        admin_latencies.append(time.perf_counter() - start)
+
+    def admin_loop():
+        with ThreadPoolExecutor(max_workers=ADMIN_WORKERS) as executor:
+            for name, args in admin_actions(n_teams, video_id, rng):
+                if stop.is_set():
+                    break
+                executor.submit(timed, name, args)
+                time.sleep(admin_interval)
+
+    admin = Thread(target=admin_loop, daemon=True)
+
+    start = time.perf_counter()
+    admin.start()
+
+    bodies = []
+    while len(bodies) < n_answers:
+        for team in range(1, n_teams + 1):
+            if len(bodies) >= n_answers:
+                break
+            body = f"Team {team}§{rng.randint(1960, 2019)}§Antwort {len(bodies)}"
+            bodies.append(body.encode())
+            send(body)
+        time.sleep(BURST_INTERVAL)
+
+    deadline = time.perf_counter() + ANSWER_TIMEOUT
+    while not all(body in committed for body in bodies):
+        if time.perf_counter() > deadline:
+            raise TimeoutError(f"the answers were not scored after {ANSWER_TIMEOUT}s")
+        time.sleep(0.01)
+
+    seconds = max(committed[body] for body in bodies) - start
+
+    stop.set()
+    admin.join()
+
+    if mode == 'async':
+        core.stop()
+
+    return {'answers': n_answers, 'seconds': seconds, 'admin_latencies': admin_latencies}
+
+if __name__ == '__main__':
+
+    # get launch arguments
+    arguments = sys.argv[1:]
+
+    def option(flag, default, cast=int):
+        return cast(arguments[arguments.index(flag) + 1]) if flag in arguments else default
+
+    n_teams = option('-t', 50)
+    n_answers = option('-n', 2000)
+    admin_interval = option('-i', 10, float) / 1000
+    modes = [option('-m', None, str)] if '-m' in arguments else MODES
+
+    # use an embedded database, the engine is created on the first connection
+    directory = tempfile.mkdtemp(prefix='quiz-mixed-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{directory}/mixed.db"
+
+    print(f"Mixed load with {n_teams} teams, {n_answers} answers and an admin action every {admin_interval * 1000:.0f}ms")
+
+    results = {}
+
+    # the handlers log every answer
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        for mode in modes:
+            results[mode] = run_mode(mode, n_teams, n_answers, admin_interval)
+
+    print(f"{'mode':>8} {'answers/s':>10} {'admin actions':>14} {'admin p50 [ms]':>15} {'admin p95 [ms]':>15}")
+
+    for mode, result in results.items():
+        latencies = [latency * 1000 for latency in result['admin_latencies']]
+        percentiles = quantiles(latencies, n=20, method='inclusive') if len(latencies) > 1 else latencies * 19
+
+        print(f"{mode:>8} {result['answers'] / result['seconds']:>10.0f} {len(latencies):>14} {percentiles[9]:>15.1f} {percentiles[18]:>15.1f}")
@@ -0,0 +1,106 @@
+# this file compares the bytes per minute the admin page sends to one browser: full updates on every tick of a 0.5s timer,
+# diffed updates on every tick of the timer (src/monitor/render.py) and the label stream, which only pushes changed labels
+# it runs the real handlers of src/server/server.py on an embedded sqlite database, so it needs no services.
+# run with `python -m src.bench.payload`
+
+import os
+import json
+import random
+import tempfile
+import contextlib
+
+import gradio as gr
+
+from src.server import server
+from src.db.build import get_cache
+from src.bench.load import setup_game
+
+TEAM_COUNTS = [8, 50]
+TICKS_PER_MINUTE = 120      # the timer of the admin page ticked every 0.5 seconds
+ANSWERS_PER_MINUTE = 30     # answers sent by all teams together while a round is running
+
+def payload_size(outputs) -> int:
+    """
+    Get the size of the outputs as they are sent to the browser.
+    """
+    return len(json.dumps(outputs, default=str).encode('utf-8'))
+
+class Handlers:
+    """
+    The ways the admin page gets its labels, each called once per tick.
+    A call returns the outputs sent to the browser, None if nothing is sent.
+    """
+
+    def __init__(self, n_teams):
+        self.n_teams = n_teams
+        self.rendered = None
+        self.labels = None
+        self.revision = None
+
+    def full(self):
+        return [gr.update(value=label) for label in server.render_labels(self.n_teams)]
+
+    def timer(self):
+        *outputs, self.rendered = server.refresh_labels(self.n_teams, self.rendered)
+        return outputs
+
+    def stream(self):
+        # the stream blocks until the game changes, so it is only asked for the labels when something happened
+        if self.labels is None:
+            self.labels = server.stream_labels(self.n_teams)
+        elif get_cache().revision == self.revision:
+            return None
+
+        self.revision = get_cache().revision
+        return next(self.labels)
+
+def simulate(n_teams, answers_per_minute, mode) -> int:
+    """
+    Run the admin page for one minute of a round.
+
+    returns the number of bytes sent
+    """
+    rng = random.Random(0)
+
+    setup_game(n_teams, years=[])
+
+    handlers = Handlers(n_teams)
+    handler = {'full': handlers.full, 'timer': handlers.timer, 'stream': handlers.stream}[mode]
+
+    answer_ticks = set(rng.sample(range(TICKS_PER_MINUTE), min(answers_per_minute, TICKS_PER_MINUTE)))
+
+    total = 0
+
+    for tick in range(TICKS_PER_MINUTE):
+        if tick in answer_ticks:
+            body = f"Team {rng.randint(1, n_teams)}§{rng.randint(1960, 2019)}§Nena"
+            server.score_messages([(body.encode(), False)])
+
+        outputs = handler()
+
+        if outputs is not None:
+            total += payload_size(outputs)
+
+    return total
+
+if __name__ == '__main__':
+
+    # use an embedded database, the engine is created on the first connection
+    directory = tempfile.mkdtemp(prefix='quiz-payload-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{directory}/payload.db"
+
+    modes = ['full', 'timer', 'stream']
+    results = {}
+
+    # the handlers log every answer
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        for n_teams in TEAM_COUNTS:
+            for game, answers_per_minute in [('idle', 0), ('active', ANSWERS_PER_MINUTE)]:
+                results[n_teams, game] = {mode: simulate(n_teams, answers_per_minute, mode) for mode in modes}
+
+    print(f"{'teams':>6} {'game':>8} {'full [kB/min]':>14} {'timer [kB/min]':>15} {'stream [kB/min]':>16} {'saved':>7}")
+
+    for (n_teams, game), sent in results.items():
+        print(f"{n_teams:>6} {game:>8} {sent['full'] / 1000:>14.1f} {sent['timer'] / 1000:>15.1f} {sent['stream'] / 1000:>16.1f} {1 - sent['stream'] / sent['full']:>7.0%}")
+
+    print("the first update of a page is counted in every mode, it sends all labels")
@@ -0,0 +1,108 @@
+# this file estimates the time to the first frame of the clips in /videos/clips,
+# for the plain mp4 and the fragmented copy written by the splitter
+#
+# the time to the first frame is the time to load the bytes a player needs before it can show a frame
+# (the header and, for fragmented files, the first fragment) plus the time to decode the first frame
+#
+# run with `python -m src.bench.playback [bandwidth in Mbit/s]` after running the splitter
+
+import os
+import sys
+import glob
+import struct
+import subprocess
+import time
+
+DEFAULT_BANDWIDTH = 20      # Mbit/s between the monitor and the browser of the beamer
+
+def top_level_atoms(path):
+    """
+    List the top level atoms of an mp4 file.
+
+    returns a list of `(type, offset, size)` tuples
+    """
+    atoms = []
+    file_size = os.path.getsize(path)
+
+    with open(path, 'rb') as f:
+        offset = 0
+        while offset < file_size:
+            f.seek(offset)
+            header = f.read(8)
+            if len(header) < 8:
+                break
+
+            size, kind = struct.unpack('>I4s', header)
+            if size == 1:
+                size = struct.unpack('>Q', f.read(8))[0]
+            elif size == 0:
+                size = file_size - offset
+
+            atoms.append((kind.decode('latin-1'), offset, size))
+            offset += size
+
+    return atoms
+
+def startup_bytes(path) -> int:
+    """
+    Get the number of bytes a player has to load before it can show the first frame.
+    - plain mp4 with the moov atom in front: up to the end of the moov atom and the first megabyte of media
+    - plain mp4 with the moov atom at the end: the whole file
+    - fragmented mp4: up to the end of the first fragment (moof + mdat)
+    """
+    atoms = top_level_atoms(path)
+    kinds = [kind for kind, offset, size in atoms]
+
+    if 'moof' in kinds:
+        i = kinds.index('moof')
+        # the fragment's media data follows its moof atom
+        end = atoms[i + 1] if i + 1 < len(atoms) and atoms[i + 1][0] == 'mdat' else atoms[i]
+        return end[1] + end[2]
+
+    if 'moov' in kinds and 'mdat' in kinds and kinds.index('moov') < kinds.index('mdat'):
+        kind, offset, size = atoms[kinds.index('moov')]
+        return min(os.path.getsize(path), offset + size + 1024 * 1024)
+
+    return os.path.getsize(path)
+
+def decode_seconds(path) -> float:
+    """
+    Measure how long ffmpeg takes to open the file and decode the first frame.
+    """
+    start = time.perf_counter()
+    subprocess.run(['ffmpeg', '-v', 'error', '-i', path, '-frames:v', '1', '-f', 'null', '-'], capture_output=True)
+    return time.perf_counter() - start
+
+if __name__ == '__main__':
+
+    # get launch arguments
+    arguments = sys.argv[1:]
+    bandwidth = float(arguments[0]) if arguments else DEFAULT_BANDWIDTH
+    bytes_per_second = bandwidth * 1e6 / 8
+
+    clips = sorted(path for path in glob.glob('videos/clips/*.mp4') if not path.endswith('.frag.mp4'))
+
+    print(f"Time to first frame at {bandwidth} Mbit/s")
+    print(f"{'clip':<40} {'mp4 [ms]':>10} {'fragmented [ms]':>16}")
+
+    totals = {'mp4': [], 'frag': []}
+
+    for path in clips:
+        row = {}
+        for variant, variant_path in [('mp4', path), ('frag', path[:-len('.mp4')] + '.frag.mp4')]:
+            if not os.path.isfile(variant_path):
+                row[variant] = None
+                continue
+
+            seconds = startup_bytes(variant_path) / bytes_per_second + decode_seconds(variant_path)
+            row[variant] = seconds * 1000
+            totals[variant].append(row[variant])
+
+        mp4 = f"{row['mp4']:.0f}" if row['mp4'] is not None else '-'
+        frag = f"{row['frag']:.0f}" if row['frag'] is not None else '-'
+        print(f"{os.path.basename(path):<40} {mp4:>10} {frag:>16}")
+
+    for variant, values in totals.items():
+        if values:
+            values.sort()
+            print(f"{variant}: median {values[len(values) // 2]:.0f} ms, max {values[-1]:.0f} ms")
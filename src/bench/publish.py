@@ -0,0 +1,72 @@
+# this file measures the latency of publishing an answer message,
+# once with a new connection per message (the old send_text behaviour) and once with the persistent publisher
+#
+# run with `python -m src.bench.publish [messages per mode]` against the docker-compose broker
+# the messages go to the 'bench' queue, so a running server does not grade them
+
+import sys
+import time
+import pika
+
+from src.client.publisher import Publisher, mq_host
+
+BENCH_QUEUE = 'bench'
+DEFAULT_MESSAGES = 500
+
+def publish_per_connection(body):
+    """
+    Publish like send_text did before: connect, declare, publish, close.
+    """
+    connection = pika.BlockingConnection(pika.ConnectionParameters(mq_host(), port=5672))
+    channel = connection.channel()
+    channel.queue_declare(queue=BENCH_QUEUE, durable=True)
+
+    channel.basic_publish(
+        exchange='',
+        routing_key=BENCH_QUEUE,
+        body=body,
+        properties=pika.BasicProperties(delivery_mode=2),
+    )
+
+    connection.close()
+    return True
+
+def measure(fn, n_messages):
+    """
+    Publish `n_messages` messages with `fn` and return the sorted latencies in milliseconds.
+    """
+    latencies = []
+
+    for i in range(n_messages):
+        body = f'Team {i % 8 + 1}§{1960 + i % 60}§bench'
+
+        start = time.perf_counter()
+        fn(body)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return sorted(latencies)
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+if __name__ == '__main__':
+
+    # get launch arguments
+    arguments = sys.argv[1:]
+    n_messages = int(arguments[0]) if arguments else DEFAULT_MESSAGES
+
+    publisher = Publisher(queue=BENCH_QUEUE)
+    publisher.connect()
+
+    print(f"Publishing {n_messages} messages per mode...")
+
+    for name, fn in [('connection per message', publish_per_connection), ('persistent + confirms', publisher.publish)]:
+        latencies = measure(fn, n_messages)
+        print(f"{name:>24}: p50 {percentile(latencies, 50):7.2f} ms, p95 {percentile(latencies, 95):7.2f} ms, p99 {percentile(latencies, 99):7.2f} ms")
+
+    publisher.close()
+
+    # remove the benchmark messages again
+    connection = pika.BlockingConnection(pika.ConnectionParameters(mq_host(), port=5672))
+    connection.channel().queue_delete(queue=BENCH_QUEUE)
+    connection.close()
@@ -0,0 +1,146 @@
+# this file measures how the answer latency and throughput of the server hold up as rooms are added
+# every room has its own queue and consumer, all rooms get a burst of answers from all their teams at the same moment
+# the answers go through the real publisher, consumer and scoring of src/server/server.py on the in-process queue
+# and an embedded sqlite database, so it needs no services. run with `python -m src.bench.rooms`
+#
+# sqlite lets one transaction write at a time, so the consumers of the rooms take turns at the database.
+# against postgres the rooms only share the cpu of the server
+#
+# options:
+# -t <n>        number of teams per room, defaults to 20
+# -r <n>        number of rounds, defaults to 5
+# -c <counts>   comma separated room counts, defaults to 1,2,4,8
+# -x <name>     the transport: local (default) or rabbitmq, which needs a running RabbitMQ
+# -v            print the log of the server
+
+import os
+import sys
+import time
+import random
+import tempfile
+import contextlib
+from statistics import quantiles
+from threading import Thread
+
+from src.server import server
+from src.db.build import set_video_id
+from src.rooms.rooms import DEFAULT_ROOM, room_queue
+from src.transport.transport import get_transport
+from src.bench.load import setup_game, CommitRecorder, ACK_TIMEOUT
+
+ROOM_COUNTS = [1, 2, 4, 8]
+
+def room_names(n_rooms) -> list:
+    """
+    Get the rooms of a run, the first one is the default room.
+    """
+    return [DEFAULT_ROOM] + [f"room-{i + 1}" for i in range(n_rooms - 1)]
+
+def run_rooms(publishers, recorder, rooms, n_teams, n_rounds, video_id) -> dict:
+    """
+    Play `n_rounds` rounds, in each of which every team of every room sends one answer at the same moment.
+
+    returns ```{'messages': n, 'busy': seconds, 'latencies': {room: [seconds]}}```
+    """
+    rng = random.Random(0)
+
+    sent = {}
+    room_of = {}
+    busy = 0.0
+
+    for round_number in range(n_rounds):
+        # a new round in every room, so every team can answer again
+        for room in rooms:
+            set_video_id(video_id, room)
+
+        # the answers of the rooms arrive mixed, like from the phones of several rooms at once
+        answers = [(room, team) for room in rooms for team in range(1, n_teams + 1)]
+        rng.shuffle(answers)
+
+        round_bodies = []
+
+        for room, team in answers:
+            # the answer is unique to find the message again
+            body = f"Team {team}§{rng.randint(1960, 2019)}§{room} {len(sent)}"
+
+            sent[body.encode()] = time.perf_counter()
+            room_of[body.encode()] = room
+
+            if not publishers[room].publish(body):
+                raise RuntimeError("an answer could not be published")
+
+            round_bodies.append(body.encode())
+
+        if not recorder.wait_for(round_bodies, timeout=ACK_TIMEOUT):
+            raise TimeoutError(f"the answers were not scored after {ACK_TIMEOUT}s")
+
+        busy += max(recorder.committed[body] for body in round_bodies) - min(sent[body] for body in round_bodies)
+
+    latencies = {room: [] for room in rooms}
+    for body, sent_time in sent.items():
+        latencies[room_of[body]].append(recorder.committed[body] - sent_time)
+
+    return {'messages': len(sent), 'busy': busy, 'latencies': latencies}
+
+def percentile(values, p) -> float:
+    return quantiles(values, n=100, method='inclusive')[p - 1] if len(values) > 1 else values[0]
+
+if __name__ == '__main__':
+
+    # get launch arguments
+    arguments = sys.argv[1:]
+
+    def option(flag, default, cast=int):
+        return cast(arguments[arguments.index(flag) + 1]) if flag in arguments else default
+
+    n_teams = option('-t', 20)
+    n_rounds = option('-r', 5)
+    room_counts = [int(count) for count in option('-c', None, str).split(',')] if '-c' in arguments else ROOM_COUNTS
+    verbose = '-v' in arguments
+
+    # use an embedded database, the engine is created on the first connection
+    directory = tempfile.mkdtemp(prefix='quiz-rooms-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{directory}/rooms.db"
+
+    transport = get_transport(option('-x', 'local', str))
+
+    print(f"Rooms test with {n_teams} teams per room, {n_rounds} rounds, a burst of answers from every team per round")
+    print(f"Database: {os.environ['DATABASE_URL']}, transport: {transport.name}")
+
+    # the consumers look up score_messages in the server module, so they use the wrapped one
+    recorder = CommitRecorder()
+    server.score_messages = recorder.wrap(server.score_messages)
+
+    publishers = {}
+    log = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+
+    results = {}
+
+    with log:
+        for n_rooms in room_counts:
+            rooms = room_names(n_rooms)
+            video_id = setup_game(n_teams, rooms=rooms)
+
+            # every room has its own consumer, the consumers of earlier runs are kept
+            for room in rooms:
+                if room not in publishers:
+                    Thread(target=server.consume_messages, kwargs={'connect': transport.connect, 'room': room}, daemon=True).start()
+
+                    publishers[room] = transport.publisher(queue=room_queue(room))
+                    publishers[room].connect()
+
+            results[n_rooms] = run_rooms(publishers, recorder, rooms, n_teams, n_rounds, video_id)
+
+        for publisher in publishers.values():
+            publisher.close()
+
+    print(f"{'rooms':>6} {'answers':>8} {'p50 [ms]':>9} {'p95 [ms]':>9} {'p99 [ms]':>9} {'worst room p95 [ms]':>20} {'answers/s':>10}")
+
+    for n_rooms, result in results.items():
+        latencies = [latency * 1000 for room_latencies in result['latencies'].values() for latency in room_latencies]
+        worst_room = max(percentile([latency * 1000 for latency in room_latencies], 95) for room_latencies in result['latencies'].values())
+        throughput = result['messages'] / result['busy'] if result['busy'] > 0 else float('inf')
+
+        print(f"{n_rooms:>6} {result['messages']:>8} {percentile(latencies, 50):>9.1f} {percentile(latencies, 95):>9.1f} {percentile(latencies, 99):>9.1f} {worst_room:>20.1f} {throughput:>10.0f}")
+
+    print("answers/s is the rate from the first sent to the last scored answer of a round over all rooms")
@@ -0,0 +1,65 @@
+# this file compares the year grading of the old callback with the YearIndex of src/server/scoring.py
+# it needs no services, run with `python -m src.bench.scoring`
+
+import random
+import timeit
+
+from src.server.scoring import YearIndex, MIN_YEAR, MAX_YEAR
+
+TEAM_COUNTS = [8, 32, 100]
+YEAR_COUNTS = [5, 30, 60]
+REPEAT = 200
+
+def grade_legacy(selected_years_string, answer_years, video_year):
+    """
+    Grade like the old callback: parse the years string and scan all years for every answer.
+    """
+    grades = []
+
+    for answer_year in answer_years:
+        selected_years = selected_years_string.split(',')
+        selected_years = sorted([int(year.strip()) for year in selected_years if year.strip().isdigit()])
+
+        next_smaller_year = None
+        next_larger_year = None
+
+        for year in selected_years:
+            if year < video_year:
+                if next_smaller_year is None or year > next_smaller_year:
+                    next_smaller_year = year
+            elif year > video_year:
+                if next_larger_year is None or year < next_larger_year:
+                    next_larger_year = year
+
+        next_smaller_year = next_smaller_year if next_smaller_year is not None else MIN_YEAR
+        next_larger_year = next_larger_year if next_larger_year is not None else MAX_YEAR
+
+        if answer_year is not None and answer_year == video_year:
+            grades.append("perfect")
+        elif answer_year is not None and next_smaller_year < answer_year < next_larger_year:
+            grades.append("correct")
+        else:
+            grades.append("incorrect")
+
+    return grades
+
+if __name__ == '__main__':
+    random.seed(0)
+
+    print(f"{'teams':>6} {'years':>6} {'legacy [us]':>12} {'index [us]':>12} {'speedup':>8}")
+
+    for n_years in YEAR_COUNTS:
+        selected_years = random.sample(range(1960, 2020), n_years)
+        selected_years_string = ','.join(str(year) for year in selected_years)
+        index = YearIndex(selected_years)
+
+        for n_teams in TEAM_COUNTS:
+            video_year = random.randint(1960, 2019)
+            answer_years = [random.randint(1960, 2019) for i in range(n_teams)]
+
+            assert grade_legacy(selected_years_string, answer_years, video_year) == index.grade_batch(answer_years, video_year)
+
+            legacy = min(timeit.repeat(lambda: grade_legacy(selected_years_string, answer_years, video_year), number=REPEAT, repeat=5)) / REPEAT
+            indexed = min(timeit.repeat(lambda: index.grade_batch(answer_years, video_year), number=REPEAT, repeat=5)) / REPEAT
+
+            print(f"{n_teams:>6} {n_years:>6} {legacy * 1e6:>12.1f} {indexed * 1e6:>12.1f} {legacy / indexed:>7.1f}x")
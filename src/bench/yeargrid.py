@@ -0,0 +1,97 @@
+# this file compares the two layouts of the year grid of the monitor: 60 labels, one per year, and a single html component
+# it measures the handler time with an empty and a warm render cache and the bytes and components sent to a browser
+# while a show runs, on an embedded sqlite database, so it needs no services. run with `python -m src.bench.yeargrid`
+#
+# the cpu the browser needs to apply the updates has to be measured on the beamer machine itself:
+# start the monitor with `-g labels` and with `-g html` and compare the cpu of the browser tab during a show
+#
+# options:
+# -r <n>        number of rounds of the show, defaults to 20
+# -s <s>        seconds to measure each handler, defaults to 0.5
+
+import os
+import sys
+import tempfile
+import contextlib
+
+from src.monitor import monitor
+from src.monitor.render import diff_updates, is_skip
+from src.db.build import set_phase, set_video_id, add_selected_year, get_video
+from src.bench.load import setup_game
+from src.bench.handlers import measure, MEASURE_TIME
+from src.bench.payload import payload_size
+
+MODES = ['labels', 'html']
+ROUNDS = 20
+
+def cold(year_grid):
+    monitor.get_render_cache().invalidate()
+    return monitor.refresh_years(year_grid)
+
+def simulate_show(year_grid, rounds) -> dict:
+    """
+    Run a show of `rounds` rounds and collect what the year grid sends to one browser:
+    every round hides the answers, shows them, reveals the year and starts the next video.
+
+    returns ```{'updates': n, 'components': n, 'bytes': n}```
+    """
+    rendered = None
+    sent = {'updates': 0, 'components': 0, 'bytes': 0}
+
+    video_id = get_video().id
+
+    for i in range(rounds):
+        steps = [
+            lambda: set_phase('hide'),
+            lambda: set_phase('show'),
+            lambda: add_selected_year(1960 + (7 * i) % 60),
+            lambda: set_video_id(video_id),
+        ]
+
+        for step in steps:
+            step()
+
+            outputs, rendered = diff_updates(monitor.refresh_years(year_grid), rendered)
+            changed = [output for output in outputs if not is_skip(output)]
+
+            if changed:
+                sent['updates'] += 1
+                sent['components'] += len(changed)
+                sent['bytes'] += payload_size(changed)
+
+    return sent
+
+if __name__ == '__main__':
+
+    # get launch arguments
+    arguments = sys.argv[1:]
+
+    rounds = int(arguments[arguments.index('-r') + 1]) if '-r' in arguments else ROUNDS
+    measure_time = float(arguments[arguments.index('-s') + 1]) if '-s' in arguments else MEASURE_TIME
+
+    # use an embedded database, the engine is created on the first connection
+    directory = tempfile.mkdtemp(prefix='quiz-yeargrid-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{directory}/yeargrid.db"
+
+    results = {}
+
+    # the handlers log every change
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        for year_grid in MODES:
+            setup_game(8, years=[])
+
+            results[year_grid] = {
+                'cold': measure(lambda: cold(year_grid), measure_time),
+                'warm': measure(lambda: monitor.refresh_years(year_grid), measure_time),
+                'components': len(monitor.refresh_years(year_grid)),
+                'show': simulate_show(year_grid, rounds),
+            }
+
+    print(f"Year grid during a show of {rounds} rounds ({4 * rounds} state changes)")
+    print(f"{'layout':>8} {'components':>11} {'cold [ms]':>10} {'warm [ms]':>10} {'updates':>8} {'updated':>8} {'bytes':>8} {'bytes/update':>13}")
+
+    for year_grid, result in results.items():
+        show = result['show']
+        per_update = show['bytes'] / show['updates'] if show['updates'] else 0
+
+        print(f"{year_grid:>8} {result['components']:>11} {result['cold']['median_ms']:>10.3f} {result['warm']['median_ms']:>10.3f} {show['updates']:>8} {show['components']:>8} {show['bytes']:>8} {per_update:>13.0f}")
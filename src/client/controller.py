@@ -16,14 +16,30 @@ def launch_multiple_hosts(n):
     for thread in threads:
         thread.join()
 
+def launch_hub(n, rooms=''):
+    cmd = f"python -m src.client.hub {n} {rooms}"
+    subprocess.run(cmd, shell=True)
+
 if __name__ == "__main__":
     # get the launch arguments
     arguments = sys.argv[1:]
 
     if len(arguments) < 1:
-        print('Usage: python -m src.client.controller <number of hosts>')
+        print('Usage: python -m src.client.controller <number of hosts> [-m] [--rooms <room,room,...>]')
+        print('       -m: start one process per team instead of a single hub')
+        print('       --rooms: serve the teams of every room in the hub, not possible with -m')
         sys.exit(1)
     
     n_hosts = int(arguments[0])
+
+    # the team ports of -m would collide between rooms, so rooms are only served by the hub
+    rooms = f"--rooms {arguments[arguments.index('--rooms') + 1]}" if '--rooms' in arguments else ''
+
+    if '-m' in arguments and rooms:
+        print('Rooms need the hub, start without -m')
+        sys.exit(1)
     
-    launch_multiple_hosts(n_hosts)
\ No newline at end of file
+    if '-m' in arguments:
+        launch_multiple_hosts(n_hosts)
+    else:
+        launch_hub(n_hosts, rooms)
@@ -1,44 +1,112 @@
 import gradio as gr
 import sys
-from os import getenv
-import pika
+import time
 
 from src.db.model import Team
-from src.db.build import connect_db
+from src.db.build import session_scope, add_points
+from src.db.cache import notify_change
+from src.db.journal import journal_event
+from src.client.publisher import Publisher
+from src.palette.palette import team_number, team_theme_hue
+from src.rooms.rooms import DEFAULT_ROOM, check_room, room_queue
+from src.metrics.metrics import start_metrics_server, PUBLISH_SECONDS
 
 DEBUG_PRINT = False
 
-# used for a gradio theme
-TEAM_COLORS = {
-    1: "red",
-    2: "blue",
-    3: "green",
-    4: "orange",
-    5: "purple",
-    6: "cyan",
-    7: "gray",
-    8: "pink",
-}
+def ensure_team(team_name, room=DEFAULT_ROOM):
+    """
+    Create the team in the given room of the database if it does not exist yet.
+    """
+    with session_scope() as session:
+
+        # get the team with the team name
+        team = session.query(Team).filter_by(room=room, name=team_name).first()
+
+        if team is None:
+            # create a new team
+            team = Team(room=room,
+                        name=team_name,
+                        points=0)
+            
+            if DEBUG_PRINT: print(f'Created new team {team_name}')
+            
+            # add the team to the database
+            session.add(team)
+            add_points(session, team, 0)
+            notify_change(session, 'teams', room)
+            journal_event(session, 'team', room=room, team=team_name)
+
+def build_team_app(team_name, publisher: Publisher) -> gr.Blocks:
+    """
+    Build the answer website of a team.
+    - team_name: the name of the team, e.g. "Team 1"
+    - publisher: the publisher the answers are sent with, can be shared by several teams of a room.
+      It sends to the queue of the team's room, so the message does not name the room
+    """
 
-def connect_mq():
-    # Connect to RabbitMQ
-    in_docker = getenv('IN_DOCKER', False)
-    rabbitmq_host = 'rabbitmq' if in_docker else 'localhost'
+    # Function to be called when the button is pressed
+    def send_text(answer1, answer2, team_name=team_name):
+
+        message_text = f'{team_name}§{answer1}§{answer2}'
+
+        start = time.perf_counter()
+        published = publisher.publish(message_text)
+        PUBLISH_SECONDS.labels('confirmed' if published else 'failed').observe(time.perf_counter() - start)
+
+        if not published:
+            # keep the answers, so the team can send them again
+            gr.Warning('Antwort konnte nicht gesendet werden. Bitte erneut senden!')
+            return [answer1, answer2]
+
+        return ["", ""]  # Clear the text box after the broker has confirmed the answer
+    
+    # color style based on team number, a team without a number gets the default color
+    number = team_number(team_name)
+
+    # create a theme with the team color
+    theme = gr.themes.Default(neutral_hue=team_theme_hue(number))
 
-    connection = pika.BlockingConnection(pika.ConnectionParameters(rabbitmq_host, port=5672))
-    channel = connection.channel()
+    # uses the theme for the demo
+    with gr.Blocks(theme=theme, title=team_name) as demo:
 
-    channel.queue_declare(queue='game', durable=True)
+        gr.HTML(f'<h1>{team_name}</h1>', elem_classes=[f'team-{number}'])
 
-    return channel, connection
+        gr.HTML(f'<b>Frage 1:</b>')
+        input_field_1 = gr.Textbox(value='', placeholder='Antwort eingeben...', label='Input', show_label=False)
+
+        gr.HTML(f'<b>Frage 2:</b>')
+        input_field_2 = gr.Textbox(value='', placeholder='Antwort eingeben...', label='Input', show_label=False)
+
+
+        button_send = gr.Button(value='Senden')
+
+        # Connect the button to the send_text function with the text from input_field as an argument
+
+        input_fields = [input_field_1, input_field_2]
+
+        # send via button
+        button_send.click(fn=send_text, inputs=input_fields, outputs=input_fields)
+
+        # send via enter
+        # input_field_1.submit(fn=send_text, inputs=input_fields, outputs=input_fields)
+        # input_field_2.submit(fn=send_text, inputs=input_fields, outputs=input_fields)
+
+    return demo
 
 if __name__ == '__main__':
 
     # command line arguments
     arguments = sys.argv[1:]
 
+    # the room of the team, taken out first, because all other arguments may be the team name
+    room = DEFAULT_ROOM
+    if '--room' in arguments:
+        index = arguments.index('--room')
+        room = check_room(arguments[index + 1])
+        del arguments[index:index + 2]
+
     if len(arguments) < 2:
-        print('Usage: python -m src.client.host <port> <teamname>')
+        print('Usage: python -m src.client.host <port> <teamname> [--room <room>]')
         sys.exit(1)
 
     if arguments[0] == '-e':
@@ -55,7 +123,7 @@ if __name__ == '__main__':
         team_name = 'Team 1'
     
     if arguments[0] == 'help':
-        print('Usage: python -m src.client.host <port> <teamname>')
+        print('Usage: python -m src.client.host <port> <teamname> [--room <room>]')
         print('Example: - python -m src.client.host 8080 "Team 1"')
         print('         - python -m src.client.host -e 1         ("Team 1" on port 8081)')
         sys.exit(0)
@@ -63,86 +131,21 @@ if __name__ == '__main__':
     print("==============")
     print(f'Name: {team_name}')
     print(f'Port: {port}')
+    print(f'Room: {room}')
     print("==============")
     
     # connect to the database
-    engine, session = connect_db()
-
-    # get the team with the team name
-    team = session.query(Team).filter_by(name=team_name).first()
-
-    if team is None:
-        # create a new team
-        team = Team(name=team_name,
-                    points=0,
-                    answer_1='',
-                    answer_2='')
-        
-        if DEBUG_PRINT: print(f'Created new team {team_name}')
-        
-        # add the team to the database
-        session.add(team)
-        session.commit()
-
-    # close the database connection
-    session.close()
-    engine.dispose()
+    ensure_team(team_name, room)
 
     if DEBUG_PRINT: print(f'Starting mobile host on port {port} for team {team_name}...')
 
-    # Function to be called when the button is pressed
-    def send_text(answer1, answer2, team_name=team_name):
-
-        # Connect to RabbitMQ
-        channel, connection = connect_mq()
-
-        message_text = f'{team_name}§{answer1}§{answer2}'
-
-        channel.basic_publish(
-            exchange='',
-            routing_key='game',
-            body=message_text,
-            properties=pika.BasicProperties(
-                delivery_mode=2,  # make message persistent
-            )
-        )
-
-        # close the connection
-        connection.close()
-        
-        return ["", ""]  # Clear the text box after sending
-    
-    # color style based on team number
-    team_number = int(team_name.split(' ')[1])
-    team_color = TEAM_COLORS[team_number]
+    # the connection to RabbitMQ is kept open for the whole runtime
+    publisher = Publisher(queue=room_queue(room))
+    publisher.connect()
 
-    # create a theme with the team color
-    theme = gr.themes.Default(neutral_hue=team_color)
+    demo = build_team_app(team_name, publisher)
 
-    # uses the theme for the demo
-    with gr.Blocks(theme=theme) as demo:
-
-        gr.HTML(f'<h1>{team_name}</h1>', elem_classes=[f'team-{team_number}'])
-
-        gr.HTML(f'<b>Frage 1:</b>')
-        input_field_1 = gr.Textbox(value='', placeholder='Antwort eingeben...', label='Input', show_label=False)
-
-        gr.HTML(f'<b>Frage 2:</b>')
-        input_field_2 = gr.Textbox(value='', placeholder='Antwort eingeben...', label='Input', show_label=False)
-
-
-        button_send = gr.Button(value='Senden')
-
-        # Connect the button to the send_text function with the text from input_field as an argument
-
-        input_fields = [input_field_1, input_field_2]
-
-        # send via button
-        button_send.click(fn=send_text, inputs=input_fields, outputs=input_fields)
-
-        # send via enter
-        # input_field_1.submit(fn=send_text, inputs=input_fields, outputs=input_fields)
-        # input_field_2.submit(fn=send_text, inputs=input_fields, outputs=input_fields)
+    start_metrics_server('host', offset=int(arguments[1]) if arguments[0] == '-e' else 0)
         
     demo.launch(
         server_name='0.0.0.0',
@@ -0,0 +1,99 @@
+import sys
+import time
+import uvicorn
+import gradio as gr
+from fastapi import FastAPI
+from fastapi.responses import HTMLResponse
+
+from src.client.host import ensure_team, build_team_app
+from src.palette.palette import team_color
+from src.client.publisher import Publisher
+from src.rooms.rooms import DEFAULT_ROOM, parse_rooms, room_queue, room_path
+from src.metrics.metrics import start_metrics_server
+
+HUB_PORT = 8001     # port of the hub, the teams are served under /team/<number>
+
+def build_hub(n_teams, publisher: Publisher, room=DEFAULT_ROOM, app=None, path='') -> FastAPI:
+    """
+    Build one web app that serves the answer websites of all teams of a room.
+    Team N is served under `<path>/team/N`, the index page `<path>/` links to all teams.
+    - n_teams: the number of teams
+    - publisher: the publisher shared by all teams, it sends to the queue of the room
+    - room: the room the teams play in
+    - app: the app the websites are added to, a new one if None
+    - path: the url prefix of the room, see `src.rooms.rooms.room_path`
+    """
+    if app is None:
+        app = FastAPI()
+
+    @app.get(f"{path}/", response_class=HTMLResponse)
+    def index():
+        links = ''.join(
+            f'<li><a href="{path}/team/{i}/" style="color: {team_color(i)}">Team {i}</a></li>'
+            for i in range(1, n_teams + 1)
+        )
+        return f'<html><body><h1>Teams</h1><ul>{links}</ul></body></html>'
+
+    for i in range(1, n_teams + 1):
+        team_name = f'Team {i}'
+
+        ensure_team(team_name, room)
+
+        demo = build_team_app(team_name, publisher)
+        app = gr.mount_gradio_app(app, demo, path=f'{path}/team/{i}')
+
+    return app
+
+def add_room_index(app: FastAPI, rooms, page='') -> FastAPI:
+    """
+    Add an index page under `/` that links to the websites of every room.
+    - rooms: the rooms of the deployment
+    - page: the page of a room to link to, e.g. '/admin', the index page of the teams by default
+    """
+    @app.get("/", response_class=HTMLResponse)
+    def index():
+        links = ''.join(f'<li><a href="{room_path(room, rooms)}{page}/">{room}</a></li>' for room in rooms)
+        return f'<html><body><h1>Rooms</h1><ul>{links}</ul></body></html>'
+
+    return app
+
+if __name__ == '__main__':
+
+    # command line arguments
+    arguments = sys.argv[1:]
+
+    if len(arguments) < 1:
+        print('Usage: python -m src.client.hub <number of teams> [port] [--rooms <room,room,...>]')
+        sys.exit(1)
+
+    n_teams = int(arguments[0])
+    port = int(arguments[1]) if len(arguments) > 1 and arguments[1].isdigit() else HUB_PORT
+
+    # with several rooms, the teams of every room are served under /room/<room>/team/<number>
+    rooms = parse_rooms(arguments[arguments.index('--rooms') + 1]) if '--rooms' in arguments else [DEFAULT_ROOM]
+
+    start = time.perf_counter()
+
+    app = FastAPI()
+
+    if len(rooms) > 1:
+        add_room_index(app, rooms)
+
+    for room in rooms:
+        # one connection to RabbitMQ for all teams of a room
+        publisher = Publisher(queue=room_queue(room))
+        publisher.connect()
+
+        app = build_hub(n_teams, publisher, room, app, room_path(room, rooms))
+
+    start_metrics_server('hub')
+
+    print("==============")
+    print(f'Teams: {n_teams}')
+    print(f'Rooms: {", ".join(rooms)}')
+    prefix = '/room/<room>' if len(rooms) > 1 else ''
+    print(f'Port: {port} ({prefix}/team/1 - {prefix}/team/{n_teams})')
+    print(f'Built in {time.perf_counter() - start:.2f}s')
+    print("==============")
+
+    uvicorn.run(app, host='0.0.0.0', port=port)
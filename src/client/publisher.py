@@ -0,0 +1,125 @@
+import pika
+import time
+from os import getenv
+from threading import Lock, Thread
+
+PUBLISH_RETRIES = 1         # number of reconnects before a message is given up
+HEARTBEAT = 60              # heartbeat timeout negotiated with the broker, in seconds
+KEEPALIVE_INTERVAL = 10     # seconds between servicing heartbeats while the connection is idle
+
+def mq_host() -> str:
+    """
+    Get the RabbitMQ hostname, based on whether we're in docker or not.
+    """
+    in_docker = getenv('IN_DOCKER', False)
+    return 'rabbitmq' if in_docker else 'localhost'
+
+class Publisher:
+    """
+    A long-lived RabbitMQ publisher channel with publisher confirms.
+    - queue (str): the queue messages are published to
+
+    The connection is opened on the first publish and kept open. If it breaks, it is opened again
+    on the next publish. `publish()` only returns True once the broker has confirmed the message.
+    The channel is not thread safe, so all access goes through a lock. A background thread services
+    the heartbeats while no messages are sent.
+    """
+
+    def __init__(self, queue='game'):
+        self.queue = queue
+
+        self._connection = None
+        self._channel = None
+        self._lock = Lock()
+        self._keepalive = None
+
+    def connect(self):
+        """
+        Open the connection and start the keepalive thread.
+        If the broker is not reachable yet, the connection is opened on the first publish.
+        """
+        with self._lock:
+            try:
+                self._connect()
+            except pika.exceptions.AMQPError as e:
+                print(f"[mq] Could not connect to the broker: {e!r}. Retrying on the first message...")
+
+        if self._keepalive is None:
+            self._keepalive = Thread(target=self._keep_alive, daemon=True)
+            self._keepalive.start()
+
+    def publish(self, body) -> bool:
+        """
+        Publish a persistent message and wait for the broker to confirm it.
+        - body: the message
+
+        returns True if the broker has confirmed the message
+        """
+        with self._lock:
+            for attempt in range(PUBLISH_RETRIES + 1):
+                try:
+                    if self._channel is None or self._channel.is_closed:
+                        self._connect()
+
+                    self._channel.basic_publish(
+                        exchange='',
+                        routing_key=self.queue,
+                        body=body,
+                        properties=pika.BasicProperties(
+                            delivery_mode=2,  # make message persistent
+                            headers={'sent_at': time.time()},  # the server measures its lag with it
+                        ),
+                        mandatory=True,
+                    )
+                    return True
+
+                except (pika.exceptions.UnroutableError, pika.exceptions.NackError) as e:
+                    # the broker is reachable, but did not take the message
+                    print(f"[mq] Message was rejected by the broker: {e}")
+                    return False
+
+                except pika.exceptions.AMQPError as e:
+                    print(f"[mq] Publishing failed: {e!r}. Reconnecting...")
+                    self._close()
+
+        return False
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _connect(self):
+        self._close()
+
+        connection = pika.BlockingConnection(pika.ConnectionParameters(mq_host(), port=5672, heartbeat=HEARTBEAT))
+        channel = connection.channel()
+
+        channel.queue_declare(queue=self.queue, durable=True)
+        channel.confirm_delivery()
+
+        self._connection = connection
+        self._channel = channel
+
+    def _close(self):
+        if self._connection is not None and self._connection.is_open:
+            try:
+                self._connection.close()
+            except pika.exceptions.AMQPError:
+                pass
+
+        self._connection = None
+        self._channel = None
+
+    def _keep_alive(self):
+        while True:
+            time.sleep(KEEPALIVE_INTERVAL)
+
+            with self._lock:
+                if self._connection is None:
+                    continue
+
+                try:
+                    self._connection.process_data_events(time_limit=0)
+                except pika.exceptions.AMQPError:
+                    # reconnect on the next publish
+                    self._close()
@@ -1,7 +1,25 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, func, event, inspect
+from sqlalchemy.sql import ColumnElement
+from sqlalchemy.orm import Session, sessionmaker
+from contextlib import contextmanager
+from threading import Lock
 import os
-from src.db.model import Base, Team, State, Video
+from src.db.model import Base, Team, State, Video, Round, Answer, RevealedYear
+from src.db.cache import GameStateCache, notify_change
+from src.db.journal import journal_event
+from src.server.scoring import YearIndex
+from src.rooms.rooms import DEFAULT_ROOM
+from src.metrics.metrics import instrument_engine
+
+DB_POOL_SIZE = 5            # number of connections kept open per process
+DB_MAX_OVERFLOW = 10        # additional connections allowed during bursts
+DB_POOL_TIMEOUT = 10        # seconds to wait for a free connection before failing
+DB_POOL_RECYCLE = 1800      # seconds after which a pooled connection is replaced
+
+_engine = None              # the per-process engine, created lazily by get_engine()
+_session_factory = None     # sessionmaker bound to _engine
+_engine_lock = Lock()
+_caches = {}                # the game state caches of this process by room, created lazily by get_cache()
 
 def build(verbose=False):
     """
@@ -13,7 +31,7 @@ def build(verbose=False):
 
     # connect to the database
     if verbose: print("Connecting to the database... ", end='')
-    engine, session = connect_db()
+    engine = get_engine()
     if verbose: print("Done!")
 
     # force drop all tables
@@ -31,91 +49,335 @@ def build(verbose=False):
     set_phase('show')
     if verbose: print("Done!")
 
-    # close the database connection
-    session.close()
-    engine.dispose()
-
     if verbose: print("=========================")
     if verbose: print("Database rebuild finished")
     if verbose: print("=========================")
 
-def set_phase(phase):
+def set_phase(phase, room=DEFAULT_ROOM):
     """
-    Set the phase of the game.
+    Set the phase of the game in a room.
     """
-    # connect to the database
-    engine, session = connect_db()
+    with session_scope() as session:
 
-    # get the state
-    current_state = session.query(State).first()
+        # get the state
+        current_state = session.query(State).filter_by(room=room).first()
 
-    if current_state is None:
-        # create a new state
-        current_state = State(phase=phase, video_id=None)
-        # add the state to the database
-        session.add(current_state)
-    else:
-        # update the state
-        current_state.phase = phase
+        if current_state is None:
+            # create a new state
+            current_state = State(room=room, phase=phase, video_id=None)
+            # add the state to the database
+            session.add(current_state)
+        else:
+            # update the state
+            current_state.phase = phase
 
-    # commit the changes
-    session.commit()
+        notify_change(session, 'state', room)
+        journal_event(session, 'phase', room=room, phase=phase)
 
-    # close the database connection
-    session.close()
-    engine.dispose()
+    get_cache(room).update(phase=phase)
 
-def get_phase():
+def get_phase(room=DEFAULT_ROOM):
     """
     Get the state of the game.
     """
-    # connect to the database
-    engine, session = connect_db()
+    return get_cache(room).get_phase()
+
+def get_video(room=DEFAULT_ROOM) -> Video:
+    """
+    Get the current video.
+    """
+    return get_cache(room).get_video()
+
+def set_video_id(video_id, room=DEFAULT_ROOM):
+    """
+    Set the current video by its id. This starts a new round, so all teams start without answers.
+    A room without a state gets one in the 'hide' phase.
+    """
+    with session_scope() as session:
+
+        # start a new round
+        current_round = Round(room=room, video_id=video_id)
+        session.add(current_round)
+        session.flush()
+
+        # update the state
+        current_state = session.query(State).filter_by(room=room).first()
+
+        if current_state is None:
+            current_state = State(room=room, phase='hide')
+            session.add(current_state)
 
-    # get the state
-    current_state = session.query(State).first()
-    phase = current_state.phase
+        current_state.video_id = video_id
+        current_state.round_id = current_round.id
 
-    # close the database connection
-    session.close()
-    engine.dispose()
+        notify_change(session, 'state', room)
+        notify_change(session, 'teams', room)
+        journal_event(session, 'video', room=room, video_id=video_id, round_id=current_round.id)
 
-    return phase
+    # the video object is loaded from the database, the points have not changed
+    get_cache(room).refresh(teams=False)
+    get_cache(room).touch_teams()
 
-def get_video() -> Video:
+def get_round_id(room=DEFAULT_ROOM):
     """
-    Get the current video.
+    Get the id of the current round.
     """
-    # connect to the database
-    engine, session = connect_db()
+    return get_cache(room).get_round_id()
+
+def get_answer(session, team_id, round_id, create=False) -> Answer:
+    """
+    Get the answers of a team in a round.
+    - session: the session to use
+    - team_id: the id of the team
+    - round_id: the id of the round
+    - create: if True, an empty answer is added if the team has not answered yet
 
-    # get the state
-    current_state = session.query(State).first()
-    video = current_state.video
+    returns the answer, None if there is none and `create` is False
+    """
+    answer = session.query(Answer).filter_by(round_id=round_id, team_id=team_id).first()
 
-    # close the database connection
-    session.close()
-    engine.dispose()
+    if answer is None and create:
+        answer = Answer(round_id=round_id, team_id=team_id, answer_1='', answer_2='')
+        session.add(answer)
 
-    return video
+    return answer
 
-def connect_db(host="postgres", port=5432, user="postgres", password="postgres", echo=False):
+def team_order():
+    """
+    Order teams by name with numbers in order, so "Team 10" comes after "Team 9".
     """
-    Connect to the database. This function builds the database connection string and returns an engine and a session.
+    return (func.length(Team.name), Team.name)
 
-    returns ```(engine, session)```
-    - `engine` [Engine] SQLAlchemy engine
-    - `session` [Session] SQLAlchemy session
+def get_teams_with_answers(session, round_id, offset=0, limit=None, room=DEFAULT_ROOM) -> list:
+    """
+    Get the teams of a room, ordered by name, together with their answers in the given round.
+    - offset, limit: only get the teams of one page
+
+    returns a list of `(team, answer)` tuples, `answer` is None if the team has not answered
+    """
+    return (
+        session.query(Team, Answer)
+        .filter(Team.room == room)
+        .outerjoin(Answer, (Answer.team_id == Team.id) & (Answer.round_id == round_id))
+        .order_by(*team_order())
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+
+def count_teams(session, room=DEFAULT_ROOM) -> int:
+    """
+    Get the number of teams in a room.
+    """
+    return session.query(func.count(Team.id)).filter(Team.room == room).scalar()
+
+def add_points(session, team, points):
+    """
+    Add points to a team inside the given session. Does not commit.
+    The points are added in the database (`points = points + n`), so changes made at the same time
+    are not lost, and to the leaderboard of the team's room in this process once the session commits.
+    The other processes are sent the added points with the commit, see `notify_change`.
+    Points added to the same team before the session flushes are summed into one increment.
+    - session: the session to use, sync or async
+    - team: the team, with its room set
+    - points: the points to add, 0 only puts the team on the leaderboard
+    """
+    if points:
+        # an increment that is not flushed yet would be replaced, so it is extended instead
+        pending = inspect(team).dict.get('points')
+
+        if isinstance(pending, ColumnElement):
+            team.points = pending + points
+        else:
+            team.points = Team.points + points
+
+    session.info.setdefault('points', []).append((team.room, team.name, points))
+
+@event.listens_for(Session, 'before_commit')
+def _notify_points(session):
+    changes = session.info.get('points')
+
+    if not changes:
+        return
+
+    rooms = {}
+    for room, team_name, points in changes:
+        rooms.setdefault(room, []).append((team_name, points))
+
+    for room, room_changes in rooms.items():
+        notify_change(session, 'points', room, room_changes)
+
+@event.listens_for(Session, 'after_commit')
+def _apply_points(session):
+    changes = session.info.pop('points', None)
+
+    if not changes:
+        return
+
+    rooms = {}
+    for room, team_name, points in changes:
+        rooms.setdefault(room, []).append((team_name, points))
+
+    for room, room_changes in rooms.items():
+        get_cache(room).add_points(room_changes)
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_points(session):
+    session.info.pop('points', None)
+
+def get_selected_years(room=DEFAULT_ROOM) -> list:
     """
+    Get the sorted list of selected years.
+    """
+    return get_cache(room).get_selected_years()
+
+def get_years(room=DEFAULT_ROOM) -> YearIndex:
+    """
+    Get the selected years as a sorted index, see `src.server.scoring.YearIndex`.
+    """
+    return get_cache(room).get_years()
+
+def add_selected_year(year, room=DEFAULT_ROOM):
+    """
+    Add the given year to the current state of a room.
+    """
+    with session_scope() as session:
+
+        # get the current state
+        current_state = session.query(State).filter_by(room=room).first()
+
+        if current_state is None:
+            print("[years] No current state found")
+            return False
+
+        # check if the year is already selected
+        if session.query(RevealedYear).filter_by(room=room, year=year).first() is not None:
+            print(f"[years] Year {year} is already in the selected years list")
+            return False
+
+        # add the year to the selected years
+        session.add(RevealedYear(room=room, year=year, round_id=current_state.round_id))
+
+        notify_change(session, 'state', room)
+        journal_event(session, 'year', room=room, year=year, round_id=current_state.round_id)
+
+    get_cache(room).add_year(year)
+
+    return True
+
+def get_cache(room=DEFAULT_ROOM) -> GameStateCache:
+    """
+    Get the game state cache of a room in this process. It is created on the first call.
+    """
+    cache = _caches.get(room)
+
+    if cache is None:
+        with _engine_lock:
+            cache = _caches.get(room)
+
+            if cache is None:
+                url = database_url()
+
+                # only postgres announces changes of other processes, an embedded database belongs to this process
+                if url.startswith('postgresql'):
+                    cache = GameStateCache(session_scope, dsn=url, room=room)
+                else:
+                    cache = GameStateCache(session_scope, dsn=None, shared=False, room=room)
+
+                _caches[room] = cache
+
+    return cache
+
+def database_url(host="postgres", port=5432, user="postgres", password="postgres"):
+    """
+    Build the database connection string.
+    The `DATABASE_URL` environment variable replaces it, e.g. `sqlite:///game.db` for an embedded database.
+    """
+    if os.environ.get('DATABASE_URL'):
+        return os.environ['DATABASE_URL']
 
     docker_env = os.environ.get('IN_DOCKER', False)
     host = 'rabbitmq' if docker_env else 'localhost'
 
-    db_string = f"postgresql://{user}:{password}@{host}:{port}/postgres"
-    engine = create_engine(db_string, echo=echo)
-    DBSession = sessionmaker(bind=engine)
-    session = DBSession()
+    return f"postgresql://{user}:{password}@{host}:{port}/postgres"
+
+def get_engine(echo=False):
+    """
+    Get the engine of this process. The engine and its connection pool are created on the first call
+    and shared by all later calls, so connections are reused instead of reconnecting for every query.
+
+    returns ```engine```
+    - `engine` [Engine] SQLAlchemy engine
+    """
+    global _engine, _session_factory
+
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = create_engine(
+                    database_url(),
+                    echo=echo,
+                    pool_size=DB_POOL_SIZE,
+                    max_overflow=DB_MAX_OVERFLOW,
+                    pool_timeout=DB_POOL_TIMEOUT,
+                    pool_recycle=DB_POOL_RECYCLE,
+                    pool_pre_ping=True,
+                )
+                instrument_engine(engine)
+                # objects stay readable after the session is closed
+                _session_factory = sessionmaker(bind=engine, expire_on_commit=False)
+                _engine = engine
+
+    return _engine
+
+def dispose_engine():
+    """
+    Close all pooled connections and drop the engine of this process.
+    The next call to get_engine() creates a new one.
+    """
+    global _engine, _session_factory
+
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+        _engine = None
+        _session_factory = None
+
+@contextmanager
+def session_scope():
+    """
+    Open a session on the shared engine. The session is committed when the block finishes,
+    rolled back if it raises, and always closed, which returns its connection to the pool.
+
+    ```
+    with session_scope() as session:
+        team = session.query(Team).filter_by(name=team_name).first()
+    ```
+    """
+    get_engine()
+    session = _session_factory()
+
+    try:
+        yield session
+        session.commit()
+    except:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def connect_db(host="postgres", port=5432, user="postgres", password="postgres", echo=False):
+    """
+    Connect to the database. Returns the shared engine and a new session on it.
+    Prefer `session_scope()`, which closes the session for you.
+
+    returns ```(engine, session)```
+    - `engine` [Engine] SQLAlchemy engine, do not dispose it
+    - `session` [Session] SQLAlchemy session, close it when done
+    """
+    engine = get_engine(echo=echo)
+    session = _session_factory()
     return (engine, session)
 
 if __name__ == '__main__':
-    build(verbose=True)
\ No newline at end of file
+    build(verbose=True)
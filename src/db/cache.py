@@ -0,0 +1,336 @@
+import json
+import select
+import time
+from threading import Condition, Lock, Thread
+from uuid import uuid4
+from sqlalchemy import text
+
+import psycopg2
+import psycopg2.extensions
+
+from src.db.model import Team, State, RevealedYear
+from src.server.scoring import YearIndex, Leaderboard
+from src.rooms.rooms import DEFAULT_ROOM
+
+NOTIFY_CHANNEL = 'game_state'   # postgres channel used to announce state changes
+LISTEN_TIMEOUT = 5              # seconds the listener waits for a notification before checking the connection
+RECONNECT_DELAY = 2             # seconds to wait before the listener reconnects after an error
+
+NOTIFY_PAYLOAD_LIMIT = 7900     # bytes of a notification, postgres allows less than 8000
+
+# identifies this process in notifications, so it can skip its own changes
+PROCESS_TOKEN = uuid4().hex
+
+def notify_change(session, what='state', room=DEFAULT_ROOM, changes=None):
+    """
+    Announce a change to all processes listening on the game state channel.
+    The notification is sent by postgres when the session's transaction commits.
+    - session: the session that makes the change
+    - what: what changed, either 'state' (phase, video, years), 'teams' (answers) or 'points'
+    - room: the room that changed
+    - changes: for 'points', the `(team_name, points)` tuples that were added, None if the points have to be
+      loaded again. Changes that do not fit into one notification are left out, so they are loaded again.
+    """
+    if session.get_bind().dialect.name != 'postgresql':
+        return
+
+    payload = f"{what}:{room}:{PROCESS_TOKEN}"
+
+    if changes is not None:
+        data = json.dumps(changes, separators=(',', ':'))
+
+        if len(payload) + len(data.encode()) < NOTIFY_PAYLOAD_LIMIT:
+            payload = f"{payload}:{data}"
+
+    session.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": NOTIFY_CHANNEL, "payload": payload}
+    )
+
+class GameStateCache:
+    """
+    In-memory copy of the game state of a room in this process.
+    - room (str): the room
+    - phase (str): either 'show' or 'hide'
+    - video (Video): the current video, detached from its session
+    - round_id (int): the id of the current round
+    - years (YearIndex): the revealed years
+    - leaderboard (Leaderboard): the points and ranks of the teams
+    - revision (int): incremented on every change
+    - state_revision (int): incremented when phase, video or years change
+    - teams_revision (int): incremented when answers or points change
+
+    The copy is loaded once and then only refreshed when another process announces a change
+    through postgres LISTEN/NOTIFY, so reading it costs no database round trip.
+    While the listener is not connected, reads fall back to loading from the database.
+
+    The answers of the teams are not cached, but their changes are counted, so that views can wait for them
+    with `wait_for_change()` and query the answers only when something happened. The points are kept
+    in the leaderboard: points given by this process are added to it when they are committed,
+    points given by another process are added when their notification arrives. The leaderboard is only
+    loaded again when a process announces points without the changes, e.g. after a reset.
+    Every room has its own cache, which ignores the changes of the other rooms.
+    """
+
+    def __init__(self, session_scope, dsn=None, shared=True, room=DEFAULT_ROOM):
+        """
+        - session_scope: context manager that yields a database session
+        - dsn: postgres connection string for the listener, None to disable listening
+        - shared: False if no other process changes the database, then the state is loaded only once
+        - room: the room whose state is cached
+        """
+        self.session_scope = session_scope
+        self.dsn = dsn
+        self.shared = shared
+        self.room = room
+
+        self.phase = None
+        self.video = None
+        self.round_id = None
+        self.years = YearIndex()
+        self.leaderboard = Leaderboard()
+        self.revision = 0
+        self.state_revision = 0
+        self.teams_revision = 0
+
+        self._loaded = False
+        self._listening = False
+        self._listener = None
+        self._lock = Lock()
+        self._changed = Condition(self._lock)
+
+    def refresh(self, teams=True):
+        """
+        Load the game state from the database.
+        - teams: if False, the leaderboard is kept, it is changed by the points that are announced
+        """
+        # the leaderboard is loaded and swapped under the lock, so points added in between are not lost
+        with self._changed:
+            with self.session_scope() as session:
+                current_state = session.query(State).filter_by(room=self.room).first()
+
+                if current_state is None:
+                    phase, video, round_id = None, None, None
+                else:
+                    phase = current_state.phase
+                    video = current_state.video
+                    round_id = current_state.round_id
+
+                years = YearIndex(year for (year,) in session.query(RevealedYear.year).filter_by(room=self.room))
+
+                if teams or not self._loaded:
+                    leaderboard = Leaderboard(session.query(Team.name, Team.points).filter_by(room=self.room))
+                    leaderboard.round_ranks = self.leaderboard.round_ranks
+                else:
+                    leaderboard = self.leaderboard
+
+            # the rank deltas are counted from the start of the round
+            if self._loaded and round_id != self.round_id:
+                leaderboard.start_round()
+
+            self.phase = phase
+            self.video = video
+            self.round_id = round_id
+            self.years = years
+            self.leaderboard = leaderboard
+            self._loaded = True
+            self.revision += 1
+            self.state_revision += 1
+            self._changed.notify_all()
+
+    def update(self, **values):
+        """
+        Apply a change made by this process without reloading it from the database.
+        - values: attributes to set, e.g. `phase='show'`
+        """
+        with self._changed:
+            for key, value in values.items():
+                setattr(self, key, value)
+            self.revision += 1
+            self.state_revision += 1
+            self._changed.notify_all()
+
+    def add_year(self, year):
+        """
+        Add a year revealed by this process to the index without reloading all years.
+        """
+        with self._changed:
+            self.years.add(year)
+            self.revision += 1
+            self.state_revision += 1
+            self._changed.notify_all()
+
+    def refresh_teams(self):
+        """
+        Load the points of the teams from the database after another process changed them without announcing the changes.
+        """
+        # the leaderboard is loaded and swapped under the lock, so points added in between are not lost
+        with self._changed:
+            with self.session_scope() as session:
+                leaderboard = Leaderboard(session.query(Team.name, Team.points).filter_by(room=self.room))
+
+            leaderboard.round_ranks = self.leaderboard.round_ranks
+            self.leaderboard = leaderboard
+
+        self.touch_teams()
+
+    def add_points(self, changes):
+        """
+        Add committed points to the leaderboard without reloading it.
+        - changes: list of `(team_name, points)` tuples, a new team is added with 0 points
+        """
+        with self._changed:
+            for team_name, points in changes:
+                self.leaderboard.add(team_name, points)
+
+    def get_top_teams(self, k) -> list:
+        """
+        Get the best teams, see `Leaderboard.top`.
+        """
+        self.ensure_loaded()
+        with self._lock:
+            return self.leaderboard.top(k)
+
+    def get_rank(self, team_name):
+        """
+        Get the rank of a team and the ranks it moved up since the round started.
+
+        returns ```(rank, rank_delta)```, the rank is None if the team is unknown
+        """
+        self.ensure_loaded()
+        with self._lock:
+            return self.leaderboard.rank(team_name), self.leaderboard.rank_delta(team_name)
+
+    def touch_teams(self):
+        """
+        Count a change of the teams' answers or points.
+        """
+        with self._changed:
+            self.revision += 1
+            self.teams_revision += 1
+            self._changed.notify_all()
+
+    def wait_for_change(self, revision=None, timeout=None) -> int:
+        """
+        Block until something changed since `revision` or the timeout passed.
+        - revision: the revision the caller has seen last, None to return at once
+        - timeout: seconds to wait at most, None to wait forever
+
+        returns the current revision
+        """
+        self.ensure_loaded()
+
+        with self._changed:
+            if revision is not None:
+                self._changed.wait_for(lambda: self.revision != revision, timeout=timeout)
+            return self.revision
+
+    def ensure_loaded(self):
+        """
+        Load the state on first use and start listening for changes.
+        Without a running listener, the state is reloaded on every read, unless the database is not shared.
+        """
+        if self.dsn is not None and self._listener is None:
+            self.start_listener()
+
+        if not self._loaded or (self.shared and not self._listening):
+            self.refresh()
+
+    def get_phase(self):
+        self.ensure_loaded()
+        return self.phase
+
+    def get_video(self):
+        self.ensure_loaded()
+        return self.video
+
+    def get_round_id(self):
+        self.ensure_loaded()
+        return self.round_id
+
+    def get_selected_years(self) -> list:
+        self.ensure_loaded()
+        return list(self.years)
+
+    def get_years(self) -> YearIndex:
+        """
+        Get a copy of the year index, which stays the same while the caller uses it.
+        """
+        self.ensure_loaded()
+        with self._lock:
+            return self.years.copy()
+
+    def start_listener(self):
+        """
+        Start the background thread that listens for change notifications.
+        """
+        with self._lock:
+            if self._listener is not None:
+                return
+
+            self._listener = Thread(target=self._listen, daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        while True:
+            connection = None
+            try:
+                connection = psycopg2.connect(self.dsn)
+                connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+
+                cursor = connection.cursor()
+                cursor.execute(f"LISTEN {NOTIFY_CHANNEL};")
+
+                # changes may have been missed while not listening
+                self.refresh()
+                self._listening = True
+
+                while True:
+                    readable, _, _ = select.select([connection], [], [], LISTEN_TIMEOUT)
+
+                    if not readable:
+                        # check that the connection is still alive
+                        cursor.execute("SELECT 1")
+                        continue
+
+                    connection.poll()
+
+                    changes = set()
+                    points = []
+                    reload_points = False
+
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        what, _, rest = notify.payload.partition(':')
+                        room, _, rest = rest.partition(':')
+                        token, _, data = rest.partition(':')
+
+                        if room != self.room or token == PROCESS_TOKEN:
+                            continue
+
+                        changes.add(what)
+
+                        if what == 'points':
+                            if data:
+                                points.extend(json.loads(data))
+                            else:
+                                reload_points = True
+
+                    # several notifications are handled with a single refresh
+                    if 'state' in changes:
+                        self.refresh(teams=False)
+
+                    if reload_points:
+                        self.refresh_teams()
+                    elif points or 'teams' in changes:
+                        self.add_points(points)
+                        self.touch_teams()
+
+            except Exception as e:
+                self._listening = False
+                print(f"[cache] Listener failed: {e}. Reconnecting in {RECONNECT_DELAY}s...")
+
+                if connection is not None:
+                    connection.close()
+
+                time.sleep(RECONNECT_DELAY)
@@ -0,0 +1,334 @@
+import os
+import json
+import time
+from threading import Lock
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from src.db.model import Team, State, Round, Answer, RevealedYear
+from src.db.cache import notify_change
+from src.rooms.rooms import DEFAULT_ROOM
+
+JOURNAL_PATH = 'game.journal'   # file the game events of the default room are appended to, the snapshot is written next to it
+SNAPSHOT_EVERY = 500            # number of events between two snapshots
+
+_journals = {}                  # the journals of this process by room, opened by open_journal()
+
+def empty_state() -> dict:
+    """
+    The game state the journal is folded into.
+    - phase (str): either 'show' or 'hide'
+    - video_id (int): the current video
+    - round_id (int): the current round
+    - years (list): the revealed years, as `[year, round_id]` pairs
+    - teams (dict): the points of every team, by name
+    - answers (dict): the answers of the teams in the current round, by name
+    """
+    return {'phase': None, 'video_id': None, 'round_id': None, 'years': [], 'teams': {}, 'answers': {}}
+
+def empty_answer() -> dict:
+    return {'answer_1': '', 'answer_2': '', 'correct_1': None, 'correct_2': None}
+
+def apply_event(state, entry):
+    """
+    Apply one journal entry to the game state.
+    - state: the state, see `empty_state()`
+    - entry: the entry, `{'event': ..., 't': ..., ...}`
+    """
+    kind = entry['event']
+
+    if kind == 'reset':
+        teams = {name: 0 for name in state['teams']}
+        state.update(empty_state(), phase='hide', video_id=entry['video_id'], round_id=entry['round_id'], teams=teams)
+
+    elif kind == 'restore':
+        state.update(entry['state'])
+
+    elif kind == 'team':
+        state['teams'].setdefault(entry['team'], 0)
+
+    elif kind == 'phase':
+        state['phase'] = entry['phase']
+
+    elif kind == 'video':
+        state['video_id'] = entry['video_id']
+        state['round_id'] = entry['round_id']
+        state['answers'] = {}
+
+    elif kind == 'year':
+        state['years'].append([entry['year'], entry['round_id']])
+
+    elif kind in ('answer', 'late', 'grade_2'):
+        team = entry['team']
+        state['teams'][team] = state['teams'].get(team, 0) + entry.get('points', 0)
+
+        # answers of an earlier round are not shown anymore
+        if entry['round_id'] != state['round_id']:
+            return
+
+        answer = state['answers'].setdefault(team, empty_answer())
+
+        if kind == 'answer':
+            answer.update(answer_1=entry['answer_1'], answer_2=entry['answer_2'], correct_1=entry['correct_1'])
+        elif kind == 'late':
+            answer.update(correct_1='late', correct_2='late')
+        else:
+            answer['correct_2'] = entry['correct_2']
+
+class Journal:
+    """
+    Append-only file of the game events, one JSON object per line, with a snapshot of the folded state
+    every `snapshot_every` events. Loading reads the snapshot and only the events after it.
+    - path (str): the journal file, the snapshot is `<path>.snapshot`
+    - state (dict): the game state after the last event, see `empty_state()`
+    - snapshot_every (int): number of events between two snapshots
+
+    Every event is handed to the operating system when its transaction commits, so it survives
+    a crash of the process, but not necessarily a crash of the machine.
+    """
+
+    def __init__(self, path=JOURNAL_PATH, snapshot_every=SNAPSHOT_EVERY):
+        self.path = path
+        self.snapshot_path = f"{path}.snapshot"
+        self.snapshot_every = snapshot_every
+
+        self.state = empty_state()
+
+        self._file = None
+        self._since_snapshot = 0
+        self._lock = Lock()
+
+    def load(self) -> int:
+        """
+        Read the last snapshot and apply the events written after it, then open the journal for appending.
+        A line that was cut off by a crash is removed.
+
+        returns the number of events that were applied
+        """
+        offset = 0
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+
+            # a snapshot of another journal is ignored
+            if snapshot['offset'] <= size:
+                self.state = snapshot['state']
+                offset = snapshot['offset']
+
+        applied = 0
+
+        if size > 0:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+
+                    apply_event(self.state, entry)
+                    offset += len(line)
+                    applied += 1
+
+            if offset < size:
+                print(f"[journal] Removing {size - offset} bytes of an incomplete event")
+                os.truncate(self.path, offset)
+
+        self._file = open(self.path, 'ab')
+        self._since_snapshot = applied
+
+        return applied
+
+    def append(self, entries):
+        """
+        Write events to the journal and apply them to the state.
+        - entries: list of entries, `{'event': ..., 't': ..., ...}`
+        """
+        with self._lock:
+            for entry in entries:
+                self._file.write(json.dumps(entry, separators=(',', ':')).encode() + b'\n')
+                apply_event(self.state, entry)
+
+            self._file.flush()
+            self._since_snapshot += len(entries)
+
+            if self._since_snapshot >= self.snapshot_every:
+                self._write_snapshot()
+
+    def snapshot(self):
+        """
+        Write a snapshot of the current state.
+        """
+        with self._lock:
+            self._write_snapshot()
+
+    def _write_snapshot(self):
+        os.fsync(self._file.fileno())
+
+        # replace the old snapshot only once the new one is complete
+        temporary_path = f"{self.snapshot_path}.tmp"
+        with open(temporary_path, 'w') as f:
+            json.dump({'offset': self._file.tell(), 'state': self.state}, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(temporary_path, self.snapshot_path)
+        self._since_snapshot = 0
+
+def journal_path(room=DEFAULT_ROOM) -> str:
+    """
+    Get the journal file of a room: `game.journal` for the default room, `game.<room>.journal` for the others.
+    """
+    if room == DEFAULT_ROOM:
+        return JOURNAL_PATH
+
+    base, extension = os.path.splitext(JOURNAL_PATH)
+    return f"{base}.{room}{extension}"
+
+def open_journal(path=None, room=DEFAULT_ROOM) -> Journal:
+    """
+    Load the journal of a room. From now on, the events of the room in every committed session are appended to it.
+    - path: the journal file, defaults to `journal_path(room)`
+    """
+    if path is None:
+        path = journal_path(room)
+
+    journal = Journal(path)
+    applied = journal.load()
+    print(f"[journal] Loaded {path}, {applied} events after the last snapshot")
+
+    _journals[room] = journal
+
+    return journal
+
+def get_journal(room=DEFAULT_ROOM) -> Journal:
+    """
+    Get the journal of a room, None if it was not opened.
+    """
+    return _journals.get(room)
+
+def journal_event(session, kind, room=DEFAULT_ROOM, **fields):
+    """
+    Record a game event. The event is written to the journal of its room when the session's transaction commits
+    and dropped if it is rolled back. Does nothing if the journal of the room is not open.
+    - session: the session that makes the change, sync or async
+    - kind: the kind of the event, see `apply_event()`
+    - room: the room the event belongs to
+    - fields: the data of the event, e.g. `team='Team 1'`
+    """
+    if room not in _journals:
+        return
+
+    session.info.setdefault('journal', []).append((room, {'event': kind, 't': round(time.time(), 3), **fields}))
+
+def journal_teams(session, team_names, room=DEFAULT_ROOM):
+    """
+    Record a 'team' event for every team the journal of the room does not know yet, see `journal_event()`.
+    The teams are created by the hosts, which do not open the journal, so the server records them once it sees them.
+    - session: the session that saw the teams
+    - team_names: the names of the teams
+    - room: the room of the teams
+    """
+    journal = _journals.get(room)
+
+    if journal is None:
+        return
+
+    for team_name in team_names:
+        if team_name not in journal.state['teams']:
+            journal_event(session, 'team', room=room, team=team_name)
+
+@event.listens_for(Session, 'after_commit')
+def _write_events(session):
+    entries = session.info.pop('journal', None)
+
+    if not entries:
+        return
+
+    rooms = {}
+    for room, entry in entries:
+        rooms.setdefault(room, []).append(entry)
+
+    for room, room_entries in rooms.items():
+        _journals[room].append(room_entries)
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_events(session):
+    session.info.pop('journal', None)
+
+def restore_state(session, state, room=DEFAULT_ROOM):
+    """
+    Write a game state from the journal into the database inside the given session. Does not commit.
+    The videos are not touched, teams that are missing are created, and a round that is missing
+    is started again under a new id.
+    - session: the session to use
+    - state: the state, see `empty_state()`
+    - room: the room the state belongs to
+    """
+    # rounds that are missing get a new id
+    existing_round_ids = {round_id for (round_id,) in session.query(Round.id).filter_by(room=room)}
+    round_ids = {}
+
+    def restore_round(round_id, video_id=None):
+        if round_id is None:
+            return None
+
+        if round_id not in round_ids:
+            if round_id in existing_round_ids:
+                round_ids[round_id] = round_id
+            else:
+                current_round = Round(room=room, video_id=video_id)
+                session.add(current_round)
+                session.flush()
+                round_ids[round_id] = current_round.id
+
+        return round_ids[round_id]
+
+    round_id = restore_round(state['round_id'], state['video_id'])
+
+    current_state = session.query(State).filter_by(room=room).first()
+
+    if current_state is None:
+        current_state = State(room=room)
+        session.add(current_state)
+
+    current_state.phase = state['phase']
+    current_state.video_id = state['video_id']
+    current_state.round_id = round_id
+
+    # teams and their points
+    teams = {team.name: team for team in session.query(Team).filter_by(room=room)}
+
+    for name, points in state['teams'].items():
+        if name not in teams:
+            teams[name] = Team(room=room, name=name, points=points)
+            session.add(teams[name])
+        else:
+            teams[name].points = points
+
+    session.flush()
+
+    # revealed years
+    session.query(RevealedYear).filter_by(room=room).delete()
+    for year, year_round_id in state['years']:
+        session.add(RevealedYear(room=room, year=year, round_id=restore_round(year_round_id)))
+
+    # answers of the current round
+    if round_id is not None:
+        session.query(Answer).filter_by(round_id=round_id).delete()
+
+        for name, answer in state['answers'].items():
+            session.add(Answer(round_id=round_id, team_id=teams[name].id, **answer))
+
+    restored = dict(state, round_id=round_id, years=[[year, restore_round(year_round_id)] for year, year_round_id in state['years']])
+    journal_event(session, 'restore', room=room, state=restored)
+
+    notify_change(session, 'state', room)
+    notify_change(session, 'points', room)
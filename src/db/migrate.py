@@ -0,0 +1,139 @@
+# this file migrates a database from before rounds, answers and revealed years had their own tables
+# the answers of the teams and the selected years are copied into the new tables, the points are kept
+# a database from before rooms gets a room column, all existing rows belong to the default room
+#
+# run with `python -m src.db.migrate`, add `-d` to drop the old columns afterwards
+
+import sys
+from sqlalchemy import inspect, text
+
+from src.db.model import Base, Round, Answer, RevealedYear, State
+from src.db.build import get_engine, get_cache, session_scope
+from src.rooms.rooms import DEFAULT_ROOM
+
+OLD_TEAM_COLUMNS = ['answer_1', 'answer_2', 'correct_1', 'correct_2']
+ROOM_TABLES = ['teams', 'state', 'rounds', 'revealed_years']     # tables that have a room column
+
+# indexes of the room columns by table, as `(name, columns, unique)`, see src.db.model
+ROOM_INDEXES = {
+    'teams': [('ix_teams_name', 'name', False), ('uq_teams_room_name', 'room, name', True)],
+    'state': [('ix_state_room', 'room', True)],
+    'rounds': [('ix_rounds_room', 'room', False)],
+    'revealed_years': [('ix_revealed_years_year', 'year', False), ('uq_revealed_years_room_year', 'room, year', True)],
+}
+
+def parse_years(selected_years) -> list:
+    """
+    Parse the old comma separated `State.selected_years` string into a sorted list of years.
+    """
+    if selected_years is None:
+        return []
+
+    years = selected_years.split(',')
+
+    return sorted([int(year.strip()) for year in years if year.strip().isdigit()])
+
+def migrate(drop_old_columns=False, verbose=False):
+    """
+    Create the new tables and indexes and copy the old data into them.
+    Running it again does not copy anything twice.
+    - drop_old_columns: if True, the old answer and selected year columns are dropped
+    """
+    engine = get_engine()
+
+    # create the new tables, existing tables are left as they are
+    if verbose: print("Creating new tables... ", end='')
+    Base.metadata.create_all(engine)
+    if verbose: print("Done!")
+
+    inspector = inspect(engine)
+    team_columns = {column['name'] for column in inspector.get_columns('teams')}
+    state_columns = {column['name'] for column in inspector.get_columns('state')}
+    room_columns = {table: {column['name'] for column in inspector.get_columns(table)} for table in ROOM_TABLES}
+    indexes = {table: {index['name']: index['unique'] for index in inspector.get_indexes(table)} for table in ROOM_TABLES}
+
+    if verbose: print("Adding new columns and indexes... ", end='')
+    with engine.begin() as connection:
+        if 'round_id' not in state_columns:
+            connection.execute(text("ALTER TABLE state ADD COLUMN round_id INTEGER REFERENCES rounds(id)"))
+
+        # the existing rows belong to the default room
+        for table in ROOM_TABLES:
+            if 'room' not in room_columns[table]:
+                connection.execute(text(f"ALTER TABLE {table} ADD COLUMN room VARCHAR NOT NULL DEFAULT '{DEFAULT_ROOM}'"))
+
+        # team names and years are only unique in their room
+        for table, table_indexes in ROOM_INDEXES.items():
+            for name, columns, unique in table_indexes:
+                if name in indexes[table] and bool(indexes[table][name]) != unique:
+                    connection.execute(text(f"DROP INDEX {name}"))
+                    del indexes[table][name]
+
+                if name not in indexes[table]:
+                    connection.execute(text(f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table} ({columns})"))
+    if verbose: print("Done!")
+
+    with session_scope() as session:
+
+        current_state = session.query(State).filter_by(room=DEFAULT_ROOM).first()
+
+        # the current round, answers are copied into it
+        if current_state is not None and current_state.round_id is None:
+            current_round = Round(video_id=current_state.video_id)
+            session.add(current_round)
+            session.flush()
+            current_state.round_id = current_round.id
+
+        round_id = current_state.round_id if current_state is not None else None
+
+        # copy the selected years
+        if 'selected_years' in state_columns:
+            if verbose: print("Copying selected years... ", end='')
+            selected_years = session.execute(text("SELECT selected_years FROM state LIMIT 1")).scalar()
+
+            for year in parse_years(selected_years):
+                if session.query(RevealedYear).filter_by(room=DEFAULT_ROOM, year=year).first() is None:
+                    session.add(RevealedYear(year=year, round_id=None))
+            if verbose: print("Done!")
+
+        # copy the answers of the current round
+        if set(OLD_TEAM_COLUMNS) <= team_columns and round_id is not None:
+            if verbose: print("Copying answers... ", end='')
+            rows = session.execute(text(f"SELECT id, {', '.join(OLD_TEAM_COLUMNS)} FROM teams")).all()
+
+            for team_id, answer_1, answer_2, correct_1, correct_2 in rows:
+                if not (answer_1 or answer_2 or correct_1 or correct_2):
+                    continue
+
+                if session.query(Answer).filter_by(round_id=round_id, team_id=team_id).first() is not None:
+                    continue
+
+                session.add(Answer(
+                    round_id=round_id,
+                    team_id=team_id,
+                    answer_1=answer_1 or '',
+                    answer_2=answer_2 or '',
+                    correct_1=correct_1 or None,
+                    correct_2=correct_2 or None,
+                ))
+            if verbose: print("Done!")
+
+    if drop_old_columns:
+        if verbose: print("Dropping old columns... ", end='')
+        with engine.begin() as connection:
+            for column in OLD_TEAM_COLUMNS:
+                if column in team_columns:
+                    connection.execute(text(f"ALTER TABLE teams DROP COLUMN {column}"))
+
+            if 'selected_years' in state_columns:
+                connection.execute(text("ALTER TABLE state DROP COLUMN selected_years"))
+        if verbose: print("Done!")
+
+    get_cache().refresh()
+
+if __name__ == '__main__':
+
+    # get launch arguments
+    arguments = sys.argv[1:]
+
+    migrate(drop_old_columns='-d' in arguments, verbose=True)
@@ -1,36 +1,88 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
+from src.rooms.rooms import DEFAULT_ROOM
+
 Base = declarative_base()
 
 class Team(Base):
     """
     A team in the game
     - id (int): unique identifier
-    - name (str): name of the team
+    - room (str): the room the team plays in
+    - name (str): name of the team, unique in its room
     - points (int): number of points the team has
+    """
+    __tablename__ = 'teams'
+    __table_args__ = (Index('uq_teams_room_name', 'room', 'name', unique=True),)
+    id = Column(Integer, primary_key=True)
+    room = Column(String, nullable=False, default=DEFAULT_ROOM, server_default=DEFAULT_ROOM)
+    name = Column(String, index=True)
+    points = Column(Integer)
+
+class State(Base):
+    """
+    The state of the game, there is one row per room
+    - room (str): the room
+    - phase (str): either 'show' or 'hide'
+    - video_id (int): the current video
+    - round_id (int): the current round
+    """
+    __tablename__ = 'state'
+    id = Column(Integer, primary_key=True)
+    room = Column(String, unique=True, index=True, nullable=False, default=DEFAULT_ROOM, server_default=DEFAULT_ROOM)
+    phase = Column(String)
+    video_id = Column(Integer, ForeignKey('videos.id'), nullable=True)
+    round_id = Column(Integer, ForeignKey('rounds.id'), nullable=True)
+    video = relationship("Video", backref="state")
+
+class Round(Base):
+    """
+    A round of the game, a new round starts with every video
+    - id (int): unique identifier
+    - room (str): the room the round is played in
+    - video_id (int): the video of the round
+    """
+    __tablename__ = 'rounds'
+    id = Column(Integer, primary_key=True)
+    room = Column(String, nullable=False, default=DEFAULT_ROOM, server_default=DEFAULT_ROOM, index=True)
+    video_id = Column(Integer, ForeignKey('videos.id'), nullable=True, index=True)
+
+class Answer(Base):
+    """
+    The answers of a team in a round, there is at most one row per team and round.
+    The room of an answer is the room of its round.
+    - round_id (int): the round
+    - team_id (int): the team
     - answer_1 (str): answer to question 1
     - answer_2 (str): answer to question 2
     - correct_1 (str): short string that indicates if answer_1 is correct or not
     - correct_2 (str): short string that indicates if answer_2 is correct or not
     """
-    __tablename__ = 'teams'
+    __tablename__ = 'answers'
+    __table_args__ = (UniqueConstraint('round_id', 'team_id', name='uq_answers_round_team'),)
     id = Column(Integer, primary_key=True)
-    name = Column(String)
-    points = Column(Integer)
+    round_id = Column(Integer, ForeignKey('rounds.id'), nullable=False, index=True)
+    team_id = Column(Integer, ForeignKey('teams.id'), nullable=False, index=True)
     answer_1 = Column(String, nullable=True)
     answer_2 = Column(String, nullable=True)
     correct_1 = Column(String, nullable=True)
     correct_2 = Column(String, nullable=True)
 
-class State(Base):
-    __tablename__ = 'state'
+class RevealedYear(Base):
+    """
+    A year that has been revealed on the year grid of a room
+    - room (str): the room
+    - year (int): the revealed year, unique in its room
+    - round_id (int): the round in which the year was revealed
+    """
+    __tablename__ = 'revealed_years'
+    __table_args__ = (Index('uq_revealed_years_room_year', 'room', 'year', unique=True),)
     id = Column(Integer, primary_key=True)
-    phase = Column(String)
-    selected_years = Column(String, nullable=True)
-    video_id = Column(Integer, ForeignKey('videos.id'), nullable=True)
-    video = relationship("Video", backref="state")
+    room = Column(String, nullable=False, default=DEFAULT_ROOM, server_default=DEFAULT_ROOM)
+    year = Column(Integer, index=True)
+    round_id = Column(Integer, ForeignKey('rounds.id'), nullable=True, index=True)
 
 class Video(Base):
     """
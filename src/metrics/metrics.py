@@ -0,0 +1,95 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+# port of the metrics endpoint of every component, set METRICS_PORT to override it or to 0 to disable it
+METRICS_PORTS = {
+    'server': 9101,
+    'monitor': 9102,
+    'hub': 9103,
+    'host': 9110,       # a host started with -e N uses 9110 + N
+}
+
+# buckets in seconds for things that should take milliseconds
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+HANDLER_SECONDS = Histogram('quiz_handler_seconds', 'Duration of a handler call', ['handler'], buckets=FAST_BUCKETS)
+DB_QUERY_SECONDS = Histogram('quiz_db_query_seconds', 'Duration of a database query, by the handler that sent it', ['handler'], buckets=FAST_BUCKETS)
+DB_CONNECTIONS = Gauge('quiz_db_connections', 'Connections of the database pool', ['engine', 'state'])
+
+MESSAGE_SECONDS = Histogram('quiz_message_seconds', 'Time from receiving an answer to its committed score', buckets=FAST_BUCKETS)
+BATCH_SIZE = Histogram('quiz_batch_size', 'Number of answers graded in one transaction', buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+CONSUMER_LAG_SECONDS = Histogram('quiz_consumer_lag_seconds', 'Time from publishing an answer to its delivery to the server', buckets=FAST_BUCKETS)
+QUEUE_MESSAGES = Gauge('quiz_queue_messages', 'Messages waiting in the queue, not counting those delivered but not acknowledged', ['queue'])
+FAILED_BATCHES = Counter('quiz_failed_batches', 'Batches that were given back to the broker because grading failed')
+REJECTED_MESSAGES = Counter('quiz_rejected_messages', 'Answers that were dropped because grading them failed on their own')
+
+RENDER_CACHE_LOOKUPS = Counter('quiz_render_cache_lookups', 'Lookups of rendered monitor components, by hit or miss', ['result'])
+
+PUBLISH_SECONDS = Histogram('quiz_publish_seconds', 'Time to publish an answer until the broker confirmed it', ['result'], buckets=FAST_BUCKETS)
+
+# the handler that runs in the current thread or task, queries are counted for it
+_handler = ContextVar('handler', default='other')
+
+def start_metrics_server(component, offset=0):
+    """
+    Serve the metrics of this process in the Prometheus text format under http://<host>:<port>/metrics.
+    - component: 'server', 'monitor', 'hub' or 'host', see METRICS_PORTS
+    - offset: added to the port, so several processes of a component get their own port
+    """
+    port = int(os.environ.get('METRICS_PORT', METRICS_PORTS[component] + offset))
+
+    if port == 0:
+        return
+
+    try:
+        start_http_server(port)
+        print(f"[metrics] Serving metrics on port {port}")
+    except OSError as e:
+        print(f"[metrics] Could not serve metrics on port {port}: {e}")
+
+@contextmanager
+def track(handler):
+    """
+    Measure the duration of a handler and count the queries it sends.
+    Works as a context manager and as a decorator.
+
+    ```
+    with track('refresh_labels'):
+        ...
+    ```
+    """
+    token = _handler.set(handler)
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        HANDLER_SECONDS.labels(handler).observe(time.perf_counter() - start)
+        _handler.reset(token)
+
+def instrument_engine(engine, name='sync'):
+    """
+    Measure all queries of an engine and report the connections of its pool.
+    - engine: the engine, for an async engine its `sync_engine`
+    - name: the name of the engine in the connection metrics
+    """
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        start = connection.info['query_start'].pop()
+        DB_QUERY_SECONDS.labels(_handler.get()).observe(time.perf_counter() - start)
+
+    pool = engine.pool
+
+    # not every pool counts its connections
+    if hasattr(pool, 'checkedout') and hasattr(pool, 'checkedin'):
+        DB_CONNECTIONS.labels(name, 'in_use').set_function(pool.checkedout)
+        DB_CONNECTIONS.labels(name, 'idle').set_function(pool.checkedin)
@@ -0,0 +1,110 @@
+import os
+import html
+from threading import Thread
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import FileResponse
+
+from src.db.model import Video
+from src.db.build import session_scope, get_cache
+from src.rooms.rooms import DEFAULT_ROOM
+
+VIDEO_DIR = "videos"
+CLIP_DIR = f"{VIDEO_DIR}/clips"
+
+PREFER_STREAMING_CLIPS = True           # if True, plays the fragmented copy of a clip if the splitter has written one
+PREFETCH_CHUNK_SIZE = 1024 * 1024       # bytes read at once when the page cache can not be advised directly
+
+def clip_name(video_filename) -> str:
+    """
+    Get the file name of the clip of a video in the clip folder.
+    The fragmented copy starts playing before it is loaded completely, so it is preferred.
+    """
+    streaming_name = f'{video_filename}.frag.mp4'
+
+    if PREFER_STREAMING_CLIPS and os.path.isfile(f'{CLIP_DIR}/{streaming_name}'):
+        return streaming_name
+
+    return f'{video_filename}.mp4'
+
+def clip_player(video_filename) -> str:
+    """
+    Get the html of a video player for the clip of a video, served from the /clips endpoint.
+    """
+    src = html.escape(f'/clips/{clip_name(video_filename)}')
+    return f'<video src="{src}" width="1280" height="720" controls autoplay preload="auto"></video>'
+
+def warm_file(path):
+    """
+    Load a file into the page cache, so that serving it does not wait for the disk.
+    """
+    if not os.path.isfile(path):
+        return
+
+    with open(path, 'rb') as f:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        else:
+            while f.read(PREFETCH_CHUNK_SIZE):
+                pass
+
+def get_next_video(video_id) -> Video:
+    """
+    Get the video that follows the given one in the video order of the server.
+    """
+    with session_scope() as session:
+        return session.query(Video).filter(Video.id > video_id).order_by(Video.id).first()
+
+def prefetch_clips(room=DEFAULT_ROOM):
+    """
+    Keep the clips of the current and the next video of a room in the page cache.
+    Runs forever and wakes up whenever the game state of the room changes.
+    """
+    cache = get_cache(room)
+
+    revision = None
+    video_id = None
+
+    while True:
+        revision = cache.wait_for_change(revision)
+        video = cache.video
+
+        if video is None or video.id == video_id:
+            continue
+
+        video_id = video.id
+
+        try:
+            upcoming = [video, get_next_video(video.id)]
+
+            for current in upcoming:
+                if current is not None and current.filename:
+                    warm_file(f'{CLIP_DIR}/{clip_name(current.filename)}')
+                    print(f"[clips] Prefetched {current.filename}")
+        except Exception as e:
+            print(f"[clips] Prefetching failed: {e}")
+
+def start_prefetching(rooms=(DEFAULT_ROOM,)):
+    for room in rooms:
+        Thread(target=prefetch_clips, args=(room,), daemon=True).start()
+
+def add_clip_route(app: FastAPI):
+    """
+    Serve the clips under /clips/<name>. FileResponse answers Range requests with partial content
+    and sets ETag and Last-Modified, so the browser can seek and cache the clip. The bytes are sent by
+    the web server outside of the Gradio queue, with zero-copy `pathsend` where the server supports it.
+    """
+    clip_dir = os.path.realpath(CLIP_DIR)
+
+    # the monitors of several rooms share the route
+    if any(getattr(route, 'path', None) == "/clips/{name}" for route in app.routes):
+        return
+
+    @app.get("/clips/{name}")
+    def clip(name: str):
+        path = os.path.realpath(os.path.join(clip_dir, name))
+
+        # only files directly in the clip folder are served
+        if os.path.dirname(path) != clip_dir or not os.path.isfile(path):
+            raise HTTPException(status_code=404)
+
+        return FileResponse(path, media_type='video/mp4')
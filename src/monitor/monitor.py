@@ -1,27 +1,36 @@
 import pika
 import os
 import sys
+import math
+import time
+from html import escape
+import uvicorn
 import gradio as gr
 from threading import Thread
+from fastapi import FastAPI
 
-from src.db.model import Team, State
-from src.db.build import connect_db, get_phase, set_phase, get_video
+from src.db.build import session_scope, get_phase, set_phase, get_video, get_selected_years, get_cache, get_round_id, get_teams_with_answers, count_teams
+from src.monitor.clips import clip_player, add_clip_route, start_prefetching
+from src.monitor.render import RenderCache, diff_updates, is_skip, shown_video
+from src.palette.palette import team_name_color
+from src.rooms.rooms import DEFAULT_ROOM, parse_rooms, room_path
+from src.metrics.metrics import track, start_metrics_server
 
 USE_AUTH = True                         # if True, requires authentication to access the server
 AUTH_CREDENTIALS = ('admin', 'admin')   # credentials for authentication
 
-VIDEO_DIR = "videos"
-
-TEAM_COLORS = {
-    1: "#b5100a",
-    2: "#0d19ff",
-    3: "#129a00",
-    4: "#c46d00",
-    5: "#7e15ff",
-    6: "#00b2b5",
-    7: "#000000",
-    8: "#cd21bd",
-}
+STREAM_TIMEOUT = 30                     # seconds an update stream waits for a change before checking again
+STREAM_RETRY_DELAY = 2                  # seconds an update stream waits after a failed update before trying again
+
+SCOREBOARD_PAGE_SIZE = 10               # teams on one page of the scoreboard
+SCOREBOARD_PAGE_SECONDS = 8             # seconds a page is shown before the next one, if the teams do not fit on one page
+RANKING_SIZE = 10                       # teams shown in the ranking
+MEDALS = ["🥇", "🥈", "🥉"]
+
+YEAR_GRID_MODE = 'labels'               # 'labels' for one label per year, 'html' for a single html grid, set with -g <mode>
+
+# the questions, answers and the year grid of every room, shared by all browsers of the room until its game state changes
+render_caches = {}
 
 def answer_to_emoji(answer) -> str:
     if answer == None or answer == '':
@@ -37,248 +46,348 @@ def answer_to_emoji(answer) -> str:
     else:
         return "❗️"
 
-def get_selected_years():
+def get_render_cache(room=DEFAULT_ROOM) -> RenderCache:
     """
-    Get the selected years from the current state.
+    Get the render cache of a room, it is created on the first call.
     """
-    engine, session = connect_db()
+    if room not in render_caches:
+        render_caches.setdefault(room, RenderCache())
 
-    # get the current state
-    current_state = session.query(State).first()
+    return render_caches[room]
 
-    if current_state is None:
-        print("[state] No current state found")
-        session.close()
-        engine.dispose()
-        return []
+def scoreboard_pages(room=DEFAULT_ROOM) -> int:
+    """
+    Get the number of pages of the scoreboard of a room.
+    """
+    with session_scope() as session:
+        n_teams = count_teams(session, room)
 
-    if current_state.selected_years is None:
-        # print("No selected years found")
-        return []
+    return max(1, math.ceil(n_teams / SCOREBOARD_PAGE_SIZE))
 
-    # split the selected years by comma and return them as a list
-    selected_years = current_state.selected_years.split(',')
+def render_scoreboard(teams_with_answers, is_show, q2_exists, page, pages) -> str:
+    """
+    Render one page of the scoreboard as a html table.
+    - teams_with_answers: the `(team, answer)` tuples of the page
+    - is_show: if True, the grades and the points are shown
+    - q2_exists: if False, the column of answer 2 is left out
+    - page, pages: the number of the page, starting with 0, and the number of pages
+    """
+    rows = []
 
-    # sort the years
-    selected_years = sorted([int(year.strip()) for year in selected_years if year.strip().isdigit()])
+    for current_team, current_answer in teams_with_answers:
 
-    session.close()
-    engine.dispose()
+        answer_1 = escape(current_answer.answer_1) if current_answer else ''
+        answer_2 = escape(current_answer.answer_2) if current_answer else ''
 
-    return selected_years
+        if is_show:
+            answer_1 = f"{answer_1} {answer_to_emoji(current_answer.correct_1 if current_answer else None)}"
+            answer_2 = f"{answer_2} {answer_to_emoji(current_answer.correct_2 if current_answer else None)}"
 
-if __name__ == '__main__':
+        cells = [f'<td class="team" style="color: {team_name_color(current_team.name)}">{escape(current_team.name)}</td>']
+        cells.append(f'<td class="answer">{answer_1}</td>')
+        if q2_exists:
+            cells.append(f'<td class="answer">{answer_2}</td>')
+        cells.append(f'<td class="points">{current_team.points if is_show else ""}</td>')
 
-    # get launch arguments
-    arguments = sys.argv[1:]
+        rows.append(f"<tr>{''.join(cells)}</tr>")
 
-    if len(arguments) < 1:
-        print('Usage: python -m src.monitor.monitor <number of players>')
-        sys.exit(1)
+    html = f'<table class="scoreboard">{"".join(rows)}</table>'
 
-    # Number of players - this can be parameterized
-    num_players = int(arguments[0])
-    players = {"-" for i in range(num_players)}
+    if pages > 1:
+        html += f'<div class="scoreboard_page">Seite {page + 1}/{pages}</div>'
 
-    def refresh_labels():
-        """
-        Fetch current players' answers and points from the database and return them.
-        This returns a list of the labels that will be updated in the UI with the following order:
-        - Last Question
-        - Last Answer
-        - Team Names
-        - Team Correct/Incorrect Answers
-        - Team Answers
-        - Team Points
-        - Team Rankings
-        """
-        engine, session = connect_db()
+    return html
 
-        phase = get_phase()     # either 'show' or 'hide'
-        is_show = (phase == 'show')
+def render_ranking(top_teams) -> str:
+    """
+    Render the ranking as a html list.
+    - top_teams: the best teams as `(name, points, rank, rank_delta)` tuples, see `Leaderboard.top`
+    """
+    rows = []
 
-        # get the current video
-        video = get_video()
+    for team_name, team_points, rank, rank_delta in top_teams:
+        medal = MEDALS[rank - 1] if rank <= len(MEDALS) else f"{rank}."
 
-        question_1 = video.question_1
-        question_2 = video.question_2
+        # the ranks the team moved since the round started
+        if rank_delta > 0:
+            movement = f'<span class="rank_up">▲{rank_delta}</span>'
+        elif rank_delta < 0:
+            movement = f'<span class="rank_down">▼{-rank_delta}</span>'
+        else:
+            movement = ''
 
+        rows.append(f'<li style="color: {team_name_color(team_name)}">{medal} {escape(team_name)}  {team_points} {movement}</li>')
 
+    return f'<ol class="ranking">{"".join(rows)}</ol>'
 
-        if question_1 is None or question_1 == '-' or question_1 == '':
-            label_question_1 = gr.HTML(value="<h1>-</h1>", show_label=False, visible=False)
-            label_answer_1 = gr.HTML(value=f"<h1>{video.answer_1}</h1>", show_label=False)
-        else:
-            label_question_1 = gr.HTML(value=f"<h1><b>Frage 1: {video.question_1}</b></h1>", show_label=False, visible=True)
-            label_answer_1 = gr.HTML(value=f"<h1>{video.answer_1}</h1>", show_label=False, visible=is_show)
+def render_questions(video, is_show) -> list:
+    """
+    Render the questions of the answers tab and their answers, which are only shown in the show phase.
+    """
+    question_1 = video.question_1
+    question_2 = video.question_2
 
-        if question_2 is None or question_2 == '-' or question_2 == '':
-            label_question_2 = gr.HTML(value="<h1>-</h1>", show_label=False, visible=False)
-            label_answer_2 = gr.HTML(value=f"<h1>{video.answer_2}</h1>", show_label=False)
-        else:
-            label_question_2 = gr.HTML(value=f"<h1><b>Frage 2: {video.question_2}</b></h1>", show_label=False, visible=True)
-            label_answer_2 = gr.HTML(value=f"<h1>{video.answer_2}</h1>", show_label=False, visible=is_show)
+    if question_1 is None or question_1 == '-' or question_1 == '':
+        label_question_1 = gr.update(value="<h1>-</h1>", show_label=False, visible=False)
+        label_answer_1 = gr.update(value=f"<h1>{video.answer_1}</h1>", show_label=False)
+    else:
+        label_question_1 = gr.update(value=f"<h1><b>Frage 1: {video.question_1}</b></h1>", show_label=False, visible=True)
+        label_answer_1 = gr.update(value=f"<h1>{video.answer_1}</h1>", show_label=False, visible=is_show)
 
-        # True if there is a question 2
-        q2_exists = (video.question_2 is not None) and (not video.question_2 == '-') and (not video.question_2 == '')
+    if question_2 is None or question_2 == '-' or question_2 == '':
+        label_question_2 = gr.update(value="<h1>-</h1>", show_label=False, visible=False)
+        label_answer_2 = gr.update(value=f"<h1>{video.answer_2}</h1>", show_label=False)
+    else:
+        label_question_2 = gr.update(value=f"<h1><b>Frage 2: {video.question_2}</b></h1>", show_label=False, visible=True)
+        label_answer_2 = gr.update(value=f"<h1>{video.answer_2}</h1>", show_label=False, visible=is_show)
 
-        # get all teams, ordered by name
-        teams = session.query(Team).order_by(Team.name).all()
+    return [label_question_1, label_answer_1, label_question_2, label_answer_2]
 
-        session.close()
-        engine.dispose()
-        
-        # build round result labels
-        labels_team_names = [None for i in range(num_players)]
-        labels_points     = [None for i in range(num_players)]
-        labels_answers_1  = [None for i in range(num_players)]
-        labels_answers_2  = [None for i in range(num_players)]
-        
-        for i in range(num_players):
+@track('monitor.refresh_labels')
+def refresh_labels(page=0, room=DEFAULT_ROOM):
+    """
+    Fetch the answers and points of one page of teams from the database and the ranking from the leaderboard
+    and return them. Only the teams of the page are loaded, so the time and the size of the update
+    do not grow with the number of teams.
+    - page: the page of the scoreboard, starting with 0, wraps around after the last page
+    - room: the room the monitor shows
+
+    This returns a list of the labels that will be updated in the UI with the following order:
+    - Last Question
+    - Last Answer
+    - Scoreboard
+    - Ranking
+    """
+    # the revision is read first, so fragments are never cached for a newer state than they show
+    revision = get_cache(room).state_revision
 
-            if i >= len(teams):
-                current_team = None
-            else:
-                current_team = teams[i]
-
-            if current_team is not None:
-
-                string_correct_1 = answer_to_emoji(current_team.correct_1)
-                string_correct_2 = answer_to_emoji(current_team.correct_2)
-
-                team_color = TEAM_COLORS[i+1]
-
-                if is_show:
-                    text_answer_1 = f"{current_team.answer_1} {string_correct_1}"
-                    text_answer_2 = f"{current_team.answer_2} {string_correct_2}"
-                else:
-                    text_answer_1 = f"{current_team.answer_1}  "
-                    text_answer_2 = f"{current_team.answer_2}  "
-                
-                labels_team_names[i] = gr.Label(value=f"{current_team.name}", show_label=False, color=team_color)
-                labels_answers_1[i] = gr.Label(value=text_answer_1, show_label=False)
-
-                if q2_exists:
-                    labels_answers_2[i] = gr.Label(value=text_answer_2, show_label=False, visible=True)
-                else:
-                    labels_answers_2[i] = gr.Label(value="-", show_label=False, visible=False)
-                
-                labels_points[i] = gr.Label(value=f"{current_team.points}", show_label=False, visible=is_show)
-        
-        # build ranking labels
-        scores = {team.name: team.points for team in teams}
+    phase = get_phase(room)     # either 'show' or 'hide'
+    is_show = (phase == 'show')
 
-        sorted_scores = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+    # get the current video
+    video = shown_video(get_video(room))
 
-        labels_ranking = [None for i in range(num_players)]
+    # the questions and answers only change with the video and the phase
+    labels_questions = get_render_cache(room).get(('questions', video.id, phase), lambda: render_questions(video, is_show), revision)
 
-        for i in range(num_players):
-            if i < len(sorted_scores):
-                team_name, team_points = sorted_scores[i]
+    # True if there is a question 2
+    q2_exists = (video.question_2 is not None) and (not video.question_2 == '-') and (not video.question_2 == '')
 
-                team_number = team_name.split(" ")[1]
-                team_color = TEAM_COLORS[int(team_number)]
+    with session_scope() as session:
+        pages = max(1, math.ceil(count_teams(session, room) / SCOREBOARD_PAGE_SIZE))
+        page = page % pages
 
-                label_string = f"{team_name}  {team_points}"
+        # get the teams of this page, ordered by name, with their answers in this round
+        teams_with_answers = get_teams_with_answers(session, get_round_id(room), offset=page * SCOREBOARD_PAGE_SIZE, limit=SCOREBOARD_PAGE_SIZE, room=room)
 
-                if i == 0:
-                    label_string = f"🥇 {label_string}"
-                elif i == 1:
-                    label_string = f"🥈 {label_string}"
-                elif i == 2:
-                    label_string = f"🥉 {label_string}"
-                else:
-                    label_string = f"{label_string}"
+    label_scoreboard = gr.update(value=render_scoreboard(teams_with_answers, is_show, q2_exists, page, pages))
+    label_ranking = gr.update(value=render_ranking(get_cache(room).get_top_teams(RANKING_SIZE)), visible=is_show)
 
-                labels_ranking[i] = gr.Label(value=label_string, show_label=False, color=team_color, visible=is_show)
-        
-        # combine the label lists
-        all_labels = [label_question_1, label_answer_1, label_question_2, label_answer_2] + labels_team_names + labels_answers_1 + labels_answers_2 + labels_points + labels_ranking
+    return labels_questions + [label_scoreboard, label_ranking]
+
+def render_video_questions(video) -> list:
+    """
+    Render the questions of the video tab.
+    """
+    if video.question_1 is None or video.question_1 == '-' or video.question_1 == '':
+        label_vid_question_1 = gr.update(value="<h1>-</h1>", show_label=False, visible=False)
+    else:
+        label_vid_question_1 = gr.update(value=f"<h1>Frage 1: {video.question_1}</h1>", show_label=False, visible=True)
+
+    if video.question_2 is None or video.question_2 == '-' or video.question_2 == '':
+        label_vid_question_2 = gr.update(value="<h1>-</h1>", show_label=False, visible=False)
+    else:
+        label_vid_question_2 = gr.update(value=f"<h1>Frage 2: {video.question_2}</h1>", show_label=False, visible=True)
 
-        return all_labels
+    return [label_vid_question_1, label_vid_question_2]
+
+@track('monitor.refresh_labels_vid')
+def refresh_labels_vid(room=DEFAULT_ROOM):
+    """
+    Return the questions of the current video of a room, rendered once per video.
+    This returns a list of the labels that will be updated in the UI with the following order:
+    - Video Question 1
+    - Video Question 2
+    """
+    revision = get_cache(room).state_revision
+
+    # get the current video
+    video = shown_video(get_video(room))
+
+    return get_render_cache(room).get(('video_questions', video.id), lambda: render_video_questions(video), revision)
+
+def year_colors(video, phase, room=DEFAULT_ROOM) -> list:
+    """
+    Get the colors of the year grid of a room: the revealed years are highlighted, the year of the video only in the show phase.
+
+    returns a list of `(year, color)` tuples, from 1960 to 2019
+    """
+    years = set(get_selected_years(room))
+    H_BG, N_BG, C_BG = "#bfa43a", "#cccccc", "#ffcc25"
+
+    if video.answer_1 is not None and video.answer_1 != '':
+        video_year = int(video.answer_1)
+        years.add(video_year)
+    else:
+        video_year = None
     
-    def refresh_labels_vid():
+    is_show = (phase == 'show')
+
+    colors = []
+
+    for i in range(7 * 10):
+        year = 1960 + i
+        if year > 2019:
+            break
+
+        is_current_year = (year == video_year)
+        is_highlighted_year = (year in years)
+
+        if is_current_year and is_show:
+            color = C_BG
+        elif is_highlighted_year and not (not is_show and is_current_year):
+            color = H_BG
+        else:
+            color = N_BG
+
+        colors.append((year, color))
+
+    return colors
+
+def render_years(video, phase, room=DEFAULT_ROOM) -> list:
+    """
+    Render the year grid as one update per year label.
+    """
+    return [gr.update(elem_id=f"year_{year}", color=color) for year, color in year_colors(video, phase, room)]
+
+def render_years_html(video, phase, room=DEFAULT_ROOM) -> list:
+    """
+    Render the year grid as a single html component.
+    """
+    cells = ''.join(f'<div class="year_cell" style="background-color: {color}">{year}</div>' for year, color in year_colors(video, phase, room))
+
+    return [gr.update(value=f'<div class="year_grid_html">{cells}</div>')]
+
+# how the year grid is built, see build_monitor_app
+YEAR_GRID_RENDERERS = {
+    'labels': render_years,
+    'html': render_years_html,
+}
+
+@track('monitor.refresh_years')
+def refresh_years(year_grid=YEAR_GRID_MODE, room=DEFAULT_ROOM):
+    """
+    Return the year grid, rendered once per state of the game.
+    - year_grid: 'labels' for one update per year label, 'html' for a single update of the html grid
+    - room: the room the monitor shows
+    """
+    revision = get_cache(room).state_revision
+
+    # get the current video
+    video = shown_video(get_video(room))
+    phase = get_phase(room)
+
+    render = YEAR_GRID_RENDERERS[year_grid]
+
+    return get_render_cache(room).get(('years', year_grid, video.id, phase), lambda: render(video, phase, room), revision)
+
+def build_monitor_app(year_grid=YEAR_GRID_MODE, room=DEFAULT_ROOM) -> gr.Blocks:
+    """
+    Build the monitor website of a room, which plays the clips and shows the answers, the ranking and the revealed years.
+    The scoreboard shows all teams of the room, a page at a time.
+    - year_grid: 'labels' to build the year grid of 60 labels, 'html' to build it as a single html component
+    - room: the room the monitor shows
+    """
+    if year_grid not in YEAR_GRID_RENDERERS:
+        raise ValueError(f"Unknown year grid {year_grid}, use one of {', '.join(YEAR_GRID_RENDERERS)}")
+
+    def stream_updates():
         """
-        Fetch the current video questions and answers from the database and return them.
-        This returns a list of the labels that will be updated in the UI with the following order:
-        - Video Question 1
-        - Video Question 2
+        Push the monitor components to one browser whenever the game state or the teams change.
+        This is a generator that runs as long as the page is open. It blocks on the game state cache
+        and only yields when something changed or the next page of the scoreboard is due, so an idle game
+        with few teams causes no queries and no traffic.
+        The yielded list has the following order:
+        - Video Questions (see refresh_labels_vid)
+        - Answer Labels (see refresh_labels)
+        - Year Labels (see refresh_years)
         """
-        engine, session = connect_db()
+        cache = get_cache(room)
 
-        # get the current video
-        video = get_video()
+        revision = None
+        state_revision = None
+        teams_revision = None
 
-        if video.question_1 is None or video.question_1 == '-' or video.question_1 == '':
-            label_vid_question_1 = gr.HTML(value="<h1>-</h1>", show_label=False, visible=False)
-        else:
-            label_vid_question_1 = gr.HTML(value=f"<h1>Frage 1: {video.question_1}</h1>", show_label=False, visible=True)
+        # the page of the scoreboard this browser shows and when it was turned to
+        page = 0
+        page_shown = time.monotonic()
 
-        if video.question_2 is None or video.question_2 == '-' or video.question_2 == '':
-            label_vid_question_2 = gr.HTML(value="<h1>-</h1>", show_label=False, visible=False)
-        else:
-            label_vid_question_2 = gr.HTML(value=f"<h1>Frage 2: {video.question_2}</h1>", show_label=False, visible=True)
+        # the number of pages is counted again only when the teams changed
+        pages = None
+        pages_revision = None
 
-        session.close()
-        engine.dispose()
+        # the outputs last sent to this browser, unchanged components are skipped
+        rendered = None
 
-        return [label_vid_question_1, label_vid_question_2]
+        while True:
+            try:
+                if cache.teams_revision != pages_revision:
+                    pages = scoreboard_pages(room)
+                    pages_revision = cache.teams_revision
+                    page %= pages
 
-    def refresh_years():
-        years = set(get_selected_years())
-        H_BG, N_BG, C_BG = "#bfa43a", "#cccccc", "#ffcc25"
+                revision = cache.wait_for_change(revision, timeout=SCOREBOARD_PAGE_SECONDS if pages > 1 else STREAM_TIMEOUT)
 
-        # get the current video
-        video = get_video()
-        if video.answer_1 is not None and video.answer_1 != '':
-            video_year = int(video.answer_1)
-            years.add(video_year)
-        else:
-            video_year = None
-        
-        is_show = get_phase() == 'show'
+                state_changed = (cache.state_revision != state_revision)
+                teams_changed = (cache.teams_revision != teams_revision)
+                page_due = pages > 1 and time.monotonic() - page_shown >= SCOREBOARD_PAGE_SECONDS
 
-        update_list = []
+                if not state_changed and not teams_changed and not page_due:
+                    continue
 
-        for i in range(7 * 10):
-            year = 1960 + i
-            if year > 2019:
-                break
-            elem_id = "year_" + str(year)
+                if page_due:
+                    page = (page + 1) % pages
+                    page_shown = time.monotonic()
 
-            is_current_year = (year == video_year)
-            is_highlighted_year = (year in years)
+                with track('monitor.stream_updates'):
+                    # the revisions are read before rendering, so a change during rendering is rendered again
+                    next_state_revision = cache.state_revision
+                    next_teams_revision = cache.teams_revision
 
-            if is_current_year and is_show:
-                color = C_BG
-            elif is_highlighted_year and not (not is_show and is_current_year):
-                color = H_BG
-            else:
-                color = N_BG
+                    # the answers tab depends on both the state and the teams
+                    labels = refresh_labels(page, room)
 
-            update_list.append(gr.update(
-                elem_id=elem_id,
-                color=color,
-            ))
+                    if state_changed or rendered is None:
+                        updates = refresh_labels_vid(room) + labels + refresh_years(year_grid, room)
+                    else:
+                        # keep the video questions and the year grid as they are
+                        updates = rendered[:2] + labels + rendered[2 + len(labels):]
 
-        return update_list
+                    outputs, rendered = diff_updates(updates, rendered)
 
-    def play_video():
+                state_revision = next_state_revision
+                teams_revision = next_teams_revision
 
-        # get the game state
-        video = get_video()
-        video_filename = video.filename
+            except Exception as e:
+                # the page keeps its stream, the update is tried again after a pause
+                print(f"[monitor:{room}] Updating the page failed: {e!r}. Trying again in {STREAM_RETRY_DELAY}s")
+                time.sleep(STREAM_RETRY_DELAY)
+                revision = None
+                continue
 
-        video_path = f'{VIDEO_DIR}/clips/{video_filename}.mp4'
+            # nothing the browser shows has changed
+            if all(is_skip(output) for output in outputs):
+                continue
 
-        return video_path
-    
-    labels_team = [None for i in range(num_players)]
-    lables_answer_1 = [None for i in range(num_players)]
-    labels_answer_2 = [None for i in range(num_players)]
-    labels_points = [None for i in range(num_players)]
+            yield outputs
 
-    labels_ranking = [None for i in range(num_players)]
+    def play_video():
+
+        # get the game state
+        video = get_video(room)
+
+        # the clip is served by the /clips endpoint, not through gradio
+        return clip_player(video.filename)
     
     video = None
 
@@ -329,11 +438,33 @@ if __name__ == '__main__':
         font-weight: 700;                                           /* keeps the highlight look */
     }
 
+    .scoreboard {width: 100%; border-collapse: collapse; font-size: 20pt;}
+    .scoreboard td {padding: var(--size-1) var(--size-2); border-bottom: 1px solid #ccc;}
+    .scoreboard .team {font-weight: bold; white-space: nowrap;}
+    .scoreboard .points {text-align: right;}
+    .scoreboard_page {text-align: right; color: #888;}
+    .ranking {font-size: 20pt; font-weight: bold; list-style: none; padding: 0;}
+    .rank_up {color: #129a00;}
+    .rank_down {color: #b5100a;}
+
     #year_grid {
         display: grid !important;
         grid-template-columns: repeat(10, 1fr) !important;
         gap: var(--size-2) !important;
     }
+    .year_grid_html {
+        display: grid;
+        grid-template-columns: repeat(10, 1fr);
+        gap: var(--size-2);
+    }
+    .year_grid_html .year_cell {
+        font-size: 35pt;
+        font-weight: 700;
+        color: #000;
+        text-align: center;
+        padding: var(--size-1) var(--size-2);
+        border-radius: var(--radius-lg);
+    }
     #year_grid .output-class {
         min-width: 0 !important;          /* prevents wrap */
         text-align: center !important;
@@ -349,23 +480,8 @@ if __name__ == '__main__':
             label_vid_question_1 = gr.HTML(value="[FRAGE 1]", elem_classes=["center_text"])
             label_vid_question_2 = gr.HTML(value="[FRAGE 2]", elem_classes=["center_text"])
 
-            timer_vid_question = gr.Timer(5)  # periodic trigger
-            timer_vid_question.tick(
-                fn=lambda: refresh_labels_vid(),
-                inputs=[],
-                outputs=[label_vid_question_1, label_vid_question_2],
-                show_progress="hidden",
-            )
-
             with gr.Column():
-                video = gr.Video(
-                    height=720,
-                    width=1280,
-                    label="Video",
-                    show_label=False,
-                    interactive=True,
-                    autoplay=True
-                )
+                video = gr.HTML(value="", show_label=False)
         
             with gr.Row():
                 # play the video
@@ -384,66 +500,85 @@ if __name__ == '__main__':
 
             with gr.Row():
 
-                # the round results
+                # the round results, one page of teams at a time
                 with gr.Column(scale=3):
-                    for i in range(num_players):
-                        with gr.Row():
-                            labels_team[i]     = gr.Label(value=f"Refresh teams...", show_label=False, elem_id=f"label_team", scale=1, elem_classes=["small_text, no_padding"])
-                            lables_answer_1[i] = gr.Label(value=f"-", show_label=False, elem_id=f"label_answer", scale=3, elem_classes=["small_text", "no_padding"])
-                            labels_answer_2[i] = gr.Label(value=f"-", show_label=False, elem_id=f"label_answer", scale=3, elem_classes=["small_text", "no_padding"])
-                            labels_points[i]   = gr.Label(value=f"-", show_label=False, elem_id=f"label_points", scale=2, elem_classes=["small_text", "no_padding"])
-                
+                    label_scoreboard = gr.HTML(value="Refresh teams...")
+
                 # the ranking
                 with gr.Column(scale=1, elem_classes=["left_margin"]):
-                    for i in range(num_players):
-                        with gr.Row():
-                            labels_ranking[i] = gr.Label(value=f"-", show_label=False, elem_id=f"label_ranking", scale=1, elem_classes=["small_text", "no_padding"])
-            
+                    label_ranking = gr.HTML(value="-")
+
             # Create a button for refreshing the player labels
             button_refresh = gr.Button(value="Refresh")
 
             # create a list of all labels
-            all_labels = [label_question_1, label_answer_1, label_question_2, label_answer_2] + labels_team + lables_answer_1 + labels_answer_2 + labels_points + labels_ranking
-
-            # When the button is clicked, refresh_labels will be called and its outputs will update the player_labels
-            button_refresh.click(fn=refresh_labels, inputs=[], outputs=all_labels, show_progress="hidden")
-
-            timer_refresh = gr.Timer(5)
-            timer_refresh.tick(
-                fn=refresh_labels,
-                inputs=[],
-                outputs=all_labels,
-                show_progress="hidden",
-            )
+            all_labels = [label_question_1, label_answer_1, label_question_2, label_answer_2, label_scoreboard, label_ranking]
+
+            # When the button is clicked, refresh_labels will be called and its outputs will update the first page
+            button_refresh.click(fn=lambda: refresh_labels(0, room), inputs=[], outputs=all_labels, show_progress="hidden")
         
         year_labels = []
         with gr.Tab(label = "Jahre"):
 
-            # here we show the years from 1950 to 2020 in a 10x7 grid
-            with gr.Row(elem_id="year_grid"):           # single grid container
-                for year in range(1960, 2020):
-                    year_labels.append(
-                        gr.Label(
-                            value=str(year),
-                            elem_id=f"year_{year}",
-                            elem_classes=["big_text", "default"],
-                            show_label=False,
+            if year_grid == 'html':
+                # the whole grid is one component, rendered in a single pass, the stream fills it on load
+                year_labels.append(gr.HTML(value=""))
+            else:
+                # here we show the years from 1950 to 2020 in a 10x7 grid
+                with gr.Row(elem_id="year_grid"):           # single grid container
+                    for year in range(1960, 2020):
+                        year_labels.append(
+                            gr.Label(
+                                value=str(year),
+                                elem_id=f"year_{year}",
+                                elem_classes=["big_text", "default"],
+                                show_label=False,
+                            )
                         )
-                    )
-            # timer to refresh the label highlights
-            timer_year = gr.Timer(1)
-            timer_year.tick(
-                fn=refresh_years,
-                inputs=[],
-                outputs=year_labels,
-                show_progress="hidden",
-            )
-
-    print("Starting monitor on port 8000...")
-
-    demo.launch(
-        server_name='0.0.0.0',
-        server_port=8000,
-        debug=True,
-        auth=AUTH_CREDENTIALS if USE_AUTH else None,
-    )
\ No newline at end of file
+
+        # push updates to this browser whenever the game changes
+        # every open page keeps its stream running, so the stream must not be limited to one at a time
+        demo.load(
+            fn=stream_updates,
+            inputs=[],
+            outputs=[label_vid_question_1, label_vid_question_2] + all_labels + year_labels,
+            show_progress="hidden",
+            concurrency_limit=None,
+        )
+
+    return demo
+
+def add_monitor_routes(app: FastAPI, demo: gr.Blocks, path='/') -> FastAPI:
+    """
+    Serve the monitor and its clips on a FastAPI app.
+    The clips are served under /clips, next to the monitor, and shared by the monitors of all rooms.
+    """
+    add_clip_route(app)
+    return gr.mount_gradio_app(app, demo, path=path, auth=AUTH_CREDENTIALS if USE_AUTH else None)
+
+if __name__ == '__main__':
+
+    # get launch arguments
+    arguments = sys.argv[1:]
+
+    # `python -m src.monitor.monitor [number of players] [-g labels|html] [--rooms <room,room,...>]`, the number is not needed anymore,
+    # the scoreboard shows all teams of the room
+    year_grid = arguments[arguments.index('-g') + 1] if '-g' in arguments else YEAR_GRID_MODE
+
+    # with several rooms, the monitor of every room is served under /room/<room>
+    rooms = parse_rooms(arguments[arguments.index('--rooms') + 1]) if '--rooms' in arguments else [DEFAULT_ROOM]
+
+    # keep the current and the next clip in the page cache
+    start_prefetching(rooms)
+
+    start_metrics_server('monitor')
+
+    # the clips are served next to the gradio apps
+    app = FastAPI()
+
+    for room in rooms:
+        app = add_monitor_routes(app, build_monitor_app(year_grid, room), path=room_path(room, rooms) or '/')
+
+    print(f"Starting monitor of {', '.join(rooms)} on port 8000...")
+
+    uvicorn.run(app, host='0.0.0.0', port=8000)
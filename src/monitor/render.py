@@ -0,0 +1,116 @@
+from collections import OrderedDict
+from threading import Lock
+
+import gradio as gr
+
+from src.db.model import Video
+from src.metrics.metrics import RENDER_CACHE_LOOKUPS
+
+RENDER_CACHE_SIZE = 64      # rendered fragments kept, the least recently used ones are dropped first
+
+def copy_updates(updates):
+    """
+    Copy `gr.update(...)` dicts before they are handed to gradio, which removes their value while sending them.
+    - updates: a single update or a list of updates, other values are returned as they are
+    """
+    if isinstance(updates, list):
+        return [copy_updates(update) for update in updates]
+
+    return dict(updates) if isinstance(updates, dict) else updates
+
+def diff_updates(updates, rendered=None):
+    """
+    Replace the updates that are equal to the last rendered ones with skips,
+    so that only changed components are sent to the browser and re-rendered.
+    - updates: the new component values or `gr.update(...)` dicts, one per output
+    - rendered: the updates that were sent last time, None if nothing was sent yet
+
+    returns ```(outputs, rendered)```
+    - `outputs` [list] the updates to return to gradio, copies, so gradio can not change `rendered`
+    - `rendered` [list] the updates to compare against next time
+    """
+    updates = list(updates)
+
+    if rendered is None or len(rendered) != len(updates):
+        return copy_updates(updates), updates
+
+    outputs = [gr.skip() if update == last else copy_updates(update) for update, last in zip(updates, rendered)]
+
+    return outputs, updates
+
+def shown_video(video) -> Video:
+    """
+    Get the video to render: the given one, or a placeholder without questions and answers
+    if the game has no video yet, e.g. after the database was rebuilt without a reset.
+    """
+    if video is not None:
+        return video
+
+    return Video(id=None, title='', author='', question_1='-', answer_1='', question_2='-', answer_2='', filename=None)
+
+def is_skip(output) -> bool:
+    """
+    Check if an output is a skip from diff_updates.
+    """
+    return output == gr.skip()
+
+class RenderCache:
+    """
+    Rendered components by a key like `('years', video_id, phase)`, kept until the game state changes.
+    - maxsize (int): number of fragments kept, the least recently used ones are dropped first
+    - revision: the state revision the fragments were rendered for, see `GameStateCache.state_revision`
+    - hits (int), misses (int): the lookups so far
+
+    All browsers share the fragments, so they are copied on every lookup.
+    """
+
+    def __init__(self, maxsize=RENDER_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.revision = None
+        self.hits = 0
+        self.misses = 0
+
+        self._fragments = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, render, revision=None):
+        """
+        Get a rendered fragment, rendering it on the first lookup.
+        - key: what the fragment depends on besides the revision, e.g. `('questions', video.id)`
+        - render: function without arguments that renders the fragment
+        - revision: the current state revision, all fragments of an older revision are dropped
+        """
+        with self._lock:
+            if revision != self.revision:
+                self._fragments.clear()
+                self.revision = revision
+
+            if key in self._fragments:
+                self._fragments.move_to_end(key)
+                self.hits += 1
+                RENDER_CACHE_LOOKUPS.labels('hit').inc()
+                return copy_updates(self._fragments[key])
+
+            self.misses += 1
+
+        RENDER_CACHE_LOOKUPS.labels('miss').inc()
+        fragment = render()
+
+        with self._lock:
+            # the state may have changed while rendering
+            if revision == self.revision:
+                self._fragments[key] = fragment
+                while len(self._fragments) > self.maxsize:
+                    self._fragments.popitem(last=False)
+
+        return copy_updates(fragment)
+
+    def invalidate(self):
+        """
+        Drop all fragments.
+        """
+        with self._lock:
+            self._fragments.clear()
+
+    def __len__(self):
+        return len(self._fragments)
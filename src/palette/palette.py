@@ -0,0 +1,78 @@
+import colorsys
+
+import gradio as gr
+
+# the first teams keep their colors: a hex color on the monitor and the gradio hue of the same name on the answer websites
+BASE_COLORS = [
+    ('red', "#b5100a"),
+    ('blue', "#0d19ff"),
+    ('green', "#129a00"),
+    ('orange', "#c46d00"),
+    ('purple', "#7e15ff"),
+    ('cyan', "#00b2b5"),
+    ('gray', "#000000"),
+    ('pink', "#cd21bd"),
+]
+
+GOLDEN_ANGLE = 137.508              # degrees between the hues of two teams, so neighbours never get similar hues
+TEAM_LIGHTNESS = [0.36, 0.42, 0.30] # lightness of the team colors, alternating, so teams with close hues still differ
+TEAM_SATURATION = 0.85
+DEFAULT_COLOR = "#000000"           # color of a team without a number
+DEFAULT_HUE = 'gray'                # gradio hue of a team without a number
+
+# lightness of the shades of a gradio hue, from c50 to c950
+SHADE_LIGHTNESS = [0.97, 0.93, 0.86, 0.76, 0.64, 0.52, 0.44, 0.36, 0.29, 0.22, 0.15]
+
+def team_number(team_name):
+    """
+    Get the number of a team from its name, e.g. 12 for "Team 12".
+
+    returns the number, None if the name has no number
+    """
+    _, _, number = team_name.rpartition(' ')
+    return int(number) if number.isdigit() else None
+
+def team_hue(team_number) -> float:
+    """
+    Get the hue of a generated team color in degrees.
+    """
+    return ((team_number - len(BASE_COLORS)) * GOLDEN_ANGLE) % 360
+
+def hsl_to_hex(hue, saturation, lightness) -> str:
+    red, green, blue = colorsys.hls_to_rgb(hue / 360, lightness, saturation)
+    return f"#{round(red * 255):02x}{round(green * 255):02x}{round(blue * 255):02x}"
+
+def team_color(team_number) -> str:
+    """
+    Get the color of a team as hex, e.g. "#b5100a". The colors of teams after the base colors are generated,
+    so every team has its own color, however many teams there are.
+    """
+    if team_number is None or team_number < 1:
+        return DEFAULT_COLOR
+
+    if team_number <= len(BASE_COLORS):
+        return BASE_COLORS[team_number - 1][1]
+
+    lightness = TEAM_LIGHTNESS[team_number % len(TEAM_LIGHTNESS)]
+    return hsl_to_hex(team_hue(team_number), TEAM_SATURATION, lightness)
+
+def team_name_color(team_name) -> str:
+    """
+    Get the color of a team by its name, e.g. "Team 12".
+    """
+    return team_color(team_number(team_name))
+
+def team_theme_hue(team_number):
+    """
+    Get the hue of a gradio theme for a team, either the name of a gradio hue or a generated `gr.themes.Color`.
+    """
+    if team_number is None or team_number < 1:
+        return DEFAULT_HUE
+
+    if team_number <= len(BASE_COLORS):
+        return BASE_COLORS[team_number - 1][0]
+
+    hue = team_hue(team_number)
+    shades = [hsl_to_hex(hue, TEAM_SATURATION, lightness) for lightness in SHADE_LIGHTNESS]
+
+    return gr.themes.Color(*shades, name=f"team_{team_number}")
@@ -0,0 +1,43 @@
+import re
+
+DEFAULT_ROOM = 'main'       # the room of a deployment with a single game, it keeps the queue, paths and journal of the single game
+ROOM_PATTERN = re.compile(r'[a-z0-9][a-z0-9-]{0,31}')   # room ids end up in queue names, urls and file names
+
+def check_room(room) -> str:
+    """
+    Check that a room id can be used in queue names, urls and file names, e.g. "main" or "room-2".
+
+    returns the room id
+    """
+    if not ROOM_PATTERN.fullmatch(room):
+        raise ValueError(f"Invalid room {room!r}, use up to 32 lowercase letters, digits and dashes")
+
+    return room
+
+def parse_rooms(text) -> list:
+    """
+    Parse a comma separated list of rooms, e.g. "main,blue" from the `--rooms` option.
+
+    returns the rooms in the given order, without duplicates
+    """
+    rooms = []
+
+    for room in text.split(','):
+        room = check_room(room.strip())
+        if room not in rooms:
+            rooms.append(room)
+
+    return rooms
+
+def room_queue(room) -> str:
+    """
+    Get the queue the answers of a room are sent to: 'game' for the default room, 'game.<room>' for the others.
+    """
+    return 'game' if room == DEFAULT_ROOM else f'game.{room}'
+
+def room_path(room, rooms) -> str:
+    """
+    Get the url prefix of the websites of a room: none if the deployment has a single room, `/room/<room>` otherwise.
+    - rooms: all rooms of the deployment
+    """
+    return '' if len(rooms) == 1 else f'/room/{room}'
@@ -0,0 +1,359 @@
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from threading import Thread
+
+import aio_pika
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.db.model import Team, State, Round, RevealedYear
+from src.db.build import database_url, get_cache, get_phase, get_video, get_years, get_round_id, get_answer, add_points, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE
+from src.db.cache import notify_change
+from src.db.journal import journal_event
+from src.rooms.rooms import DEFAULT_ROOM, room_queue
+from src.client.publisher import mq_host
+from src.server.server import grade_messages, answer_to_emoji, POINTS_ON_CORRECT_ANSWER_2, CONSUMER_PREFETCH, CONSUMER_BATCH_SIZE, CONSUMER_BATCH_WAIT, CONSUMER_RETRY_DELAY, QUEUE_DEPTH_INTERVAL
+from src.metrics.metrics import track, instrument_engine, MESSAGE_SECONDS, BATCH_SIZE, CONSUMER_LAG_SECONDS, QUEUE_MESSAGES, FAILED_BATCHES
+
+# the async drivers of the databases
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+def async_database_url() -> str:
+    """
+    Get the connection string of the database with an async driver.
+    """
+    scheme, separator, rest = database_url().partition('://')
+    return ASYNC_DRIVERS.get(scheme, scheme) + separator + rest
+
+class ScoringCore:
+    """
+    Grades the answers and runs the admin actions on an asyncio event loop in its own thread.
+    - intakes (dict): the received answers by room, an asyncio.Queue of `(body, redelivered, received, settle)` tuples
+    - batch_size (int): maximum number of answers graded in one transaction
+    - batch_wait (float): seconds to wait for more answers before grading a batch
+
+    Receiving, grading and admin actions are separate tasks on the loop, each with its own
+    database connection, so a slow query of one of them does not hold up the others.
+    The answers of a room are graded in the order they were received by a single task, every room has its own.
+
+    Other threads and event loops (e.g. the handlers of gradio) run coroutines on the core with
+    `await core.call(core.set_phase('show'))` or `core.run(...)`.
+    """
+
+    def __init__(self, batch_size=CONSUMER_BATCH_SIZE, batch_wait=CONSUMER_BATCH_WAIT):
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+
+        self.loop = asyncio.new_event_loop()
+        self.intakes = {}
+        self.engine = None
+
+        self._sessions = None
+        self._thread = None
+
+    def start(self, consume=False, prefetch=CONSUMER_PREFETCH, rooms=(DEFAULT_ROOM,)):
+        """
+        Start the event loop and the grading tasks.
+        - consume: if True, the answers are consumed from the queues of the rooms in RabbitMQ
+        - prefetch: maximum number of unacknowledged answers the broker sends at once
+        - rooms: the rooms whose answers are graded
+        """
+        # load the game state before the loop reads it
+        for room in rooms:
+            get_cache(room).ensure_loaded()
+
+        self._thread = Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+
+        self.run(self._setup(rooms))
+
+        if consume:
+            for room in rooms:
+                self.loop.call_soon_threadsafe(self.loop.create_task, self.consume(prefetch, room))
+
+    def stop(self):
+        """
+        Cancel the tasks of the core, close its database connections and stop the event loop.
+        """
+        async def shutdown():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.engine.dispose()
+
+        self.run(shutdown())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+    async def _setup(self, rooms):
+        self.engine = create_async_engine(
+            async_database_url(),
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+        )
+        instrument_engine(self.engine.sync_engine, name='async')
+
+        self._sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+
+        for room in rooms:
+            self.intakes[room] = asyncio.Queue()
+            self.loop.create_task(self.grade_forever(room))
+
+    def run(self, coro):
+        """
+        Run a coroutine on the core from another thread and wait for its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def call(self, coro):
+        """
+        Run a coroutine on the core from another event loop and await its result.
+        """
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    @asynccontextmanager
+    async def session_scope(self):
+        """
+        Open an async session, committed when the block finishes and rolled back if it raises.
+        """
+        async with self._sessions() as session:
+            try:
+                yield session
+                await session.commit()
+            except:
+                await session.rollback()
+                raise
+
+    async def submit(self, body, redelivered=False, settle=None, room=DEFAULT_ROOM):
+        """
+        Hand an answer to the grading task of its room.
+        - body: the message, `team§answer_1§answer_2`
+        - redelivered: True if the broker has delivered this message before
+        - settle: coroutine function called with True after the answer is committed, False if grading failed
+        - room: the room the answer was sent to, it must have been started with the core
+        """
+        await self.intakes[room].put((body, redelivered, time.perf_counter(), settle))
+
+    async def score_messages(self, messages, room=DEFAULT_ROOM) -> int:
+        """
+        Grade a batch of answer messages in a single transaction, see `src.server.server.score_messages`.
+        """
+        # the game state is the same for the whole batch
+        phase = get_phase(room)
+        video = get_video(room)
+        years = get_years(room)
+        round_id = get_round_id(room)
+
+        async with self.session_scope() as session:
+            graded = await session.run_sync(grade_messages, messages, phase, video, years, round_id, room)
+
+        get_cache(room).touch_teams()
+
+        return graded
+
+    async def grade_forever(self, room=DEFAULT_ROOM):
+        """
+        Grade the answers of the intake of a room in batches. A batch is graded once it is full
+        or its first answer has waited `batch_wait` seconds.
+        """
+        intake = self.intakes[room]
+
+        while True:
+            batch = [await intake.get()]
+            deadline = self.loop.time() + self.batch_wait
+
+            while len(batch) < self.batch_size:
+                timeout = deadline - self.loop.time()
+                if timeout <= 0:
+                    break
+
+                try:
+                    batch.append(await asyncio.wait_for(intake.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                with track('score_messages'):
+                    await self.score_messages([(body, redelivered) for body, redelivered, received, settle in batch], room)
+            except Exception as e:
+                print(f"[core:{room}] Grading {len(batch)} messages failed: {e}")
+                FAILED_BATCHES.inc()
+
+                await self.settle_batch(batch, False, room)
+
+                await asyncio.sleep(CONSUMER_RETRY_DELAY)
+            else:
+                committed = time.perf_counter()
+
+                for body, redelivered, received, settle in batch:
+                    MESSAGE_SECONDS.observe(committed - received)
+
+                await self.settle_batch(batch, True, room)
+
+                BATCH_SIZE.observe(len(batch))
+
+    async def settle_batch(self, batch, committed, room=DEFAULT_ROOM):
+        """
+        Settle the messages of a batch. A message that can not be settled, e.g. because its channel was closed
+        by a reconnect, is only logged: the broker delivers it again, so the grading task keeps running.
+        - batch: the `(body, redelivered, received, settle)` tuples of the batch
+        - committed: True if the answers were committed, False if grading failed
+        """
+        for body, redelivered, received, settle in batch:
+            if settle is None:
+                continue
+
+            try:
+                await settle(committed)
+            except Exception as e:
+                print(f"[core:{room}] Could not settle message {body!r}: {e!r}. It is delivered again")
+
+    async def consume(self, prefetch=CONSUMER_PREFETCH, room=DEFAULT_ROOM):
+        """
+        Receive the answers of a room from its queue in RabbitMQ and hand them to the grading task of the room.
+        A message is acknowledged after its answer is committed, or given back if grading failed.
+        """
+        queue = room_queue(room)
+
+        while True:
+            try:
+                connection = await aio_pika.connect_robust(host=mq_host(), port=5672)
+
+                async with connection:
+                    channel = await connection.channel()
+                    await channel.set_qos(prefetch_count=prefetch)
+                    amqp_queue = await channel.declare_queue(queue, durable=True)
+
+                    watcher = asyncio.create_task(self.watch_queue(channel, queue))
+
+                    try:
+                        async with amqp_queue.iterator() as messages:
+                            async for message in messages:
+                                sent_at = (message.headers or {}).get('sent_at')
+                                if sent_at is not None:
+                                    CONSUMER_LAG_SECONDS.observe(max(0, time.time() - sent_at))
+
+                                await self.submit(message.body, message.redelivered, settle_message(message), room)
+                    finally:
+                        watcher.cancel()
+
+            except (aio_pika.exceptions.AMQPException, OSError) as e:
+                # unacknowledged messages are delivered again after reconnecting
+                print(f"[mq:{queue}] Connection lost: {e!r}. Reconnecting in {CONSUMER_RETRY_DELAY}s...")
+                await asyncio.sleep(CONSUMER_RETRY_DELAY)
+
+    async def watch_queue(self, channel, queue):
+        """
+        Report the number of waiting answers every QUEUE_DEPTH_INTERVAL seconds.
+        """
+        while True:
+            declared = await channel.declare_queue(queue, durable=True, passive=True)
+            QUEUE_MESSAGES.labels(queue).set(declared.declaration_result.message_count)
+            await asyncio.sleep(QUEUE_DEPTH_INTERVAL)
+
+    # admin actions, named like their sync versions in src.db.build and src.server.server
+
+    async def set_phase(self, phase, room=DEFAULT_ROOM):
+        with track('set_phase'):
+            async with self.session_scope() as session:
+                current_state = (await session.execute(select(State).filter_by(room=room))).scalars().first()
+
+                if current_state is None:
+                    session.add(State(room=room, phase=phase, video_id=None))
+                else:
+                    current_state.phase = phase
+
+                await session.run_sync(notify_change, 'state', room)
+                journal_event(session, 'phase', room=room, phase=phase)
+
+        get_cache(room).update(phase=phase)
+
+    async def set_video_id(self, video_id, room=DEFAULT_ROOM):
+        with track('set_video_id'):
+            async with self.session_scope() as session:
+
+                # start a new round
+                current_round = Round(room=room, video_id=video_id)
+                session.add(current_round)
+                await session.flush()
+
+                current_state = (await session.execute(select(State).filter_by(room=room))).scalars().first()
+
+                if current_state is None:
+                    current_state = State(room=room, phase='hide')
+                    session.add(current_state)
+
+                current_state.video_id = video_id
+                current_state.round_id = current_round.id
+
+                await session.run_sync(notify_change, 'state', room)
+                await session.run_sync(notify_change, 'teams', room)
+                journal_event(session, 'video', room=room, video_id=video_id, round_id=current_round.id)
+
+            # the video object is loaded by the cache with its own session
+            await asyncio.to_thread(get_cache(room).refresh, False)
+            get_cache(room).touch_teams()
+
+    async def add_selected_year(self, year, room=DEFAULT_ROOM) -> bool:
+        with track('add_selected_year'):
+            async with self.session_scope() as session:
+                current_state = (await session.execute(select(State).filter_by(room=room))).scalars().first()
+
+                if current_state is None:
+                    print("[years] No current state found")
+                    return False
+
+                existing = (await session.execute(select(RevealedYear).filter_by(room=room, year=year))).scalars().first()
+
+                if existing is not None:
+                    print(f"[years] Year {year} is already in the selected years list")
+                    return False
+
+                session.add(RevealedYear(room=room, year=year, round_id=current_state.round_id))
+                await session.run_sync(notify_change, 'state', room)
+                journal_event(session, 'year', room=room, year=year, round_id=current_state.round_id)
+
+            get_cache(room).add_year(year)
+
+            return True
+
+    async def grade_answer_2(self, team_name, correct_answer: bool, room=DEFAULT_ROOM):
+        with track('grade_answer_2'):
+            async with self.session_scope() as session:
+                team = (await session.execute(select(Team).filter_by(room=room, name=team_name))).scalars().first()
+
+                if team:
+                    round_id = get_round_id(room)
+                    answer = await session.run_sync(get_answer, team.id, round_id, True)
+
+                    if answer.correct_2 is None:
+                        added_points = POINTS_ON_CORRECT_ANSWER_2 if correct_answer else 0
+                        add_points(session, team, added_points)
+                        answer.correct_2 = "correct" if correct_answer else "incorrect"
+                        await session.run_sync(notify_change, 'teams', room)
+                        journal_event(session, 'grade_2', room=room, team=team_name, round_id=round_id, correct_2=answer.correct_2, points=added_points)
+
+                        emoji = answer_to_emoji(answer.correct_2)
+                        print(f"[points] {emoji} Gave {team_name} {added_points} points for answer 2")
+
+            get_cache(room).touch_teams()
+
+def settle_message(message):
+    """
+    Get the settle function of a RabbitMQ message for `ScoringCore.submit`.
+    """
+    async def settle(committed):
+        if committed:
+            await message.ack()
+        else:
+            await message.nack(requeue=True)
+
+    return settle
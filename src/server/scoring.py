@@ -0,0 +1,184 @@
+from bisect import bisect_left, bisect_right, insort
+
+MIN_YEAR = 1959     # lower bound of the correct range if no smaller year is selected
+MAX_YEAR = 2020     # upper bound of the correct range if no larger year is selected
+
+def parse_answer_year(answer):
+    """
+    Get the year from an answer by removing all non-numeric characters.
+
+    returns the year as an int, None if the answer has no digits
+    """
+    if answer is None:
+        return None
+
+    digits = ''.join(filter(str.isdigit, answer))
+    return int(digits) if digits else None
+
+class YearIndex:
+    """
+    The selected years, kept sorted.
+    - years (list): the sorted years without duplicates
+
+    Adding a year keeps the list sorted, so the neighbours of a year are found
+    with a binary search instead of scanning and re-sorting all years.
+    """
+
+    def __init__(self, years=()):
+        self.years = sorted(set(years))
+
+    def add(self, year) -> bool:
+        """
+        Add a year.
+
+        returns False if the year was already selected
+        """
+        if year in self:
+            return False
+
+        insort(self.years, year)
+        return True
+
+    def neighbours(self, year):
+        """
+        Get the next smaller and the next larger selected year of the given year.
+        Falls back to MIN_YEAR and MAX_YEAR if there is none.
+
+        returns ```(next_smaller_year, next_larger_year)```
+        """
+        i = bisect_left(self.years, year)
+        j = bisect_right(self.years, year)
+
+        next_smaller_year = self.years[i - 1] if i > 0 else MIN_YEAR
+        next_larger_year = self.years[j] if j < len(self.years) else MAX_YEAR
+
+        return next_smaller_year, next_larger_year
+
+    def grade(self, answer_year, video_year) -> str:
+        """
+        Grade a single year answer, see grade_batch.
+        """
+        return self.grade_batch([answer_year], video_year)[0]
+
+    def grade_batch(self, answer_years, video_year) -> list:
+        """
+        Grade the year answers of several teams for the same video.
+        An answer is 'perfect' if it is the year of the video and 'correct' if it lies
+        between the next smaller and the next larger selected year, otherwise 'incorrect'.
+        - answer_years: the answered years as ints, None for answers without a year
+        - video_year: the year of the current video
+
+        returns the list of grades, in the order of the answers
+        """
+        # the range is the same for all answers, so it is looked up once
+        next_smaller_year, next_larger_year = self.neighbours(video_year)
+
+        grades = []
+        for answer_year in answer_years:
+            if answer_year is not None and answer_year == video_year:
+                grades.append("perfect")
+            elif answer_year is not None and next_smaller_year < answer_year < next_larger_year:
+                grades.append("correct")
+            else:
+                grades.append("incorrect")
+
+        return grades
+
+    def copy(self):
+        index = YearIndex()
+        index.years = list(self.years)
+        return index
+
+    def __contains__(self, year):
+        i = bisect_left(self.years, year)
+        return i < len(self.years) and self.years[i] == year
+
+    def __iter__(self):
+        return iter(self.years)
+
+    def __len__(self):
+        return len(self.years)
+
+def team_order_key(team_name):
+    """
+    Order team names with numbers in order, so "Team 10" comes after "Team 9", like `src.db.build.team_order`.
+    """
+    return (len(team_name), team_name)
+
+class Leaderboard:
+    """
+    The points of all teams, kept sorted by rank.
+    - entries (list): sorted `(-points, order_key, name)` tuples, the best team first
+    - points (dict): the points of every team, by name
+    - round_ranks (dict): the rank of every team when the current round started
+
+    A change of points moves one entry with a binary search instead of sorting all teams,
+    the rank of a team is found with a binary search and the top teams are the first entries.
+    Teams with the same points share a rank, the next rank is skipped (1, 2, 2, 4).
+    """
+
+    def __init__(self, points=None):
+        self.points = dict(points or {})
+        self.entries = sorted((-team_points, team_order_key(name), name) for name, team_points in self.points.items())
+        self.round_ranks = {}
+
+    def _entry(self, name):
+        return (-self.points[name], team_order_key(name), name)
+
+    def set(self, name, points):
+        """
+        Set the points of a team, a new team is added.
+        """
+        if name in self.points:
+            del self.entries[bisect_left(self.entries, self._entry(name))]
+
+        self.points[name] = points
+        insort(self.entries, self._entry(name))
+
+    def add(self, name, points):
+        """
+        Add points to a team, a new team starts with 0 points.
+        """
+        self.set(name, self.points.get(name, 0) + points)
+
+    def rank(self, name):
+        """
+        Get the rank of a team, starting with 1.
+
+        returns the rank, None if the team is unknown
+        """
+        if name not in self.points:
+            return None
+
+        # the number of teams with more points
+        return bisect_left(self.entries, (-self.points[name],)) + 1
+
+    def rank_delta(self, name) -> int:
+        """
+        Get the number of ranks a team has moved up since the round started, negative if it moved down.
+        """
+        previous = self.round_ranks.get(name)
+        if previous is None or name not in self.points:
+            return 0
+
+        return previous - self.rank(name)
+
+    def top(self, k) -> list:
+        """
+        Get the best teams.
+
+        returns a list of `(name, points, rank, rank_delta)` tuples, the best team first
+        """
+        return [(name, self.points[name], self.rank(name), self.rank_delta(name)) for _, _, name in self.entries[:k]]
+
+    def start_round(self):
+        """
+        Remember the ranks of all teams, the rank deltas are counted from here.
+        """
+        self.round_ranks = {name: self.rank(name) for name in self.points}
+
+    def __contains__(self, name):
+        return name in self.points
+
+    def __len__(self):
+        return len(self.points)
@@ -1,12 +1,23 @@
 import pika
-import os
+import sqlalchemy.exc
 import sys
 import gradio as gr
 import random
+import time
+import asyncio
 from threading import Thread
-
-from src.db.model import Team, Video, State
-from src.db.build import build, connect_db, set_phase, get_phase, get_video
+from fastapi import FastAPI
+import uvicorn
+
+from src.db.model import Team, Video, State, Round, Answer, RevealedYear
+from src.db.build import build, session_scope, set_phase, get_phase, get_video, get_cache, set_video_id, get_years, add_selected_year, get_round_id, get_answer, get_teams_with_answers, add_points
+from src.server.scoring import parse_answer_year
+from src.monitor.render import diff_updates, is_skip, shown_video
+from src.db.cache import notify_change
+from src.db.journal import open_journal, get_journal, journal_event, journal_teams, restore_state, journal_path
+from src.rooms.rooms import DEFAULT_ROOM, parse_rooms, room_queue, room_path
+from src.transport.transport import RabbitTransport
+from src.metrics.metrics import track, start_metrics_server, MESSAGE_SECONDS, BATCH_SIZE, CONSUMER_LAG_SECONDS, QUEUE_MESSAGES, FAILED_BATCHES, REJECTED_MESSAGES
 
 START_VIDEO_INDEX = 28                  # index of the first video to show. set to 28 for day 2
 
@@ -22,6 +33,17 @@ RESET_PHASE_ON_NEXT_VIDEO = True        # if True, resets the phase to 'hide' wh
 USE_AUTH = True                         # if True, requires authentication to access the server
 AUTH_CREDENTIALS = ('admin', 'admin')   # credentials for authentication
 
+CONSUMER_PREFETCH = 64                  # maximum number of unacknowledged answers the broker sends at once, set with -p <n>
+CONSUMER_BATCH_SIZE = 32                # maximum number of answers graded in one transaction
+CONSUMER_BATCH_WAIT = 0.05              # seconds to wait for more answers before grading a batch
+CONSUMER_RETRY_DELAY = 2                # seconds to wait after a failed batch or a lost connection
+QUEUE_DEPTH_INTERVAL = 5                # seconds between checking the number of waiting answers
+
+ADMIN_STREAM_TIMEOUT = 30               # seconds the label stream of an admin page waits for a change before checking again
+ADMIN_STREAM_RETRY_DELAY = 2            # seconds the label stream waits after a failed update before trying again
+
+ADMIN_PORT = 7999                       # port of the admin website, with several rooms every room is served under /room/<room>
+
 def answer_to_emoji(answer) -> str:
     if answer == None or answer == '':
         return "❔"
@@ -36,344 +58,523 @@ def answer_to_emoji(answer) -> str:
     else:
         return "❗️"
 
-if __name__ == '__main__':
-
-    # get launch arguments
-    arguments = sys.argv[1:]
-
-    if len(arguments) < 1:
-        print('Usage: python -m src.server.server <number of players>')
-        sys.exit(1)
-
-    # Number of players - this can be parameterized
-    num_players = int(arguments[0])
-    players = {"-" for i in range(num_players)}
-
-    # rebuild
-    if '-b' in arguments:
-        build(verbose=True)
-    
-    # reset the game state
-    if '-r' in arguments:
-        engine, session = connect_db()
-
-        # get the state
-        current_state = session.query(State).first()
+def accept_answer(session, team_name, answer_1, answer_2, phase, video, round_id, redelivered=False, room=DEFAULT_ROOM):
+    """
+    Check one answer of a team and store it inside the given session. Does not commit.
+    - session: the session of the current batch
+    - team_name: the name of the team, e.g. "Team 1"
+    - answer_1: the answer to question 1 (the year)
+    - answer_2: the answer to question 2
+    - phase: the current phase of the game
+    - video: the current video
+    - round_id: the id of the current round
+    - redelivered: True if the broker has delivered this message before
+    - room: the room of the team
+
+    returns ```(team, answer)``` if the answer has to be graded, otherwise None
+    """
+    # get the team with the team name
+    team = session.query(Team).filter_by(room=room, name=team_name).first()
+
+    if team is None:
+        print(f"[msg:{team_name}] Team {team_name} not found. Skipping message...")
+        return None
+
+    journal_teams(session, [team_name], room)
+
+    if round_id is None:
+        print("[round] No current round found. Skipping message...")
+        return None
+
+    # get the answers of the team in this round
+    answer = get_answer(session, team.id, round_id, create=True)
+
+    if redelivered and answer.answer_1 == answer_1 and answer.answer_2 == answer_2 and answer.correct_1:
+        # the answer was committed before the message could be acknowledged
+        print(f"[msg:{team_name}] answer was already graded. Skipping message...")
+        return None
+
+    if ACCEPT_REDO_EMPTY_ANSWERS and (answer_1 == '' or answer_2 == ''):
+        # if the team has already sent an answer, we do not accept empty answers
+        if answer.answer_1 != '' or answer.answer_2 != '':
+            print(f"[msg:{team_name}] sent empty answer. Skipping message...")
+            return None
 
-        if current_state is None:
-            print("[state] No current state found. Creating a new state...")
-            current_state = State(phase='hide', selected_years=None, video_id=START_VIDEO_INDEX)
-            session.add(current_state)
+    if phase == 'show' and not ACCEPT_LATE_ANSWERS:
+        print(f"[msg:{team_name}] sent late answer. Skipping message...")
+        answer.correct_1 = "late"
+        answer.correct_2 = "late"
+        journal_event(session, 'late', room=room, team=team_name, round_id=round_id)
+        return None
+
+    # the current video must have a year to grade against
+    if video is None:
+        print("[video] No current video found. Skipping message...")
+        return None
+
+    if video.answer_1 is None or video.answer_1 == '':
+        print("[video] No answer_1 found for the video. Skipping message...")
+        return None
+
+    # update the team's answer
+    answer.answer_1 = answer_1
+    answer.answer_2 = answer_2
+
+    return team, answer
+
+def grade_messages(session, messages, phase, video, years, round_id, room=DEFAULT_ROOM) -> int:
+    """
+    Grade a batch of answer messages inside the given session. Does not commit.
+    Points are added in the database (`points = points + n`), so they can not overwrite points
+    given by the admin at the same time.
+    - session: the session of the batch
+    - messages: list of `(body, redelivered)` tuples, in the order they were received
+    - phase, video, years, round_id: the game state the batch is graded against
+    - room: the room the messages were sent to
+
+    returns the number of graded answers
+    """
+    accepted = []
+    for body, redelivered in messages:
+
+        # messages have the format team§answer_1§answer_2
+        # split the message into the team and the answers
+        try:
+            team_name, answer_1, answer_2 = body.decode().split('§')
+        except ValueError:
+            print(f"[msg] Invalid message {body!r}. Skipping message...")
+            continue
+
+        result = accept_answer(session, team_name, answer_1, answer_2, phase, video, round_id, redelivered, room)
+
+        if result is not None:
+            team, answer = result
+            accepted.append((team, answer, parse_answer_year(answer_1)))
+
+    if accepted:
+        # grade all accepted answers against the range of the video year at once
+        video_year = int(video.answer_1)
+        grades = years.grade_batch([answer_year for team, answer, answer_year in accepted], video_year)
+
+        for (team, answer, answer_year), grade in zip(accepted, grades):
+            answer.correct_1 = grade
+            added_points = 0
+
+            if grade == "perfect":
+                added_points = POINTS_ON_PERFECT_ANSWER_1
+                emoji = answer_to_emoji(grade)
+                print(f"[msg:{team.name}] {emoji} answered perfectly for question 1: {answer_year}")
+            elif grade == "correct":
+                added_points = POINTS_ON_CORRECT_ANSWER_1
+                print(f"[msg:{team.name}] {grade} answered correctly for question 1: {answer_year}")
+            else:
+                print(f"[msg:{team.name}] {grade} answered incorrectly for question 1: {answer_year}")
 
-        current_state.phase = 'hide'
-        current_state.selected_years = None
-        current_state.video_id = START_VIDEO_INDEX
+            add_points(session, team, added_points)
 
-        print(f"> Resetting phase to 'hide' and selected years to None...")
+            journal_event(session, 'answer', room=room, team=team.name, round_id=round_id, answer_1=answer.answer_1, answer_2=answer.answer_2, correct_1=grade, points=added_points)
 
-        # reset all team scores to 0
-        teams = session.query(Team).all()
+    notify_change(session, 'teams', room)
 
-        for team in teams:
-            team.points = 0
-            team.answer_1 = ''
-            team.answer_2 = ''
-            team.correct_1 = ''
-            team.correct_2 = ''
+    return len(accepted)
 
-        print(f"> Resetting all teams' scores to 0 and answers to empty...")
+def score_messages(messages, room=DEFAULT_ROOM) -> int:
+    """
+    Grade a batch of answer messages in a single transaction.
+    - messages: list of `(body, redelivered)` tuples, in the order they were received
+    - room: the room the messages were sent to
 
-        # commit and close
-        session.commit()
-        session.close()
-        engine.dispose()
+    returns the number of graded answers
+    """
+    # the game state is the same for the whole batch
+    phase = get_phase(room)
+    video = get_video(room)
+    years = get_years(room)
+    round_id = get_round_id(room)
 
-        print("> Done!")
+    with session_scope() as session:
+        graded = grade_messages(session, messages, phase, video, years, round_id, room)
 
-    def get_players():
-        """
-        Get the list of players in the game.
-        """
-        engine, session = connect_db()
-        teams = session.query(Team).all()
-        session.close()
-        engine.dispose()
+    get_cache(room).touch_teams()
 
-        global players
-        players = {team.name: team.answer for team in teams}
+    return graded
 
-        return players
+def callback(ch, method, properties, body):
+    """
+    Grade a single message. Used as a pika `on_message_callback` with `auto_ack=True`.
+    """
+    start = time.perf_counter()
 
-    def callback(ch, method, properties, body):
+    with track('callback'):
+        graded = score_messages([(body, method.redelivered)]) > 0
 
-        # messages have the format team:answer
-        # split the message into the team and the message
-        team_name, answer_1, answer_2 = body.decode().split('§')
+    MESSAGE_SECONDS.observe(time.perf_counter() - start)
 
-        engine, session = connect_db()
+    return graded
 
-        # get the team with the team name
-        team = session.query(Team).filter_by(name=team_name).first()
+def score_one_by_one(channel, batch, room=DEFAULT_ROOM) -> bool:
+    """
+    Grade the messages of a batch that failed before one at a time, so one bad message does not block the queue.
+    A message that fails on its own is rejected, unless the database can not be reached: then it and
+    the rest of the batch are given back to the broker.
+    - channel: the channel the batch was received on
+    - batch: the `(method, body, received)` tuples of the batch
 
-        if team is None:
-            print(f"[msg:{team_name}] Team {team_name} not found. Exiting callback...")
-            session.close()
-            engine.dispose()
+    returns False if the rest of the batch was given back
+    """
+    for i, (method, body, received) in enumerate(batch):
+        try:
+            with track('score_messages'):
+                score_messages([(body, method.redelivered)], room)
+        except sqlalchemy.exc.OperationalError as e:
+            print(f"[mq:{room_queue(room)}] Database not reachable: {e}")
+            channel.basic_nack(delivery_tag=batch[-1][0].delivery_tag, multiple=True, requeue=True)
             return False
+        except Exception as e:
+            print(f"[mq:{room_queue(room)}] Grading message {body!r} failed on its own: {e!r}. Rejecting it...")
+            REJECTED_MESSAGES.inc()
+            channel.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+        else:
+            channel.basic_ack(delivery_tag=method.delivery_tag)
+            MESSAGE_SECONDS.observe(time.perf_counter() - received)
+
+    return True
+
+def consume_messages(prefetch=CONSUMER_PREFETCH, batch_size=CONSUMER_BATCH_SIZE, batch_wait=CONSUMER_BATCH_WAIT, connect=None, room=DEFAULT_ROOM):
+    """
+    Consume the answers of a room from its queue ('game' for the default room) and grade them in batches.
+    A batch is graded once it is full or its first message has waited `batch_wait` seconds.
+    The messages are acknowledged after the batch is committed, so answers that were not
+    committed yet are delivered again after a crash or a lost connection.
+    A batch that fails is delivered again, and if it fails again, its messages are graded one at a time
+    and a message that keeps failing is rejected, see `score_one_by_one`.
+    - prefetch: maximum number of unacknowledged messages the broker sends to this consumer
+    - batch_size: maximum number of messages graded in one transaction
+    - batch_wait: seconds to wait for more messages before grading a batch
+    - connect: function that opens the broker connection, defaults to `RabbitTransport().connect`
+    - room: the room whose answers are consumed, every room has its own consumer
+    """
+    if connect is None:
+        connect = RabbitTransport().connect
+
+    queue = room_queue(room)
+
+    while True:
+        try:
+            connection = connect()
+            channel = connection.channel()
+            channel.queue_declare(queue=queue, durable=True)
+            channel.basic_qos(prefetch_count=prefetch)
+
+            batch = []
+            batch_start = None
+            depth_checked = 0
+
+            for method, properties, body in channel.consume(queue=queue, inactivity_timeout=batch_wait):
+
+                if time.monotonic() - depth_checked >= QUEUE_DEPTH_INTERVAL:
+                    declared = channel.queue_declare(queue=queue, durable=True, passive=True)
+                    QUEUE_MESSAGES.labels(queue).set(declared.method.message_count)
+                    depth_checked = time.monotonic()
+
+                if method is not None:
+                    if not batch:
+                        batch_start = time.monotonic()
+                    batch.append((method, body, time.perf_counter()))
+
+                    # the publisher stamps the time it sent the answer
+                    headers = properties.headers if properties is not None else None
+                    if headers and 'sent_at' in headers:
+                        CONSUMER_LAG_SECONDS.observe(max(0, time.time() - headers['sent_at']))
+
+                if not batch:
+                    continue
+
+                batch_full = len(batch) >= batch_size
+                batch_due = time.monotonic() - batch_start >= batch_wait
+
+                if not batch_full and not batch_due:
+                    continue
+
+                try:
+                    with track('score_messages'):
+                        score_messages([(body, method.redelivered) for method, body, received in batch], room)
+                except Exception as e:
+                    print(f"[mq:{queue}] Grading {len(batch)} messages failed: {e}")
+                    FAILED_BATCHES.inc()
+
+                    if any(method.redelivered for method, body, received in batch):
+                        # the batch has failed before, so one of its messages may never be graded
+                        if not score_one_by_one(channel, batch, room):
+                            time.sleep(CONSUMER_RETRY_DELAY)
+                    else:
+                        # nothing was committed, so the broker should deliver the batch again
+                        channel.basic_nack(delivery_tag=batch[-1][0].delivery_tag, multiple=True, requeue=True)
+                        time.sleep(CONSUMER_RETRY_DELAY)
+                else:
+                    committed = time.perf_counter()
+                    channel.basic_ack(delivery_tag=batch[-1][0].delivery_tag, multiple=True)
+
+                    for method, body, received in batch:
+                        MESSAGE_SECONDS.observe(committed - received)
+                    BATCH_SIZE.observe(len(batch))
+
+                batch = []
+
+        except pika.exceptions.AMQPError as e:
+            # unacknowledged messages are delivered again after reconnecting
+            print(f"[mq] Connection lost: {e}. Reconnecting in {CONSUMER_RETRY_DELAY}s...")
+            time.sleep(CONSUMER_RETRY_DELAY)
+
+def rank_delta_text(rank_delta) -> str:
+    """
+    Describe the ranks a team moved since the round started, e.g. " ▲2".
+    """
+    if rank_delta > 0:
+        return f" ▲{rank_delta}"
+    elif rank_delta < 0:
+        return f" ▼{-rank_delta}"
+    else:
+        return ""
 
-        if ACCEPT_REDO_EMPTY_ANSWERS and (answer_1 == '' or answer_2 == ''):
-            # if the team has already sent an answer, we do not accept empty answers
-            if team.answer_1 != '' or team.answer_2 != '':
-                print(f"[msg:{team_name}] sent empty answer. Exiting callback...")
-                session.close()
-                engine.dispose()
-                return False        
-
-        if get_phase() == 'show' and not ACCEPT_LATE_ANSWERS:
-            print(f"[msg:{team_name}] sent late answer. Exiting callback...")
-            team.correct_1 = "late"
-            team.correct_2 = "late"
-            session.commit()
-            session.close()
-            engine.dispose()
-            return False
-        
-        # update the team's answer
-        team.answer_1 = answer_1
-        team.answer_2 = answer_2
+def render_labels(num_players, room=DEFAULT_ROOM):
+    """
+    Fetch current players' answers and points from the database and return the label values.
+    - num_players: the number of team labels on the admin page
+    - room: the room of the admin page
+    """
+    with session_scope() as session:
 
-        # calculate the points based on the answers
-        # try to convert answer_1 to an integer
-        # remove all non-numeric characters from answer_1
-        answer_1 = ''.join(filter(str.isdigit, answer_1))
-        answer_1 = int(answer_1) if answer_1 else None
+        # get all teams, ordered by name, with their answers in this round
+        teams = get_teams_with_answers(session, get_round_id(room), room=room)
 
-        # get the current video
-        video = get_video()
-        if video is None:
-            print("[video] No current video found. Exiting callback...")
-            session.close()
-            engine.dispose()
-            return False
-        
-        # get the year of the video
-        if video.answer_1 is None or video.answer_1 == '':
-            print("[video] No answer_1 found for the video. Exiting callback...")
-            session.close()
-            engine.dispose()
-            return False
-        
-        video_year = int(video.answer_1)
+        # teams that have not answered yet are only seen here
+        journal_teams(session, [team.name for team, answer in teams], room)
 
-        # get the range of correct years
-        # the correct year is the next smaller year to next larger year compared to the year of the video
-        # you get the selected years from the current state
-        selected_years = get_selected_years()
-
-        min_year = 1959
-        max_year = 2020
-
-        # find the next smaller and next larger year
-        next_smaller_year = None
-        next_larger_year = None
-
-        for year in selected_years:
-            if year < video_year:
-                if next_smaller_year is None or year > next_smaller_year:
-                    next_smaller_year = year
-            elif year > video_year:
-                if next_larger_year is None or year < next_larger_year:
-                    next_larger_year = year
-        
-        next_smaller_year = next_smaller_year if next_smaller_year is not None else min_year
-        next_larger_year = next_larger_year if next_larger_year is not None else max_year
+    player_labels = ["No Team connected" for i in range(num_players)]
+    player_labels_correct = ["🔄️" for i in range(num_players)]
 
-        # check if the answer is correct
-        if answer_1 is not None and answer_1 == video_year:
-            team.correct_1 = "perfect"
-            team.points += POINTS_ON_PERFECT_ANSWER_1
+    for i in range(num_players):
 
-            emoji = answer_to_emoji(team.correct_1)
-            print(f"[msg:{team_name}] {emoji} answered perfectly for question 1: {answer_1}")
-        
-        elif answer_1 is not None and next_smaller_year < answer_1 < next_larger_year:
-            team.correct_1 = "correct"
-            team.points += POINTS_ON_CORRECT_ANSWER_1
-            print(f"[msg:{team_name}] {team.correct_1} answered correctly for question 1: {answer_1}")
-        
+        if i >= len(teams):
+            current_team = None
         else:
-            team.correct_1 = "incorrect"
-            print(f"[msg:{team_name}] {team.correct_1} answered incorrectly for question 1: {answer_1}")
-
-        # commit the changes
-        session.commit()
-
-        # close the database connection
-        session.close()
-        engine.dispose()
-
-        return True
-    
-    def get_selected_years():
-        """
-        Get the selected years from the current state.
-        """
-        engine, session = connect_db()
-
-        # get the current state
-        current_state = session.query(State).first()
-
-        if current_state is None:
-            print("[years] No current state found")
-            session.close()
-            engine.dispose()
-            return []
+            current_team, current_answer = teams[i]
 
-        if current_state.selected_years is None:
-            # print("[state] No selected years found") # quite spammy
-            session.close()
-            engine.dispose()
-            return []
+        if current_team is not None:
+            answer_1 = current_answer.answer_1 if current_answer else ''
+            answer_2 = current_answer.answer_2 if current_answer else ''
 
-        # split the selected years by comma and return them as a list
-        selected_years = current_state.selected_years.split(',')
+            # the rank comes from the leaderboard, the teams are not sorted here
+            rank, rank_delta = get_cache(room).get_rank(current_team.name)
+            rank_text = f", #{rank}{rank_delta_text(rank_delta)}" if rank is not None else ""
 
-        # sort the years
-        selected_years = sorted([int(year.strip()) for year in selected_years if year.strip().isdigit()])
+            player_labels[i] = f"{current_team.name}: {answer_1}; {answer_2} ({current_team.points}{rank_text})"
 
-        session.close()
-        engine.dispose()
+            label_correct_1 = answer_to_emoji(current_answer.correct_1 if current_answer else None)
+            label_correct_2 = answer_to_emoji(current_answer.correct_2 if current_answer else None)
 
-        return selected_years
+            player_labels_correct[i] = f"{label_correct_1} {label_correct_2}"
     
-    def add_selected_year(year):
-        """
-        Add the given year to the current state.
-        """
-        engine, session = connect_db()
-
-        # get the current state
-        current_state = session.query(State).first()
-
-        if current_state is None:
-            print("[years] No current state found")
-
-            session.close()
-            engine.dispose()
-            return False
-
-        # do we have a selected years list?
-        if current_state.selected_years is None:
-            current_state.selected_years = str(year)
-        else:
-            # check if the year is already in the list
-            current_years = get_selected_years()
-            if year in current_years:
-                print(f"[years] Year {year} is already in the selected years list")
-                session.close()
-                engine.dispose()
-                return False
-            
-            # add the year to the selected years
-            current_state.selected_years = f"{current_state.selected_years},{year}"
-
-        # commit the changes
-        session.commit()
+    # get video information
+    video = shown_video(get_video(room))
+
+    video_labels = [video.id, video.question_1, video.answer_1, video.question_2, video.answer_2]
+
+    return player_labels + player_labels_correct + video_labels
+
+@track('server.refresh_labels')
+def refresh_labels(num_players, rendered, room=DEFAULT_ROOM):
+    """
+    Return the labels that changed since the last tick of this browser, all others are skipped.
+    - num_players: the number of team labels on the admin page
+    - rendered: the state of this browser, `{'revision': ..., 'values': [...]}` or None
+    - room: the room of the admin page
+    """
+    revision = get_cache(room).revision
+    n_outputs = 2 * num_players + 5
+
+    # nothing has changed in the game since the last tick
+    if rendered is not None and rendered['revision'] == revision:
+        return [gr.skip() for i in range(n_outputs)] + [rendered]
+
+    outputs, values = diff_updates(render_labels(num_players, room), rendered['values'] if rendered is not None else None)
+
+    return outputs + [{'revision': revision, 'values': values}]
+
+def stream_labels(num_players, room=DEFAULT_ROOM):
+    """
+    Push the labels of the admin page to one browser whenever the game changes.
+    This is a generator that runs as long as the page is open. It blocks on the game state cache
+    and only yields the labels that changed, so an idle game causes no queries and no traffic.
+    - num_players: the number of team labels on the admin page
+    - room: the room of the admin page
+    """
+    cache = get_cache(room)
+
+    # the state of this browser, see refresh_labels
+    rendered = None
+
+    while True:
+        try:
+            revision = cache.wait_for_change(rendered['revision'] if rendered is not None else None, timeout=ADMIN_STREAM_TIMEOUT)
+
+            if rendered is not None and rendered['revision'] == revision:
+                continue
+
+            *outputs, rendered = refresh_labels(num_players, rendered, room)
+
+        except Exception as e:
+            # the page keeps its stream, the labels are rendered again after a pause
+            print(f"[admin:{room}] Updating the labels failed: {e!r}. Trying again in {ADMIN_STREAM_RETRY_DELAY}s")
+            time.sleep(ADMIN_STREAM_RETRY_DELAY)
+            continue
+
+        # nothing the browser shows has changed
+        if all(is_skip(output) for output in outputs):
+            continue
+
+        yield outputs
+
+def grade_answer_2(team_name, correct_answer: bool, room=DEFAULT_ROOM):
+    """
+    Grade the answer of a team to question 2, unless it is graded already.
+    - team_name: the name of the team, e.g. "Team 1"
+    - correct_answer: whether the answer is correct or not
+    - room: the room of the team
+    """
+    with session_scope() as session:
+        # team names are "Team 1", "Team 2", etc.
+        team = session.query(Team).filter_by(room=room, name=team_name).first()
 
-        # close the database connection
-        session.close()
-        engine.dispose()
-
-        return True
+        if team:
+            round_id = get_round_id(room)
+            answer = get_answer(session, team.id, round_id, create=True)
 
-    def consume_messages():
-        # get the hostname, based on whether we're in docker or not
-        docker_env = os.environ.get('IN_DOCKER', False)
-        host = 'rabbitmq' if docker_env else 'localhost'
+            if answer.correct_2 is None:
+                # Update the team's score
+                added_points = POINTS_ON_CORRECT_ANSWER_2 if correct_answer else 0
+                add_points(session, team, added_points)
+                answer.correct_2 = "correct" if correct_answer else "incorrect"
+                notify_change(session, 'teams', room)
+                journal_event(session, 'grade_2', room=room, team=team_name, round_id=round_id, correct_2=answer.correct_2, points=added_points)
 
-        connection = pika.BlockingConnection(pika.ConnectionParameters(host=host, port=5672))
-        channel = connection.channel()
-        channel.queue_declare(queue='game', durable=True)
-        channel.basic_consume(queue='game', on_message_callback=callback, auto_ack=True)
-        channel.start_consuming()
+                emoji = answer_to_emoji(answer.correct_2)
+                print(f"[points] {emoji} Gave {team_name} {added_points} points for answer 2")
 
-    def refresh_labels():
-        """
-        Fetch current players' answers and points from the database and return them.
-        """
-        engine, session = connect_db()
+    get_cache(room).touch_teams()
 
-        # get all teams, ordered by name
-        teams = session.query(Team).order_by(Team.name).all()
+def reset_game(room=DEFAULT_ROOM):
+    """
+    Reset the game of a room to its first video: phase 'hide', no answers, no revealed years and 0 points for all teams.
+    The other rooms are not touched.
+    """
+    with session_scope() as session:
 
-        session.close()
-        engine.dispose()
+        # get the state
+        current_state = session.query(State).filter_by(room=room).first()
 
-        player_labels = [gr.Label(value="No Team connected") for i in range(num_players)]
-        player_labels_correct = [gr.Label(value="🔄️") for i in range(num_players)]
+        if current_state is None:
+            print("[state] No current state found. Creating a new state...")
+            current_state = State(room=room, phase='hide', video_id=START_VIDEO_INDEX)
+            session.add(current_state)
 
-        for i in range(num_players):
+        current_state.phase = 'hide'
+        current_state.video_id = START_VIDEO_INDEX
+        current_state.round_id = None
 
-            if i >= len(teams):
-                current_team = None
-            else:
-                current_team = teams[i]
+        print(f"> Resetting phase to 'hide' and selected years to None...")
 
-            if current_team is not None:
-                player_labels[i] = gr.Label(value=f"{current_team.name}: {current_team.answer_1}; {current_team.answer_2} ({current_team.points})")
+        # remove all answers, years and rounds of the room
+        session.flush()
+        round_ids = session.query(Round.id).filter_by(room=room)
+        session.query(Answer).filter(Answer.round_id.in_(round_ids.scalar_subquery())).delete(synchronize_session=False)
+        session.query(RevealedYear).filter_by(room=room).delete()
+        session.query(Round).filter_by(room=room).delete()
 
-                label_correct_1 = answer_to_emoji(current_team.correct_1)
-                label_correct_2 = answer_to_emoji(current_team.correct_2)
+        # start the first round
+        current_round = Round(room=room, video_id=START_VIDEO_INDEX)
+        session.add(current_round)
+        session.flush()
+        current_state.round_id = current_round.id
 
-                player_labels_correct[i] = gr.Label(value=f"{label_correct_1} {label_correct_2}")
-        
-        # get video information
-        video = get_video()
+        # reset all team scores to 0
+        session.query(Team).filter_by(room=room).update({Team.points: 0})
 
-        label_video_id = gr.Label(value=video.id)
+        print(f"> Resetting all teams' scores to 0 and answers to empty...")
 
-        label_video_question_1 = gr.Label(value=video.question_1)
-        label_video_answer_1 = gr.Label(value=video.answer_1)
+        notify_change(session, 'state', room)
+        notify_change(session, 'points', room)
+        journal_event(session, 'reset', room=room, video_id=START_VIDEO_INDEX, round_id=current_round.id)
+
+    get_cache(room).refresh()
+
+    print("> Done!")
+
+def warm_restart(room=DEFAULT_ROOM):
+    """
+    Continue the game of a room where its journal ends: the round, the phase, the revealed years, the points
+    and the answers of the current round are written back into the database. The videos are not touched.
+    """
+    start = time.perf_counter()
+    state = get_journal(room).state
+
+    if state['round_id'] is None:
+        print(f"[journal] The journal of room {room} has no round yet, nothing to restore")
+        return
+
+    with session_scope() as session:
+        restore_state(session, state, room)
+
+    # start from a fresh snapshot, so the next restart only reads it
+    get_journal(room).snapshot()
+    get_cache(room).refresh()
+
+    print(f"[journal] Restored room {room} at video {state['video_id']} with {len(state['teams'])} teams and {len(state['years'])} revealed years in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+def journal_known_teams(room=DEFAULT_ROOM):
+    """
+    Record the teams of a room that are in the database but not in its journal yet,
+    e.g. teams the hosts created before the server was started.
+    """
+    with session_scope() as session:
+        journal_teams(session, [name for (name,) in session.query(Team.name).filter_by(room=room)], room)
+
+def build_admin_app(num_players, core=None, resume=False, room=DEFAULT_ROOM) -> gr.Blocks:
+    """
+    Build the admin website of a room, where the points for question 2 are given and the next video is chosen.
+    - num_players: the number of teams
+    - core: the async scoring core the admin actions run on, see src.server.async_core.
+      Without it, they run in worker threads.
+    - resume: if True, the next video follows the current video of the game instead of START_VIDEO_INDEX
+    - room: the room the website controls
+    """
+    # get all videos from the database, in the order of their ids
+    with session_scope() as session:
+        videos = session.query(Video).order_by(Video.id).all()
+    video_index = None   # index of the current video
 
-        label_video_question_2 = gr.Label(value=video.question_2)
-        label_video_answer_2 = gr.Label(value=video.answer_2)
+    if resume and get_video(room) is not None:
+        video_ids = [video.id for video in videos]
+        if get_video(room).id in video_ids:
+            video_index = video_ids.index(get_video(room).id) + 1
 
-        return player_labels + player_labels_correct + [label_video_id, label_video_question_1, label_video_answer_1, label_video_question_2, label_video_answer_2]
+    # shuffle the videos
+    # random.shuffle(videos)
 
-    def update_score(team_name, increment):
+    async def run_action(action, *args):
         """
-        Update the score of the given team by increment (can be 1 or -1).
+        Run an admin action of this room without blocking the event loop of gradio: on the async scoring core
+        if there is one, otherwise in a worker thread.
+        - action: the sync function, the core has an async method with the same name
+        - args: the arguments of the action, the room is added as the last one
         """
-        engine, session = connect_db()
-
-        # get the team with the team name
-        team = session.query(Team).filter_by(name=team_name).first()
-
-        if team:
-
-            if team.correct_1 is None:
-                # Update the team's score
-                team.points += POINTS_ON_CORRECT_ANSWER_1
-                team.correct_1 = True
-                # commit the changes
-                session.commit()
-                print(f"[points] Updated {team_name} score to {team.points}")
-            
-            elif team.correct_2 is None:
-                # Update the team's score
-                team.points += POINTS_ON_CORRECT_ANSWER_2
-                team.correct_2 = True
-                # commit the changes
-                session.commit()
-                print(f"[points] Updated {team_name} score to {team.points}")
+        args = args + (room,)
 
-        else:
-            print(f"[points] Team {team_name} not found")
-
-        # close the database connection
-        session.close()
-        engine.dispose()
+        if core is not None:
+            return await core.call(getattr(core, action.__name__)(*args))
 
+        return await asyncio.to_thread(action, *args)
 
     def create_update_function(team_name, correct_answer: bool):
         """
@@ -381,77 +582,37 @@ if __name__ == '__main__':
         This function will be called when the button is clicked.
         - team_name: the name of the team
         - correct_answer: whether the answer is correct or not
-        - increment: the amount to increment the score by
         """
-        def update_function():
-            engine, session = connect_db()
-            # team names are "Team 1", "Team 2", etc.
-            team = session.query(Team).filter_by(name=team_name).first()
-
-            if team:
-                if team.correct_2 is None:
-                    # Update the team's score
-                    added_points = POINTS_ON_CORRECT_ANSWER_2 if correct_answer else 0
-                    team.points += added_points
-                    team.correct_2 = "correct" if correct_answer else "incorrect"
-                    # commit the changes
-                    session.commit()
-
-                    emoji = answer_to_emoji(team.correct_2)
-                    print(f"[points] {emoji} Updated {team_name} score to {team.points} with answer 2")
-
-            # close the database connection
-            session.close()
-            engine.dispose()
+        async def update_function():
+            await run_action(grade_answer_2, team_name, correct_answer)
 
             # Return the updated labels after modifying the score
             return None
         return update_function
 
-    def clear_round_state():
-        # get all teams
-        engine, session = connect_db()
-        teams = session.query(Team).all()
-
+    async def clear_round_state():
+        # the answers are stored per round, so the new round set by set_video starts without answers
         if RESET_PHASE_ON_NEXT_VIDEO:
             # reset the phase to 'hide'
-            set_phase_hide()
-
-        for team in teams:
-            team.answer_1 = ''
-            team.answer_2 = ''
-            team.correct_1 = None
-            team.correct_2 = None
-
-        session.commit()
-
-        # close the database connection
-        session.close()
-        engine.dispose()
+            await set_phase_hide()
 
         if RESET_PHASE_ON_NEXT_VIDEO:
             print("[state] Cleared round state and reset phase to 'hide'")
         else:
             print("[state] Cleared round state")
     
-    def set_phase_hide():
-        set_phase('hide')
+    async def set_phase_hide():
+        await run_action(set_phase, 'hide')
     
-    def set_phase_show():
-        set_phase('show')
+    async def set_phase_show():
+        await run_action(set_phase, 'show')
 
-    def set_video():
+    async def set_video():
         """
         Set the current video.
         """
-        engine, session = connect_db()
-
-        global video_index, videos
-
         if video_index >= len(videos):
             print("[video] No more videos available")
-            session.close()
-            engine.dispose()
             return
 
         # get the current video
@@ -459,13 +620,10 @@ if __name__ == '__main__':
 
         if current_video is None:
             print("[video] No current video found")
-            session.close()
-            engine.dispose()
             return
         
         # update the state
-        current_state = session.query(State).first()
-        current_state.video_id = current_video.id
+        await run_action(set_video_id, current_video.id)
 
         return_list = [
             gr.Label(value=current_video.id),
@@ -475,23 +633,17 @@ if __name__ == '__main__':
             gr.Label(current_video.answer_2)
         ]
 
-        # commit the changes
-        session.commit()
-
-        # close the database connection
-        session.close()
-        engine.dispose()
-
         print(f"[video] Set video to {current_video.filename} (ID {current_video.id})")
 
         return return_list
     
-    def next_video():
+
+    async def next_video():
         """
         Set the current video.
         """
 
-        global video_index, videos
+        nonlocal video_index
 
         if video_index == None:
             video_index = START_VIDEO_INDEX - 1
@@ -507,29 +659,21 @@ if __name__ == '__main__':
             current_video = videos[video_index-1]
             currrent_year = int(current_video.answer_1)
             print(f"[years] Adding year {currrent_year} to selected years")
-            add_selected_year(currrent_year)
+            await run_action(add_selected_year, currrent_year)
 
         video_index += 1
         
-        return_list = set_video()
+        return_list = await set_video()
 
-        clear_round_state()
+        await clear_round_state()
 
         return return_list
-    
-    # get all videos from the database
-    engine, session = connect_db()
-    videos = session.query(Video).all()
-    video_index = None   # index of the current video
-
-    # shuffle the videos
-    # random.shuffle(videos)
 
-    # close the database connection
-    session.close()
-    engine.dispose()
-    
-    Thread(target=consume_messages, daemon=True).start()
+    def push_labels():
+        """
+        Push the labels to one browser, see stream_labels.
+        """
+        yield from stream_labels(num_players, room)
 
     player_labels = [None for i in range(num_players)]
     player_label_correct = [None for i in range(num_players)]
@@ -586,12 +730,14 @@ if __name__ == '__main__':
                 button_next.click(fn=next_video, inputs=[], outputs=video_refresh_components)
                 # button_exit.click(fn=exit, inputs=[], outputs=[])
 
-                timer_refresh = gr.Timer(0.5)
-                timer_refresh.tick(
-                    fn=refresh_labels,
+                # push the labels to this browser whenever the game changes
+                # every open page keeps its stream running, so the stream must not be limited to one at a time
+                demo.load(
+                    fn=push_labels,
                     inputs=[],
                     outputs=all_refresh_components,
                     show_progress="hidden",
+                    concurrency_limit=None,
                 )
             
             with gr.Row():
@@ -613,9 +759,81 @@ if __name__ == '__main__':
             #     button_hide.click(fn=set_phase_hide, inputs=[], outputs=[])
             #     button_show.click(fn=set_phase_show, inputs=[], outputs=[])
 
-    demo.launch(
-        server_name='0.0.0.0',
-        server_port=7999,
-        debug=True,
-        auth=AUTH_CREDENTIALS if USE_AUTH else None
-    )
\ No newline at end of file
+    return demo
+
+if __name__ == '__main__':
+
+    # get launch arguments
+    arguments = sys.argv[1:]
+
+    if len(arguments) < 1:
+        print('Usage: python -m src.server.server <number of players> [-b] [-r] [-p <prefetch>] [-a] [-w] [--rooms <room,room,...>]')
+        print('       -a: grade the answers and run the admin actions on the asyncio scoring core')
+        print(f'       -w: continue the game where {journal_path()} ends, after a crash or a restart')
+        print('       --rooms: run several independent games, the admin website of each is served under /room/<room>')
+        sys.exit(1)
+
+    # Number of players - this can be parameterized
+    num_players = int(arguments[0])
+
+    # the rooms of this server, every room has its own game, queue and journal
+    rooms = parse_rooms(arguments[arguments.index('--rooms') + 1]) if '--rooms' in arguments else [DEFAULT_ROOM]
+
+    # rebuild
+    if '-b' in arguments:
+        build(verbose=True)
+
+    for room in rooms:
+        # every game event is appended to the journal of its room
+        open_journal(room=room)
+
+        # reset the game state
+        if '-r' in arguments:
+            reset_game(room)
+
+        # continue the game from the journal
+        if '-w' in arguments:
+            warm_restart(room)
+
+        journal_known_teams(room)
+
+    # prefetch of the consumer
+    if '-p' in arguments:
+        prefetch = int(arguments[arguments.index('-p') + 1])
+    else:
+        prefetch = CONSUMER_PREFETCH
+
+    if '-a' in arguments:
+        # imported here, because the async core imports this module
+        from src.server.async_core import ScoringCore
+
+        core = ScoringCore()
+        core.start(consume=True, prefetch=prefetch, rooms=rooms)
+    else:
+        core = None
+        for room in rooms:
+            Thread(target=consume_messages, args=(prefetch,), kwargs={'room': room}, daemon=True).start()
+
+    start_metrics_server('server')
+
+    auth = AUTH_CREDENTIALS if USE_AUTH else None
+
+    if len(rooms) == 1:
+        demo = build_admin_app(num_players, core, resume='-w' in arguments, room=rooms[0])
+
+        demo.launch(
+            server_name='0.0.0.0',
+            server_port=ADMIN_PORT,
+            debug=True,
+            auth=auth
+        )
+    else:
+        app = FastAPI()
+
+        for room in rooms:
+            demo = build_admin_app(num_players, core, resume='-w' in arguments, room=room)
+            app = gr.mount_gradio_app(app, demo, path=room_path(room, rooms), auth=auth)
+
+        print(f"Starting admin websites of {', '.join(rooms)} on port {ADMIN_PORT} under /room/<room>...")
+
+        uvicorn.run(app, host='0.0.0.0', port=ADMIN_PORT)
@@ -0,0 +1,163 @@
+# an in-process stand-in for RabbitMQ, used when all components run in one process
+# it implements the parts of pika's BlockingConnection and BlockingChannel the server and the publisher use
+
+import time
+from collections import deque
+from threading import Condition
+from types import SimpleNamespace
+
+import pika
+
+class LocalBroker:
+    """
+    Queues kept in memory, shared by all connections opened with `connect()`.
+    - queues (dict): queue name -> deque of `(body, properties, redelivered)`
+
+    Messages are lost when the process ends, which is fine because the server runs in the same process.
+    """
+
+    def __init__(self):
+        self.queues = {}
+        self.closed = False
+        self._changed = Condition()
+
+    def connect(self):
+        """
+        Open a connection, used in place of `pika.BlockingConnection(...)`.
+        """
+        if self.closed:
+            raise pika.exceptions.AMQPConnectionError("local broker is closed")
+
+        return LocalConnection(self)
+
+    def publish(self, queue, body, properties=None):
+        if isinstance(body, str):
+            body = body.encode()
+
+        with self._changed:
+            if self.closed:
+                raise pika.exceptions.AMQPConnectionError("local broker is closed")
+
+            self.queues.setdefault(queue, deque()).append((body, properties, False))
+            self._changed.notify_all()
+
+    def close(self):
+        with self._changed:
+            self.closed = True
+            self._changed.notify_all()
+
+class LocalConnection:
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.is_open = True
+
+    def channel(self):
+        return LocalChannel(self.broker)
+
+    def process_data_events(self, time_limit=0):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+class LocalChannel:
+    """
+    A channel with manual acknowledgements and a prefetch limit, like pika's BlockingChannel.
+    """
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.prefetch = 0
+        self.next_tag = 1
+        self.unacked = {}       # delivery tag -> (queue, body, properties)
+        self.is_closed = False
+
+    def queue_declare(self, queue, durable=False, passive=False):
+        with self.broker._changed:
+            messages = self.broker.queues.setdefault(queue, deque())
+            return SimpleNamespace(method=SimpleNamespace(queue=queue, message_count=len(messages)))
+
+    def basic_qos(self, prefetch_count=0):
+        self.prefetch = prefetch_count
+
+    def confirm_delivery(self):
+        pass
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        self.broker.publish(routing_key, body, properties)
+
+    def consume(self, queue, inactivity_timeout=None):
+        """
+        Yield `(method, properties, body)` for every delivered message, or `(None, None, None)`
+        after `inactivity_timeout` seconds without a message.
+        """
+        broker = self.broker
+
+        while True:
+            with broker._changed:
+                def deliverable():
+                    has_room = self.prefetch == 0 or len(self.unacked) < self.prefetch
+                    return broker.closed or (has_room and broker.queues.get(queue))
+
+                if not broker._changed.wait_for(deliverable, timeout=inactivity_timeout):
+                    message = None
+                elif broker.closed:
+                    raise pika.exceptions.ConnectionClosed(320, "local broker is closed")
+                else:
+                    body, properties, redelivered = broker.queues[queue].popleft()
+                    tag = self.next_tag
+                    self.next_tag += 1
+                    self.unacked[tag] = (queue, body, properties)
+                    message = (SimpleNamespace(delivery_tag=tag, redelivered=redelivered), properties, body)
+
+            yield message if message is not None else (None, None, None)
+
+    def _settle(self, delivery_tag, multiple):
+        tags = [tag for tag in self.unacked if tag == delivery_tag or (multiple and tag <= delivery_tag)]
+        return [self.unacked.pop(tag) for tag in sorted(tags)]
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        with self.broker._changed:
+            self._settle(delivery_tag, multiple)
+            self.broker._changed.notify_all()
+
+    def basic_nack(self, delivery_tag, multiple=False, requeue=True):
+        with self.broker._changed:
+            settled = self._settle(delivery_tag, multiple)
+
+            if requeue:
+                # delivered again first, marked as redelivered
+                for queue, body, properties in reversed(settled):
+                    self.broker.queues[queue].appendleft((body, properties, True))
+
+            self.broker._changed.notify_all()
+
+class LocalPublisher:
+    """
+    Publishes answers into a LocalBroker, with the interface of `src.client.publisher.Publisher`.
+    - queue (str): the queue messages are published to
+    """
+
+    def __init__(self, broker, queue='game'):
+        self.broker = broker
+        self.queue = queue
+
+    def connect(self):
+        pass
+
+    def publish(self, body) -> bool:
+        """
+        Put a message into the queue.
+
+        returns False if the broker is closed
+        """
+        try:
+            self.broker.publish(self.queue, body, SimpleNamespace(headers={'sent_at': time.time()}))
+        except pika.exceptions.AMQPError:
+            return False
+
+        return True
+
+    def close(self):
+        pass
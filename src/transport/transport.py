@@ -0,0 +1,52 @@
+import pika
+
+from src.client.publisher import Publisher, mq_host
+from src.transport.local import LocalBroker, LocalPublisher
+
+class RabbitTransport:
+    """
+    Answers travel through RabbitMQ, so the hosts, the server and the monitor can run on different machines.
+    """
+    name = 'rabbitmq'
+
+    def connect(self):
+        """
+        Open a blocking connection for the consumer of the server.
+        """
+        return pika.BlockingConnection(pika.ConnectionParameters(host=mq_host(), port=5672))
+
+    def publisher(self, queue='game') -> Publisher:
+        return Publisher(queue=queue)
+
+class LocalTransport:
+    """
+    Answers travel through a queue in memory, so all components have to run in the same process.
+    - broker (LocalBroker): the queues shared by the publishers and the consumer
+    """
+    name = 'local'
+
+    def __init__(self, broker=None):
+        self.broker = broker if broker is not None else LocalBroker()
+
+    def connect(self):
+        return self.broker.connect()
+
+    def publisher(self, queue='game') -> LocalPublisher:
+        return LocalPublisher(self.broker, queue=queue)
+
+TRANSPORTS = {
+    RabbitTransport.name: RabbitTransport,
+    LocalTransport.name: LocalTransport,
+}
+
+def get_transport(name='rabbitmq'):
+    """
+    Get a transport by its name, either 'rabbitmq' or 'local'.
+
+    Both have the same message contract: the hosts publish `team§answer_1§answer_2` to the 'game' queue
+    with `transport.publisher().publish(...)` and the server consumes it over `transport.connect()`.
+    """
+    if name not in TRANSPORTS:
+        raise ValueError(f"Unknown transport {name}, use one of {', '.join(TRANSPORTS)}")
+
+    return TRANSPORTS[name]()
@@ -1,102 +1,290 @@
 import os
 import sys
+import time
+import shlex
+import csv
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
-from src.db.build import connect_db
-from src.db.model import Video
+from sqlalchemy import insert, update, delete
+from src.db.build import session_scope
+from src.db.model import Video, Round, State
 
 # RUN WITH '-d' TO DOWNLOAD THE VIDEOS
-# OTHERWISE THIS JUST ADDS ENTRIES TO THE DATABASE
+# OTHERWISE THIS JUST SYNCS THE DATABASE WITH THE CSV FILE
+#
+# -n      only report how the database differs from the csv file
+#
+# options for downloading:
+# -w <n>  number of parallel downloads
+# -f      download again, even if the video already exists
 
 path_csv = 'src/videos/videos.csv'
+path_original = 'videos/original'
 
-if __name__ == '__main__':
+YTDLP_COMMAND = os.environ.get('YTDLP_COMMAND', 'yt-dlp')   # command used to download, can be replaced by a stub
+VIDEO_FORMAT = "bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best"
 
-    # get launch arguments
-    arguments = sys.argv[1:]
+DOWNLOAD_WORKERS = 4        # number of parallel downloads
+DOWNLOAD_RETRIES = 3        # attempts per video
+RETRY_BACKOFF = 2           # seconds to wait after the first failed attempt, doubled after every further one
 
-    with open(path_csv, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
+# the columns of the csv file, in order
+CSV_COLUMNS = ['question_1', 'author', 'title', 'answer_1', 'question_2', 'answer_2', 'link', 'video_start', 'video_end']
 
-    # if the folder /videos/original does not exist, create it
-    if not os.path.exists('videos/original'):
-        os.makedirs('videos/original')
+# the columns that identify a clip, a row keeps the id of its video as long as they do not change
+CATALOGUE_KEY = ['link', 'video_start']
 
-    # connect to the database
-    engine, session = connect_db()
+def make_download_name(title) -> str:
+    """
+    Create the filename of a video from its title.
+    Turns the title lowercase, removes special characters and replaces spaces with underscores.
+    """
+    replacements = {
+        ' ': '_',
+        'ä': 'ae',
+        'ö': 'oe',
+        'ü': 'ue',
+        'ß': 'ss'
+    }
+    download_name = title.lower()
+    for pre, post in replacements.items():
+        download_name = download_name.replace(pre, post)
 
-    # manually create a tqdm bar
-    with tqdm(total=len(lines)) as pbar:
+    # remove all special characters, only keep alphanumeric characters and underscores
+    download_name = ''.join(e for e in download_name if (e.isalnum() or e == '_'))
 
-        for i, line in enumerate(lines):
+    return download_name
 
-            line = line.strip()
+def read_entries(path=path_csv) -> list:
+    """
+    Read the video entries from the csv file, one row at a time. Fields may be quoted, e.g. `"Super Geil"`.
+    The entries have no id, sync_catalogue finds the video of an entry by its `CATALOGUE_KEY`.
 
-            if line == '':
-                continue
+    returns a list of dicts with the columns of the `Video` model
+    """
+    entries = []
 
-            tokens = line.split(';')
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.reader(f, delimiter=';'):
 
-            if len(tokens) != 9:
-                print(f'Warning: invalid line in {path_csv}: {line}')
+            if not any(token.strip() for token in row):
+                continue
+
+            if len(row) != len(CSV_COLUMNS):
+                print(f'Warning: invalid line {row} in {path}')
                 continue
 
             # get the entry information
-            question_1 = tokens[0]
-            author = tokens[1]
-            title = tokens[2]
-            answer_1 = tokens[3]
-            question_2 = tokens[4]
-            answer_2 = tokens[5]
-            link = tokens[6]
-            video_start = tokens[7]
-            video_end = tokens[8]
-
-            # create the filename
-            # turn source lowercase, remove special characters and replace spaces with underscores
-            replacements = {
-                ' ': '_',
-                'ä': 'ae',
-                'ö': 'oe',
-                'ü': 'ue',
-                'ß': 'ss'
-            }
-            download_name = title.lower()
-            for pre, post in replacements.items():
-                download_name = download_name.replace(pre, post)
-
-            # remove all special characters, only keep alphanumeric characters and underscores
-            download_name = ''.join(e for e in download_name if (e.isalnum() or e == '_'))
-
-            # download if '-d' is in the arguments
-            if '-d' in arguments:
-                # download the video using yt-dlp to /videos/original
-                # also convert to mp4
-                download_string = f'yt-dlp {link} -f "bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best" --quiet -o videos/original/{download_name}'
-                os.system(download_string)
-
-            # create a new database entry
-            video = Video(
-                title=title,
-                author=author,
-                question_1=question_1,
-                answer_1=answer_1,
-                question_2=question_2,
-                answer_2=answer_2,
-                link=link,
-                video_start=video_start,
-                video_end=video_end,
-                filename=download_name
-            )
-
-            # add the video to the database
-            session.add(video)
-
-            # update the progress bar
+            entry = dict(zip(CSV_COLUMNS, row))
+            entry['filename'] = make_download_name(entry['title'])
+
+            entries.append(entry)
+
+    return entries
+
+def catalogue_key(entry) -> tuple:
+    """
+    Get the key that identifies the clip of an entry or a video, see `CATALOGUE_KEY`.
+    """
+    if isinstance(entry, dict):
+        return tuple(entry[column] for column in CATALOGUE_KEY)
+
+    return tuple(getattr(entry, column) for column in CATALOGUE_KEY)
+
+def sync_catalogue(entries, dry_run=False) -> dict:
+    """
+    Make the videos table match the entries: new videos are inserted, changed videos are updated
+    and videos that are no longer listed are deleted, each with a single statement.
+    An entry is matched to its video by `CATALOGUE_KEY` and keeps the id of the video, so adding, removing
+    or moving rows in the csv file does not change the videos the rounds, the state and the journal refer to.
+    New videos get the next free ids. If several videos have the same key, the one with the lowest id is kept
+    and the others are removed like videos that are no longer listed.
+    Running it again without changes to the csv file does not write anything.
+    - entries: the entries from read_entries, the entries of existing videos get their `id`
+    - dry_run: if True, only report the differences
+
+    returns ```{'added': [entries], 'changed': [entries], 'removed': [ids], 'kept': [ids], 'unchanged': n}```
+    - `kept` are videos that are no longer listed or duplicates, but can not be deleted because a round of the game used them
+    """
+    columns = CSV_COLUMNS + ['filename']
+
+    with session_scope() as session:
+        existing = {}
+        duplicates = []
+
+        for row in session.query(Video.id, *[getattr(Video, column) for column in columns]).order_by(Video.id):
+            # earlier imports may have added a video more than once
+            if catalogue_key(row) in existing:
+                duplicates.append(row.id)
+            else:
+                existing[catalogue_key(row)] = row
+
+        added = []
+        changed = []
+        listed = set()
+
+        for entry in entries:
+            key = catalogue_key(entry)
+
+            if key in listed:
+                print(f"Warning: {entry['title']} is listed more than once, only the first row is used")
+                continue
+
+            listed.add(key)
+
+            if key not in existing:
+                added.append(entry)
+                continue
+
+            entry['id'] = existing[key].id
+
+            if any(getattr(existing[key], column) != entry[column] for column in columns):
+                changed.append(entry)
+
+        unlisted = sorted([row.id for key, row in existing.items() if key not in listed] + duplicates)
+
+        # the rounds and the state refer to the videos they showed
+        used = {video_id for (video_id,) in session.query(Round.video_id).filter(Round.video_id.in_(unlisted))}
+        used |= {video_id for (video_id,) in session.query(State.video_id).filter(State.video_id.in_(unlisted))}
+
+        removed = [video_id for video_id in unlisted if video_id not in used]
+        kept = [video_id for video_id in unlisted if video_id in used]
+
+        if not dry_run:
+            if added:
+                session.execute(insert(Video), added)
+
+            if changed:
+                session.execute(update(Video), changed)
+
+            if removed:
+                session.execute(delete(Video).where(Video.id.in_(removed)))
+
+    return {
+        'added': added,
+        'changed': changed,
+        'removed': removed,
+        'kept': kept,
+        'unchanged': len(listed) - len(added) - len(changed),
+    }
+
+def is_downloaded(download_name, directory=path_original) -> bool:
+    """
+    Check if a video has been downloaded completely.
+    The file must exist, not be empty and yt-dlp must not have left a partial download behind.
+    """
+    for path in [f'{directory}/{download_name}', f'{directory}/{download_name}.mp4']:
+        if os.path.isfile(path) and os.path.getsize(path) > 0 and not os.path.exists(f'{path}.part'):
+            return True
+
+    return False
+
+def download_video(link, download_name, command=YTDLP_COMMAND, directory=path_original, retries=DOWNLOAD_RETRIES, backoff=RETRY_BACKOFF) -> bool:
+    """
+    Download a single video with yt-dlp, retrying with a growing delay.
+    - link: the youtube link
+    - download_name: the filename without extension
+    - command: the yt-dlp command, split like a shell command
+
+    returns True if the video was downloaded
+    """
+    args = shlex.split(command) + [link, '-f', VIDEO_FORMAT, '--quiet', '-o', f'{directory}/{download_name}']
+    error = 'no attempt was made'
+
+    for attempt in range(retries):
+        try:
+            result = subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        except OSError as e:
+            # the command is missing or can not be run
+            error = str(e)
+        else:
+            if result.returncode == 0 and is_downloaded(download_name, directory):
+                return True
+
+            error = result.stderr.strip() or f'exit code {result.returncode}'
+
+        if attempt < retries - 1:
+            time.sleep(backoff * 2 ** attempt)
+
+    print(f'Warning: could not download {download_name} from {link}: {error}')
+    return False
+
+def download_all(entries, workers=DOWNLOAD_WORKERS, command=YTDLP_COMMAND, directory=path_original, force=False, retries=DOWNLOAD_RETRIES, backoff=RETRY_BACKOFF) -> dict:
+    """
+    Download all videos in parallel. Videos that are already downloaded are skipped.
+    - entries: the entries from read_entries
+    - workers: number of parallel downloads
+    - command: the yt-dlp command
+    - force: if True, download videos again even if they exist
+    - retries, backoff: the attempts per video and the delay after the first failed one, see download_video
+
+    returns ```{'downloaded': n, 'skipped': n, 'failed': [filenames]}```
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    # the same file might be listed more than once
+    pending = {}
+    skipped = 0
+
+    for entry in entries:
+        if not force and is_downloaded(entry['filename'], directory):
+            skipped += 1
+        else:
+            pending[entry['filename']] = entry['link']
+
+    report = {'downloaded': 0, 'skipped': skipped, 'failed': []}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor, tqdm(total=len(pending), desc='Downloading') as pbar:
+        futures = {
+            executor.submit(download_video, link, download_name, command, directory, retries, backoff): download_name
+            for download_name, link in pending.items()
+        }
+
+        for future in as_completed(futures):
+            if future.result():
+                report['downloaded'] += 1
+            else:
+                report['failed'].append(futures[future])
+
+            pbar.set_postfix(skipped=skipped, failed=len(report['failed']))
             pbar.update(1)
 
-    # commit the changes
-    session.commit()
+    return report
+
+if __name__ == '__main__':
+
+    # get launch arguments
+    arguments = sys.argv[1:]
+
+    entries = read_entries(path_csv)
+
+    # download if '-d' is in the arguments
+    if '-d' in arguments:
+        workers = int(arguments[arguments.index('-w') + 1]) if '-w' in arguments else DOWNLOAD_WORKERS
+
+        start = time.perf_counter()
+        report = download_all(entries, workers=workers, force='-f' in arguments)
+        elapsed = time.perf_counter() - start
+
+        print(f"Downloaded {report['downloaded']}, skipped {report['skipped']}, failed {len(report['failed'])} in {elapsed:.1f}s")
+        for download_name in report['failed']:
+            print(f'- {download_name}')
+
+    # sync the database entries
+    start = time.perf_counter()
+    report = sync_catalogue(entries, dry_run='-n' in arguments)
+    elapsed = time.perf_counter() - start
+
+    action = 'Would sync' if '-n' in arguments else 'Synced'
+    print(f"{action} {len(entries)} videos in {elapsed:.2f}s: added {len(report['added'])}, changed {len(report['changed'])}, removed {len(report['removed'])}, unchanged {report['unchanged']}")
 
-    # close the database connection
-    session.close()
-    engine.dispose()
\ No newline at end of file
+    for entry in report['added']:
+        print(f"+ {entry['title']}")
+    for entry in report['changed']:
+        print(f"~ {entry['id']}: {entry['title']}")
+    for video_id in report['removed']:
+        print(f"- {video_id}")
+    for video_id in report['kept']:
+        print(f"Warning: video {video_id} is no longer listed or a duplicate, but was used in a round and is kept")
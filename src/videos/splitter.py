@@ -1,12 +1,43 @@
-# this file splits videos from /videos/original into 2s, 5s and 10s clips with ffmpeg
-# and saves them in /videos/2s, /videos/5s and /videos/10s respectively
+# this file cuts the clips out of the videos in /videos/original with ffmpeg
+# and saves them in /videos/clips
+#
+# a manifest in /videos/clips remembers the source file and the cut of every clip,
+# so only clips whose source or cut has changed are encoded again
+#
+# every clip starts with a keyframe and has its index (moov atom) at the front, so playback can start
+# before the whole file is loaded. next to it, a fragmented copy <filename>.frag.mp4 is written,
+# which browsers can play while it streams in
+#
+# options:
+# -f      encode all clips again
+# -c      copy the streams instead of encoding if the cut starts on a keyframe
+# -w <n>  number of parallel ffmpeg jobs, defaults to the number of cores
 
 import os
+import sys
+import json
+import time
+import hashlib
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
 from datetime import datetime, timedelta
-from src.db.build import connect_db
+from src.db.build import session_scope
 from src.db.model import Video
 
+path_original = 'videos/original'
+path_clips = 'videos/clips'
+path_manifest = f'{path_clips}/manifest.json'
+
+# encoding settings of the clips, changing them encodes all clips again
+ENCODE_ARGS = ['-c:v', 'libx264', '-c:a', 'aac', '-b:v', '2500k', '-b:a', '192k', '-vf', 'scale=1280:720', '-profile:v', 'main',
+               '-force_key_frames', 'expr:eq(n,0)', '-movflags', '+faststart']
+FRAGMENT_ARGS = ['-movflags', '+frag_keyframe+empty_moov+default_base_moof']
+CLIP_WIDTH, CLIP_HEIGHT = 1280, 720
+
+KEYFRAME_TOLERANCE = 0.05       # seconds a keyframe may be away from the start of the cut for stream copying
+HASH_CHUNK_SIZE = 1024 * 1024   # bytes read at once while hashing a source file
+
 def parse_time(time_str):
     """Parse time in HH:MM:SS or seconds format."""
     if ':' in time_str:
@@ -16,36 +47,197 @@ def parse_time(time_str):
     else:
         return datetime.strptime(time_str, "%S").time()
 
+def to_seconds(time) -> int:
+    """Convert a parsed time to seconds."""
+    return time.hour * 3600 + time.minute * 60 + time.second
+
+def file_hash(path, previous=None) -> str:
+    """
+    Get the sha256 hash of a file. The hash of the previous run is reused
+    if the size and modification time of the file have not changed.
+    - previous: the manifest entry of the previous run, or None
+    """
+    stat = os.stat(path)
+
+    if previous is not None and previous.get('source_size') == stat.st_size and previous.get('source_mtime') == stat.st_mtime:
+        return previous['source_hash']
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+def can_stream_copy(path, start_seconds) -> bool:
+    """
+    Check if a clip can be cut without encoding: the source must already have the format of the clips
+    and a keyframe must lie at the start of the cut.
+    """
+    probe = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'stream=codec_name,width,height', '-of', 'json', path],
+        capture_output=True, text=True
+    )
+    if probe.returncode != 0:
+        return False
+
+    streams = json.loads(probe.stdout).get('streams', [])
+    if not streams or streams[0].get('codec_name') != 'h264' or (streams[0].get('width'), streams[0].get('height')) != (CLIP_WIDTH, CLIP_HEIGHT):
+        return False
+
+    # list the keyframes around the start of the cut
+    interval = f'{max(0, start_seconds - 1)}%{start_seconds + 1}'
+    probe = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-skip_frame', 'nokey', '-read_intervals', interval,
+         '-show_entries', 'frame=best_effort_timestamp_time', '-of', 'csv=p=0', path],
+        capture_output=True, text=True
+    )
+    if probe.returncode != 0:
+        return False
+
+    keyframes = [float(line) for line in probe.stdout.split() if line.strip() not in ('', 'N/A')]
+
+    return any(abs(keyframe - start_seconds) <= KEYFRAME_TOLERANCE for keyframe in keyframes)
+
+def streaming_path(filename) -> str:
+    """Get the path of the fragmented copy of a clip."""
+    return f'{path_clips}/{filename}.frag.mp4'
+
+def make_streaming_variant(filename) -> bool:
+    """
+    Write the fragmented copy of a clip. The streams are copied, so this only takes a moment.
+
+    returns True on success
+    """
+    result = subprocess.run(
+        ['ffmpeg', '-v', 'error', '-i', f'{path_clips}/{filename}.mp4', '-c', 'copy'] + FRAGMENT_ARGS + ['-y', streaming_path(filename)],
+        capture_output=True, text=True
+    )
+
+    if result.returncode != 0:
+        print(f"Warning: could not write the streaming variant of {filename}: {result.stderr.strip()}")
+        return False
+
+    return True
+
+def split_clip(filename, video_start, video_end, previous=None, force=False, allow_copy=False, threads=1):
+    """
+    Cut a single clip, unless the manifest shows that it is up to date.
+    Runs in a worker process.
+    - filename: the filename of the video without extension
+    - video_start, video_end: the cut as stored in the database
+    - previous: the manifest entry of the previous run, or None
+    - force: if True, encode the clip even if it is up to date
+    - allow_copy: if True, copy the streams if the cut starts on a keyframe
+    - threads: number of threads of the ffmpeg encoder
+
+    returns ```(filename, action, entry)```, action is 'skipped', 'copied', 'encoded' or 'failed'
+    """
+    source_path = f'{path_original}/{filename}.mp4'
+    clip_path = f'{path_clips}/{filename}.mp4'
+
+    if not os.path.isfile(source_path):
+        return filename, 'failed', previous
+
+    stat = os.stat(source_path)
+    entry = {
+        'source_hash': file_hash(source_path, previous),
+        'source_size': stat.st_size,
+        'source_mtime': stat.st_mtime,
+        'video_start': video_start,
+        'video_end': video_end,
+        'encode_args': ENCODE_ARGS,
+    }
+
+    up_to_date = previous is not None and os.path.isfile(clip_path) and all(previous.get(key) == entry[key] for key in ['source_hash', 'video_start', 'video_end', 'encode_args'])
+
+    if up_to_date and not force:
+        if not os.path.isfile(streaming_path(filename)):
+            make_streaming_variant(filename)
+        return filename, 'skipped', previous
+
+    # parse the time strings
+    start = parse_time(video_start)
+    end = parse_time(video_end)
+
+    if allow_copy and can_stream_copy(source_path, to_seconds(start)):
+        # seek on the input to the keyframe and copy the streams from there
+        action = 'copied'
+        duration = to_seconds(end) - to_seconds(start)
+        command = ['ffmpeg', '-v', 'error', '-ss', str(start), '-i', source_path, '-t', str(duration), '-c', 'copy', '-movflags', '+faststart', '-y', clip_path]
+    else:
+        action = 'encoded'
+        command = ['ffmpeg', '-v', 'error', '-i', source_path, '-ss', str(start), '-to', str(end)] + ENCODE_ARGS + ['-threads', str(threads), '-y', clip_path]
+
+    result = subprocess.run(command, capture_output=True, text=True)
+
+    if result.returncode != 0:
+        print(f"Warning: ffmpeg failed for {filename}: {result.stderr.strip()}")
+        return filename, 'failed', previous
+
+    make_streaming_variant(filename)
+
+    entry['mode'] = action
+    return filename, action, entry
+
+def load_manifest(path=path_manifest) -> dict:
+    if not os.path.isfile(path):
+        return {}
+
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_manifest(manifest, path=path_manifest):
+    # write to a temporary file first, so an interrupted run does not leave a broken manifest
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(f'{path}.tmp', path)
+
 if __name__ == '__main__':
 
-    # connect to the database
-    engine, session = connect_db()
+    # get launch arguments
+    arguments = sys.argv[1:]
+
+    force = '-f' in arguments
+    allow_copy = '-c' in arguments
+    workers = int(arguments[arguments.index('-w') + 1]) if '-w' in arguments else (os.cpu_count() or 1)
+
+    # ffmpeg threads per job, so that all jobs together use the available cores
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    # get all videos from the database, in the order of their ids
+    with session_scope() as session:
+        videos = session.query(Video).order_by(Video.id).all()
 
-    # get all videos from the database
-    videos = session.query(Video).all()
-    
     # create the folders if they do not exist
-    if not os.path.exists(f'videos/clips'):
-        os.makedirs(f'videos/clips')
+    if not os.path.exists(path_clips):
+        os.makedirs(path_clips)
+
+    manifest = load_manifest()
+
+    # videos with a start and end of 0 are shown without a clip
+    videos = [video for video in videos if not (video.video_start == '0' and video.video_end == '0')]
+
+    print(f"Splitting {len(videos)} videos with {workers} workers...")
 
-    print(f"Splitting {len(videos)} videos...")
+    start_time = time.perf_counter()
+    counts = {'skipped': 0, 'copied': 0, 'encoded': 0, 'failed': 0}
 
-    for video in tqdm(videos):
-        video_path = f'./videos/original/{video.filename}.mp4'
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(split_clip, video.filename, video.video_start, video.video_end, manifest.get(video.filename), force, allow_copy, threads)
+            for video in videos
+        ]
 
-        # parse the time strings
-        video_start = parse_time(video.video_start)
-        video_end = parse_time(video.video_end)
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            filename, action, entry = future.result()
+            counts[action] += 1
 
-        # extract the clip
-        if not (video.video_start == '0' and video.video_end == '0'):
+            if entry is not None:
+                manifest[filename] = entry
+                save_manifest(manifest)
 
-            command = (
-                f"ffmpeg -i {video_path} -ss {video_start} -to {video_end} "
-                f"-c:v libx264 -c:a aac -b:v 2500k -b:a 192k -vf scale=1280:720 -profile:v main -y "
-                f"videos/clips/{video.filename}.mp4"
-            )
+    elapsed = time.perf_counter() - start_time
 
-            os.system(command)
-    
-    print("Done!")
\ No newline at end of file
+    print(f"Encoded {counts['encoded']}, copied {counts['copied']}, skipped {counts['skipped']}, failed {counts['failed']} in {elapsed:.1f}s")
+    print("Done!")
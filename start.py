@@ -2,16 +2,20 @@ import sys
 import subprocess
 import threading
 
-def launch_mobile_host(n_hosts):
-    cmd = f"python -m src.client.controller {n_hosts}"
+def launch_mobile_host(n_hosts, rooms=''):
+    cmd = f"python -m src.client.controller {n_hosts} {rooms}"
     subprocess.run(cmd, shell=True)
 
-def launch_server(n_hosts):
-    cmd = f"python -m src.server.server {n_hosts} -r"
+def launch_server(n_hosts, start='-r', rooms=''):
+    cmd = f"python -m src.server.server {n_hosts} {start} {rooms}"
     subprocess.run(cmd, shell=True)
 
-def launch_monitor(n_hosts):
-    cmd = f"python -m src.monitor.monitor {n_hosts}"
+def launch_monitor(n_hosts, rooms=''):
+    cmd = f"python -m src.monitor.monitor {n_hosts} {rooms}"
+    subprocess.run(cmd, shell=True)
+
+def launch_allinone(n_hosts, start='-r', rooms=''):
+    cmd = f"python -m src.allinone {n_hosts} {start} {rooms}"
     subprocess.run(cmd, shell=True)
 
 if __name__ == '__main__':
@@ -19,23 +23,36 @@ if __name__ == '__main__':
     arguments = sys.argv[1:]
 
     if len(arguments) < 1:
-        print('Usage: python -m src.client.controller <number of hosts>')
+        print('Usage: python start.py <number of hosts> [-a] [-w] [--rooms <room,room,...>]')
+        print('       -a: run everything in one process, without RabbitMQ')
+        print('       -w: continue the last game instead of starting a new one')
+        print('       --rooms: run an independent game with <number of hosts> teams in every room')
         sys.exit(1)
     
     n_hosts = int(arguments[0])
 
+    # a new game resets the points, a warm restart continues from the journal
+    start = '-w' if '-w' in arguments else '-r'
+
+    # the rooms are handed to every component
+    rooms = f"--rooms {arguments[arguments.index('--rooms') + 1]}" if '--rooms' in arguments else ''
+
+    if '-a' in arguments:
+        launch_allinone(n_hosts, start, rooms)
+        sys.exit(0)
+
     # collect threads
     threads = []
 
-    thread_server = threading.Thread(target=launch_server, args=(n_hosts,))
+    thread_server = threading.Thread(target=launch_server, args=(n_hosts, start, rooms))
     thread_server.start()
     threads.append(thread_server)
 
-    thread_clients = threading.Thread(target=launch_mobile_host, args=(n_hosts,))
+    thread_clients = threading.Thread(target=launch_mobile_host, args=(n_hosts, rooms))
     thread_clients.start()
     threads.append(thread_clients)
 
-    thread_monitor = threading.Thread(target=launch_monitor, args=(n_hosts,))
+    thread_monitor = threading.Thread(target=launch_monitor, args=(n_hosts, rooms))
     thread_monitor.start()
     threads.append(thread_monitor)
 
@@ -0,0 +1,44 @@
+import pytest
+
+from src.db import build as db
+from src.db import journal
+from src.db.model import Team, Video
+
+VIDEO_YEAR = 1984   # the year of the video of the game fixture
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """
+    An empty game database in a temporary sqlite file, with fresh caches and no open journals.
+    """
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path}/game.db")
+    monkeypatch.setattr(db, '_caches', {})
+    monkeypatch.setattr(journal, '_journals', {})
+    db.dispose_engine()
+
+    db.build()
+
+    yield
+
+    db.dispose_engine()
+
+@pytest.fixture
+def game(database):
+    """
+    A round in the 'hide' phase with two teams and a video from VIDEO_YEAR.
+
+    returns the id of the video
+    """
+    with db.session_scope() as session:
+        session.add_all([Team(name='Team 1', points=0), Team(name='Team 2', points=0)])
+
+        video = Video(title='Song', author='Band', link='https://example.com/song', filename='song', video_start='0', video_end='10',
+                      question_1='In welchem Jahr?', answer_1=str(VIDEO_YEAR), question_2='-', answer_2='-')
+        session.add(video)
+        session.flush()
+        video_id = video.id
+
+    db.set_video_id(video_id)
+    db.set_phase('hide')
+
+    return video_id
@@ -0,0 +1,109 @@
+import sys
+
+from sqlalchemy import insert
+
+from src.db.build import session_scope
+from src.db.model import Video, Round
+from src.videos.downloader import download_video, download_all, read_entries, sync_catalogue
+
+ROWS = [
+    'Wann erschien dieses Lied?;Wham;Last Christmas;1984;;;https://example.com/wham;02:05;02:40',
+    'In welchem Jahr startete diese Serie?;Tatort;Tatort;1970;Welche Stadt?;Duisburg;https://example.com/tatort;2;32',
+    'Wann erschien dieses Lied?;Nena;99 Luftballons;1983;;;https://example.com/nena;0;30',
+]
+
+# a stand-in for yt-dlp that writes the file given with -o
+FAKE_YTDLP = """
+import sys
+with open(sys.argv[sys.argv.index('-o') + 1] + '.mp4', 'wb') as f:
+    f.write(b'video')
+"""
+
+def entry(filename):
+    return {'filename': filename, 'link': f'https://example.com/{filename}'}
+
+def test_download_with_a_fake_command(tmp_path):
+    script = tmp_path / 'yt-dlp.py'
+    script.write_text(FAKE_YTDLP)
+    directory = tmp_path / 'videos'
+
+    report = download_all([entry('song')], workers=1, command=f'{sys.executable} {script}', directory=str(directory))
+
+    assert report == {'downloaded': 1, 'skipped': 0, 'failed': []}
+    assert (directory / 'song.mp4').read_bytes() == b'video'
+
+def test_download_with_a_failing_command(tmp_path):
+    command = f'{sys.executable} -c "import sys; sys.exit(1)"'
+
+    report = download_all([entry('song')], workers=1, command=command, directory=str(tmp_path), retries=2, backoff=0)
+
+    assert report['failed'] == ['song']
+
+def test_download_with_a_missing_command(tmp_path):
+    report = download_all([entry('song')], workers=1, command=str(tmp_path / 'missing-yt-dlp'), directory=str(tmp_path), retries=2, backoff=0)
+
+    assert report['failed'] == ['song']
+
+def test_download_without_attempts(tmp_path):
+    assert not download_video('https://example.com/song', 'song', command='yt-dlp', directory=str(tmp_path), retries=0)
+
+def read_rows(tmp_path, rows):
+    path = tmp_path / 'videos.csv'
+    path.write_text('\n'.join(rows) + '\n', encoding='utf-8')
+
+    return read_entries(str(path))
+
+def sync(tmp_path, rows):
+    return sync_catalogue(read_rows(tmp_path, rows))
+
+def video_ids():
+    with session_scope() as session:
+        return {link: video_id for video_id, link in session.query(Video.id, Video.link)}
+
+def test_sync_again_writes_nothing(database, tmp_path):
+    assert len(sync(tmp_path, ROWS)['added']) == 3
+
+    report = sync(tmp_path, ROWS)
+
+    assert (report['added'], report['changed'], report['removed'], report['unchanged']) == ([], [], [], 3)
+
+def test_sync_keeps_the_ids_of_moved_rows(database, tmp_path):
+    sync(tmp_path, ROWS)
+    before = video_ids()
+
+    new_row = 'Wann erschien dieses Lied?;Band;New Song;2001;;;https://example.com/new;0;10'
+    report = sync(tmp_path, [ROWS[2], new_row, ROWS[0], ROWS[1]])
+
+    assert len(report['added']) == 1
+    assert report['changed'] == []
+
+    after = video_ids()
+
+    assert {link: after[link] for link in before} == before
+    assert after['https://example.com/new'] > max(before.values())
+
+def test_sync_keeps_removed_videos_that_were_played(database, tmp_path):
+    sync(tmp_path, ROWS)
+    played, unused = video_ids()['https://example.com/wham'], video_ids()['https://example.com/tatort']
+
+    with session_scope() as session:
+        session.add(Round(video_id=played))
+
+    report = sync(tmp_path, ROWS[2:])
+
+    assert report['removed'] == [unused]
+    assert report['kept'] == [played]
+    assert set(video_ids()) == {'https://example.com/wham', 'https://example.com/nena'}
+
+def test_sync_removes_duplicate_videos(database, tmp_path):
+    entries = read_rows(tmp_path, ROWS)
+
+    # an earlier import added every video twice
+    with session_scope() as session:
+        session.execute(insert(Video), [dict(entry) for entry in entries] + [dict(entry) for entry in entries])
+
+    report = sync(tmp_path, ROWS)
+
+    assert report['removed'] == [4, 5, 6]
+    assert report['unchanged'] == 3
+    assert sorted(video_ids().values()) == [1, 2, 3]
@@ -0,0 +1,102 @@
+import json
+
+import pytest
+
+from src.db import journal
+from src.db.build import session_scope, set_phase
+from src.db.model import State, Round, Answer, RevealedYear, Team
+from src.db.journal import Journal, empty_state, restore_state
+
+def event(kind, **fields):
+    return json.dumps({'event': kind, 't': 0, **fields}) + '\n'
+
+def test_load_removes_a_cut_off_event(tmp_path):
+    path = tmp_path / 'game.journal'
+    complete = event('phase', phase='show') + event('year', year=1984, round_id=1)
+    path.write_text(complete + '{"event":"phase","ph')
+
+    journal = Journal(str(path))
+
+    assert journal.load() == 2
+    assert journal.state['phase'] == 'show'
+    assert journal.state['years'] == [[1984, 1]]
+    assert path.read_text() == complete
+
+def test_load_reads_the_snapshot_and_the_events_after_it(tmp_path):
+    path = str(tmp_path / 'game.journal')
+
+    written = Journal(path)
+    written.load()
+    written.append([json.loads(event('phase', phase='show')), json.loads(event('team', team='Team 1'))])
+    written.snapshot()
+    written.append([json.loads(event('answer', team='Team 1', round_id=None, answer_1='1984', answer_2='', correct_1='perfect', points=20))])
+
+    loaded = Journal(path)
+
+    assert loaded.load() == 1
+    assert loaded.state == written.state
+    assert loaded.state['teams'] == {'Team 1': 20}
+
+def test_load_ignores_a_snapshot_of_another_journal(tmp_path):
+    path = tmp_path / 'game.journal'
+    path.write_text(event('phase', phase='hide'))
+
+    state = dict(empty_state(), phase='show')
+    (tmp_path / 'game.journal.snapshot').write_text(json.dumps({'offset': 10 ** 6, 'state': state}))
+
+    journal = Journal(str(path))
+
+    assert journal.load() == 1
+    assert journal.state['phase'] == 'hide'
+
+def test_committed_events_are_written(database, tmp_path):
+    path = tmp_path / 'game.journal'
+    journal.open_journal(path=str(path))
+
+    set_phase('hide')
+
+    assert journal.get_journal().state['phase'] == 'hide'
+    assert json.loads(path.read_text())['event'] == 'phase'
+
+def test_rolled_back_events_are_dropped(database, tmp_path):
+    path = tmp_path / 'game.journal'
+    journal.open_journal(path=str(path))
+
+    with pytest.raises(RuntimeError):
+        with session_scope() as session:
+            journal.journal_event(session, 'phase', phase='hide')
+            raise RuntimeError("the change fails")
+
+    assert journal.get_journal().state['phase'] is None
+    assert path.read_text() == ''
+
+    # the events of the rolled back session are not written by the next commit
+    set_phase('show')
+
+    assert [json.loads(line)['phase'] for line in path.read_text().splitlines()] == ['show']
+
+def test_restore_gives_missing_rounds_new_ids(database):
+    state = dict(
+        empty_state(),
+        phase='show',
+        round_id=41,
+        years=[[1970, 40], [1984, 41]],
+        teams={'Team 1': 30, 'Team 2': 0},
+        answers={'Team 1': {'answer_1': '1984', 'answer_2': 'Band', 'correct_1': 'perfect', 'correct_2': 'correct'}},
+    )
+
+    with session_scope() as session:
+        restore_state(session, state)
+
+    with session_scope() as session:
+        round_ids = {round_id for (round_id,) in session.query(Round.id)}
+        current_round_id = session.query(State.round_id).scalar()
+        years = dict(session.query(RevealedYear.year, RevealedYear.round_id))
+        answers = session.query(Team.name, Answer.round_id, Answer.answer_1).join(Answer, Answer.team_id == Team.id).all()
+        teams = dict(session.query(Team.name, Team.points))
+
+    assert round_ids == {current_round_id, years[1970]}
+    assert years[1984] == current_round_id
+    assert years[1970] != current_round_id
+    assert answers == [('Team 1', current_round_id, '1984')]
+    assert teams == {'Team 1': 30, 'Team 2': 0}
@@ -0,0 +1,76 @@
+from src.server.scoring import YearIndex, Leaderboard, parse_answer_year, MIN_YEAR, MAX_YEAR
+
+def test_parse_answer_year():
+    assert parse_answer_year('ca. 1984!') == 1984
+    assert parse_answer_year('') is None
+    assert parse_answer_year(None) is None
+
+def test_neighbours_without_years():
+    assert YearIndex().neighbours(1984) == (MIN_YEAR, MAX_YEAR)
+
+def test_neighbours_at_the_boundaries():
+    years = YearIndex([1970, 1984, 2000])
+
+    assert years.neighbours(1960) == (MIN_YEAR, 1970)
+    assert years.neighbours(1970) == (MIN_YEAR, 1984)
+    assert years.neighbours(1984) == (1970, 2000)
+    assert years.neighbours(2000) == (1984, MAX_YEAR)
+    assert years.neighbours(2019) == (2000, MAX_YEAR)
+
+def test_add_keeps_the_years_sorted():
+    years = YearIndex([2000, 1970])
+
+    assert years.add(1984)
+    assert not years.add(1970)
+    assert list(years) == [1970, 1984, 2000]
+
+def test_grade_batch():
+    years = YearIndex([1970, 2000])
+
+    grades = years.grade_batch([1984, 1971, 1999, 1970, 2000, None], 1984)
+
+    assert grades == ['perfect', 'correct', 'correct', 'incorrect', 'incorrect', 'incorrect']
+
+def test_grade_without_a_smaller_year():
+    years = YearIndex([1990])
+
+    assert years.grade(MIN_YEAR + 1, 1965) == 'correct'
+    assert years.grade(MIN_YEAR, 1965) == 'incorrect'
+
+def test_ties_share_a_rank():
+    leaderboard = Leaderboard({'Team 1': 10, 'Team 2': 30, 'Team 3': 10, 'Team 4': 0})
+
+    assert [leaderboard.rank(name) for name in ['Team 2', 'Team 1', 'Team 3', 'Team 4']] == [1, 2, 2, 4]
+
+def test_ties_are_ordered_by_name_with_numbers_in_order():
+    leaderboard = Leaderboard({'Team 10': 10, 'Team 9': 10, 'Team 1': 10})
+
+    assert [name for name, points, rank, rank_delta in leaderboard.top(3)] == ['Team 1', 'Team 9', 'Team 10']
+
+def test_rank_after_add():
+    leaderboard = Leaderboard({'Team 1': 10, 'Team 2': 20})
+
+    leaderboard.add('Team 1', 20)
+    leaderboard.add('Team 3', 0)
+
+    assert leaderboard.rank('Team 1') == 1
+    assert leaderboard.rank('Team 2') == 2
+    assert leaderboard.rank('Team 3') == 3
+    assert leaderboard.rank('Team 4') is None
+    assert len(leaderboard) == 3
+
+def test_rank_delta_since_the_round_started():
+    leaderboard = Leaderboard({'Team 1': 10, 'Team 2': 20})
+    leaderboard.start_round()
+
+    leaderboard.add('Team 1', 20)
+
+    assert leaderboard.rank_delta('Team 1') == 1
+    assert leaderboard.rank_delta('Team 2') == -1
+
+def test_top_k():
+    leaderboard = Leaderboard({f'Team {i}': i * 10 for i in range(1, 6)})
+
+    assert leaderboard.top(2) == [('Team 5', 50, 1, 0), ('Team 4', 40, 2, 0)]
+    assert len(leaderboard.top(10)) == 5
+    assert leaderboard.top(0) == []
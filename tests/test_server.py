@@ -0,0 +1,31 @@
+from src.db import build as db
+from src.db import journal
+from src.db.model import Team
+from src.server import server
+from conftest import VIDEO_YEAR
+
+def open_journal(tmp_path):
+    journal.open_journal(path=str(tmp_path / 'game.journal'))
+
+def team_points(team_name):
+    with db.session_scope() as session:
+        return session.query(Team.points).filter_by(name=team_name).scalar()
+
+def test_two_answers_of_a_team_in_one_batch(game, tmp_path):
+    open_journal(tmp_path)
+    body = f"Team 1§{VIDEO_YEAR}§Song".encode()
+
+    server.score_messages([(body, False), (body, False)])
+
+    points = team_points('Team 1')
+
+    assert points == 2 * server.POINTS_ON_PERFECT_ANSWER_1
+    assert db.get_cache().leaderboard.points['Team 1'] == points
+    assert journal.get_journal().state['teams']['Team 1'] == points
+
+def test_teams_without_answers_are_journaled(game, tmp_path):
+    open_journal(tmp_path)
+
+    server.journal_known_teams()
+
+    assert set(journal.get_journal().state['teams']) == {'Team 1', 'Team 2'}